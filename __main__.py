@@ -1,7 +1,19 @@
 import os
 import re
 
-from legal_data_clustering.pipeline.cd_cluster import cd_cluster, cd_cluster_prepare
+from legal_data_clustering.pipeline.cd_cluster import (
+    cd_cluster,
+    cd_cluster_input_paths,
+    cd_cluster_link_artifacts,
+    cd_cluster_prepare,
+    cd_cluster_sweep,
+    cd_cluster_sweep_input_paths,
+    get_sweep_items,
+)
+from legal_data_clustering.pipeline.cd_cluster_evolution_flows import (
+    cd_cluster_evolution_flows,
+    cd_cluster_evolution_flows_prepare,
+)
 from legal_data_clustering.pipeline.cd_cluster_evolution_graph import (
     cd_cluster_evolution_graph,
     cd_cluster_evolution_graph_prepare,
@@ -13,6 +25,8 @@ from legal_data_clustering.pipeline.cd_cluster_evolution_inspection import (
 from legal_data_clustering.pipeline.cd_cluster_evolution_mappings import (
     cd_cluster_evolution_mappings,
     cd_cluster_evolution_mappings_prepare,
+    cd_cluster_evolution_snapshot_mappings,
+    cd_cluster_evolution_snapshot_mappings_prepare,
 )
 from legal_data_clustering.pipeline.cd_cluster_inspection import (
     cd_cluster_inspection,
@@ -24,11 +38,24 @@ from legal_data_clustering.pipeline.cd_cluster_texts import (
 )
 from legal_data_clustering.pipeline.cd_preprocessing import (
     cd_preprocessing,
+    cd_preprocessing_input_paths,
+    cd_preprocessing_link_artifacts,
     cd_preprocessing_prepare,
     get_decision_network,
 )
 from legal_data_clustering.pipeline.main_parser import get_parser
 from legal_data_clustering.utils.config_handling import process_items
+from legal_data_clustering.utils.cpu_budget import configure_cpu_budget, get_cpu_budget
+from legal_data_clustering.utils.execution import configure_execution
+from legal_data_clustering.utils.executors import (
+    configure_executor,
+    get_broker,
+    run_file_queue_worker,
+    run_task_queue_worker,
+)
+from legal_data_clustering.utils.instrumentation import configure_instrumentation
+from legal_data_clustering.utils.prefetch import configure_prefetch
+from legal_data_clustering.utils.progress import configure_progress
 from legal_data_clustering.utils.statics import (
     ALL_YEARS,
     ALL_YEARS_REG,
@@ -39,6 +66,7 @@ from legal_data_clustering.utils.statics import (
     DE_CD_CLUSTER_PATH,
     DE_CD_CLUSTER_TEXTS_PATH,
     DE_CD_PREPROCESSED_GRAPH_PATH,
+    DE_CD_SNAPSHOT_INDEX_PATH,
     DE_CROSSREFERENCE_GRAPH_PATH,
     DE_DECISIONS_NETWORK,
     DE_REFERENCE_PARSED_PATH,
@@ -49,10 +77,13 @@ from legal_data_clustering.utils.statics import (
     DE_REG_CD_CLUSTER_PATH,
     DE_REG_CD_CLUSTER_TEXTS_PATH,
     DE_REG_CD_PREPROCESSED_GRAPH_PATH,
+    DE_REG_CD_SNAPSHOT_INDEX_PATH,
     DE_REG_CROSSREFERENCE_GRAPH_PATH,
     DE_REG_REFERENCE_PARSED_PATH,
     DE_REG_SNAPSHOT_MAPPING_EDGELIST_PATH,
+    DE_REG_TEMP_DATA_PATH,
     DE_SNAPSHOT_MAPPING_EDGELIST_PATH,
+    DE_TEMP_DATA_PATH,
     US_CD_CLUSTER_EVOLUTION_INSPECTION_PATH,
     US_CD_CLUSTER_EVOLUTION_MAPPINGS_PATH,
     US_CD_CLUSTER_EVOLUTION_PATH,
@@ -60,6 +91,7 @@ from legal_data_clustering.utils.statics import (
     US_CD_CLUSTER_PATH,
     US_CD_CLUSTER_TEXTS_PATH,
     US_CD_PREPROCESSED_GRAPH_PATH,
+    US_CD_SNAPSHOT_INDEX_PATH,
     US_CROSSREFERENCE_GRAPH_PATH,
     US_REFERENCE_PARSED_PATH,
     US_REG_CD_CLUSTER_EVOLUTION_INSPECTION_PATH,
@@ -69,10 +101,13 @@ from legal_data_clustering.utils.statics import (
     US_REG_CD_CLUSTER_PATH,
     US_REG_CD_CLUSTER_TEXTS_PATH,
     US_REG_CD_PREPROCESSED_GRAPH_PATH,
+    US_REG_CD_SNAPSHOT_INDEX_PATH,
     US_REG_CROSSREFERENCE_GRAPH_PATH,
     US_REG_REFERENCE_PARSED_PATH,
     US_REG_SNAPSHOT_MAPPING_EDGELIST_PATH,
+    US_REG_TEMP_DATA_PATH,
     US_SNAPSHOT_MAPPING_EDGELIST_PATH,
+    US_TEMP_DATA_PATH,
 )
 
 if __name__ == "__main__":
@@ -84,6 +119,25 @@ if __name__ == "__main__":
     overwrite = args.overwrite
     snapshots = args.snapshots
     regulations = args.regulations
+    evolution_graph_formats = args.evolution_graph_formats
+    inspection_memory_limit = (
+        args.inspection_memory_limit * 1024**2 if args.inspection_memory_limit else None
+    )
+    flow_pairs = (
+        [tuple(pair.split("-")) for pair in args.flow_pairs]
+        if args.flow_pairs
+        else None
+    )
+    flows_memory_limit = (
+        args.flows_memory_limit * 1024**2 if args.flows_memory_limit else None
+    )
+    report_page_size = args.report_page_size or None
+    report_gzip = args.report_gzip
+    inspection_formats = args.inspection_formats
+    configure_instrumentation(args.run_log, args.profile_folder)
+    configure_progress(args.status_file, args.progress_interval)
+    configure_prefetch(args.prefetch)
+    configure_cpu_budget(args.cpus)
     assert args.seeds > 0
     cluster_mapping_configs = dict(
         pp_ratios=args.pp_ratios,
@@ -101,6 +155,26 @@ if __name__ == "__main__":
     if dataset not in ["de", "us"]:
         raise Exception(f"{dataset} unsupported dataset. Options: us, de")
 
+    if dataset == "de":
+        temp_data_path = DE_REG_TEMP_DATA_PATH if regulations else DE_TEMP_DATA_PATH
+    elif dataset == "us":
+        temp_data_path = US_REG_TEMP_DATA_PATH if regulations else US_TEMP_DATA_PATH
+    configure_execution(
+        failures_path=(
+            args.failures_manifest or os.path.join(temp_data_path, "failures.jsonl")
+        ),
+        checkpoint_path=os.path.join(temp_data_path, "checkpoints.jsonl"),
+        retries=args.retries,
+        resume=args.resume,
+    )
+    queue_folder = args.queue_folder or os.path.join(temp_data_path, "queue")
+    configure_executor(
+        args.executor,
+        queue_folder=queue_folder,
+        broker_url=args.broker_url,
+        local_workers=args.local_workers,
+    )
+
     if "all" in snapshots or "all-new-years" in snapshots:
         if dataset == "us":
             snapshots = [
@@ -108,7 +182,7 @@ if __name__ == "__main__":
             ]
         elif dataset == "de":
             snapshots = [
-                 f"{year}-12-31" if "all" in snapshots else f"{year}-01-01"
+                f"{year}-12-31" if "all" in snapshots else f"{year}-01-01"
                 for year in (ALL_YEARS_REG if regulations else ALL_YEARS)
             ]
 
@@ -131,6 +205,27 @@ if __name__ == "__main__":
             "cluster_inspection",
             "cluster_evolution_inspection",
         ]
+        # With the default stride the flows are the edges of the evolution graph
+        if args.flow_stride > 1 or flow_pairs:
+            steps.insert(
+                steps.index("cluster_evolution_graph") + 1, "cluster_evolution_flows"
+            )
+
+    if "worker" in steps:
+        # Process tasks of steps started with the same executor args on another
+        # machine
+        worker_idle_timeout = args.worker_idle_timeout or None
+        if args.executor == "file-queue":
+            run_file_queue_worker(queue_folder, idle_timeout=worker_idle_timeout)
+        elif args.executor == "task-queue" and args.broker_url != "local":
+            run_task_queue_worker(
+                get_broker(args.broker_url), idle_timeout=worker_idle_timeout
+            )
+        else:
+            raise Exception(
+                "The worker step requires --executor file-queue or task-queue with "
+                "a --broker-url"
+            )
 
     if "preprocess" in steps:
         if dataset == "de":
@@ -158,7 +253,7 @@ if __name__ == "__main__":
             )
             decision_network_path = None
 
-        items = cd_preprocessing_prepare(
+        items, aliases = cd_preprocessing_prepare(
             overwrite,
             snapshots,
             cluster_mapping_configs,
@@ -180,7 +275,9 @@ if __name__ == "__main__":
             use_multiprocessing=use_multiprocessing,
             args=(source_folder, target_folder, decision_network_path),
             processes=4,
+            input_paths=cd_preprocessing_input_paths,
         )
+        cd_preprocessing_link_artifacts(logs, aliases, target_folder)
 
     if "cluster" in steps:
         if dataset == "de":
@@ -202,7 +299,7 @@ if __name__ == "__main__":
                 US_REG_CD_CLUSTER_PATH if regulations else US_CD_CLUSTER_PATH
             )
 
-        items = cd_cluster_prepare(
+        items, aliases = cd_cluster_prepare(
             overwrite,
             snapshots,
             cluster_mapping_configs,
@@ -210,12 +307,22 @@ if __name__ == "__main__":
             target_folder,
         )
         logs = process_items(
-            items,
+            get_sweep_items(items) if args.sweep else items,
             [],
-            action_method=cd_cluster,
+            action_method=cd_cluster_sweep if args.sweep else cd_cluster,
             use_multiprocessing=use_multiprocessing,
-            args=(source_folder, target_folder),
+            args=(
+                source_folder,
+                target_folder,
+                args.consensus_tolerance,
+                args.consensus_batch_size,
+                args.cluster_formats,
+            ),
+            input_paths=(
+                cd_cluster_sweep_input_paths if args.sweep else cd_cluster_input_paths
+            ),
         )
+        cd_cluster_link_artifacts(aliases, target_folder)
 
     if "cluster_texts" in steps:
         if dataset == "de":
@@ -289,6 +396,11 @@ if __name__ == "__main__":
                 if regulations
                 else DE_CD_CLUSTER_EVOLUTION_MAPPINGS_PATH
             )
+            snaphot_mapping_folder = (
+                DE_REG_SNAPSHOT_MAPPING_EDGELIST_PATH
+                if regulations
+                else DE_SNAPSHOT_MAPPING_EDGELIST_PATH
+            ) + "/subseqitems"
         elif dataset == "us":
             source_folder = (
                 US_REG_CROSSREFERENCE_GRAPH_PATH
@@ -305,6 +417,11 @@ if __name__ == "__main__":
                 if regulations
                 else US_CD_CLUSTER_EVOLUTION_MAPPINGS_PATH
             )
+            snaphot_mapping_folder = (
+                US_REG_SNAPSHOT_MAPPING_EDGELIST_PATH
+                if regulations
+                else US_SNAPSHOT_MAPPING_EDGELIST_PATH
+            ) + "/subseqitems"
 
         items = cd_cluster_evolution_mappings_prepare(
             overwrite,
@@ -322,6 +439,22 @@ if __name__ == "__main__":
             processes=2,
         )
 
+        items = cd_cluster_evolution_snapshot_mappings_prepare(
+            overwrite,
+            source_folder,
+            snaphot_mapping_folder,
+            target_folder,
+            snapshots,
+        )
+        process_items(
+            items,
+            [],
+            action_method=cd_cluster_evolution_snapshot_mappings,
+            use_multiprocessing=use_multiprocessing,
+            args=(source_folder, snaphot_mapping_folder, target_folder),
+            processes=2,
+        )
+
     if "cluster_evolution_graph" in steps:
 
         if dataset == "de":
@@ -370,6 +503,12 @@ if __name__ == "__main__":
             snaphot_mapping_folder,
             subseqitem_mapping_folder,
             target_folder,
+            evolution_graph_formats,
+            args.evolution_graph_append,
+        )
+        # A single config runs its snapshots and snapshot pairs in parallel instead
+        config_processes = (
+            get_cpu_budget() if use_multiprocessing and len(items) == 1 else None
         )
         process_items(
             items,
@@ -382,6 +521,76 @@ if __name__ == "__main__":
                 subseqitem_mapping_folder,
                 target_folder,
                 regulations,
+                evolution_graph_formats,
+                config_processes,
+                args.evolution_graph_append and not overwrite,
+                args.family_threshold,
+                args.family_table_thresholds,
+                args.family_table_formats,
+            ),
+        )
+
+    if "cluster_evolution_flows" in steps:
+        if dataset == "de":
+            source_folder = (
+                DE_REG_CD_CLUSTER_PATH if regulations else DE_CD_CLUSTER_PATH
+            )
+            snaphot_mapping_folder = (
+                DE_REG_SNAPSHOT_MAPPING_EDGELIST_PATH
+                if regulations
+                else DE_SNAPSHOT_MAPPING_EDGELIST_PATH
+            ) + "/subseqitems"
+            subseqitem_mapping_folder = (
+                DE_REG_CD_CLUSTER_EVOLUTION_MAPPINGS_PATH
+                if regulations
+                else DE_CD_CLUSTER_EVOLUTION_MAPPINGS_PATH
+            )
+            target_folder = (
+                DE_REG_CD_CLUSTER_EVOLUTION_PATH
+                if regulations
+                else DE_CD_CLUSTER_EVOLUTION_PATH
+            )
+        elif dataset == "us":
+            source_folder = (
+                US_REG_CD_CLUSTER_PATH if regulations else US_CD_CLUSTER_PATH
+            )
+            snaphot_mapping_folder = (
+                US_REG_SNAPSHOT_MAPPING_EDGELIST_PATH
+                if regulations
+                else US_SNAPSHOT_MAPPING_EDGELIST_PATH
+            ) + "/subseqitems"
+            subseqitem_mapping_folder = (
+                US_REG_CD_CLUSTER_EVOLUTION_MAPPINGS_PATH
+                if regulations
+                else US_CD_CLUSTER_EVOLUTION_MAPPINGS_PATH
+            )
+            target_folder = (
+                US_REG_CD_CLUSTER_EVOLUTION_PATH
+                if regulations
+                else US_CD_CLUSTER_EVOLUTION_PATH
+            )
+
+        items = cd_cluster_evolution_flows_prepare(
+            overwrite,
+            cluster_mapping_configs,
+            source_folder,
+            target_folder,
+            args.flow_stride,
+            flow_pairs,
+        )
+        process_items(
+            items,
+            [],
+            action_method=cd_cluster_evolution_flows,
+            use_multiprocessing=use_multiprocessing,
+            args=(
+                source_folder,
+                snaphot_mapping_folder,
+                subseqitem_mapping_folder,
+                target_folder,
+                args.flow_stride,
+                flow_pairs,
+                flows_memory_limit,
             ),
         )
 
@@ -390,6 +599,19 @@ if __name__ == "__main__":
             source_folder = (
                 DE_REG_CD_CLUSTER_PATH if regulations else DE_CD_CLUSTER_PATH
             )
+            crossreference_graph_folder = os.path.join(
+                (
+                    DE_REG_CROSSREFERENCE_GRAPH_PATH
+                    if regulations
+                    else DE_CROSSREFERENCE_GRAPH_PATH
+                ),
+                "seqitems",
+            )
+            snapshot_index_folder = (
+                DE_REG_CD_SNAPSHOT_INDEX_PATH
+                if regulations
+                else DE_CD_SNAPSHOT_INDEX_PATH
+            )
             target_folder = (
                 DE_REG_CD_CLUSTER_INSPECTION_PATH
                 if regulations
@@ -399,6 +621,19 @@ if __name__ == "__main__":
             source_folder = (
                 US_REG_CD_CLUSTER_PATH if regulations else US_CD_CLUSTER_PATH
             )
+            crossreference_graph_folder = os.path.join(
+                (
+                    US_REG_CROSSREFERENCE_GRAPH_PATH
+                    if regulations
+                    else US_CROSSREFERENCE_GRAPH_PATH
+                ),
+                "seqitems",
+            )
+            snapshot_index_folder = (
+                US_REG_CD_SNAPSHOT_INDEX_PATH
+                if regulations
+                else US_CD_SNAPSHOT_INDEX_PATH
+            )
             target_folder = (
                 US_REG_CD_CLUSTER_INSPECTION_PATH
                 if regulations
@@ -411,13 +646,24 @@ if __name__ == "__main__":
             cluster_mapping_configs,
             source_folder,
             target_folder,
+            compress=report_gzip,
+            formats=inspection_formats,
         )
         logs = process_items(
             items,
             [],
             action_method=cd_cluster_inspection,
             use_multiprocessing=use_multiprocessing,
-            args=(dataset, source_folder, target_folder, regulations),
+            args=(
+                source_folder,
+                target_folder,
+                crossreference_graph_folder,
+                snapshot_index_folder,
+                inspection_memory_limit,
+                report_page_size,
+                report_gzip,
+                inspection_formats,
+            ),
         )
 
     if "cluster_evolution_inspection" in steps:
@@ -428,11 +674,18 @@ if __name__ == "__main__":
                 else DE_CD_CLUSTER_EVOLUTION_PATH
             )
             crossreference_graph_folder = os.path.join(
-                DE_REG_CROSSREFERENCE_GRAPH_PATH
-                if regulations
-                else DE_CROSSREFERENCE_GRAPH_PATH,
+                (
+                    DE_REG_CROSSREFERENCE_GRAPH_PATH
+                    if regulations
+                    else DE_CROSSREFERENCE_GRAPH_PATH
+                ),
                 "seqitems",
             )
+            snapshot_index_folder = (
+                DE_REG_CD_SNAPSHOT_INDEX_PATH
+                if regulations
+                else DE_CD_SNAPSHOT_INDEX_PATH
+            )
             target_folder = (
                 DE_REG_CD_CLUSTER_EVOLUTION_INSPECTION_PATH
                 if regulations
@@ -445,11 +698,18 @@ if __name__ == "__main__":
                 else US_CD_CLUSTER_EVOLUTION_PATH
             )
             crossreference_graph_folder = os.path.join(
-                US_REG_CROSSREFERENCE_GRAPH_PATH
-                if regulations
-                else US_CROSSREFERENCE_GRAPH_PATH,
+                (
+                    US_REG_CROSSREFERENCE_GRAPH_PATH
+                    if regulations
+                    else US_CROSSREFERENCE_GRAPH_PATH
+                ),
                 "seqitems",
             )
+            snapshot_index_folder = (
+                US_REG_CD_SNAPSHOT_INDEX_PATH
+                if regulations
+                else US_CD_SNAPSHOT_INDEX_PATH
+            )
             target_folder = (
                 US_REG_CD_CLUSTER_EVOLUTION_INSPECTION_PATH
                 if regulations
@@ -460,15 +720,25 @@ if __name__ == "__main__":
             overwrite,
             cluster_mapping_configs,
             source_folder,
-            crossreference_graph_folder,
             target_folder,
+            compress=report_gzip,
+            formats=inspection_formats,
         )
         logs = process_items(
             items,
             [],
             action_method=cd_cluster_evolution_inspection,
             use_multiprocessing=use_multiprocessing,
-            args=(dataset, source_folder, target_folder),
+            args=(
+                dataset,
+                source_folder,
+                target_folder,
+                crossreference_graph_folder,
+                snapshot_index_folder,
+                inspection_memory_limit,
+                report_page_size,
+                report_gzip,
+                inspection_formats,
+                args.family_threshold,
+            ),
         )
-        global cd_cluster_evolution_inspection_graphs
-        cd_cluster_evolution_inspection_graphs = None
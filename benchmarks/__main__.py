@@ -0,0 +1,123 @@
+import argparse
+import shutil
+import sys
+import tempfile
+
+from benchmarks.runner import (
+    compare_results,
+    read_results,
+    run_benchmarks,
+    scales,
+    stages,
+    write_results,
+)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Run the pipeline on synthetic data and record the wall time, "
+        "cpu time and peak memory of each step."
+    )
+    parser.add_argument(
+        "--scales",
+        dest="scales",
+        nargs="+",
+        choices=list(scales),
+        default=["small"],
+        help="Sizes of the synthetic datasets. Default: small",
+    )
+    parser.add_argument(
+        "--stages",
+        dest="stages",
+        nargs="+",
+        choices=[name for name, _, _ in stages],
+        default=None,
+        help="Stages to run. Default: all",
+    )
+    parser.add_argument(
+        "--output",
+        dest="output",
+        type=str,
+        default="benchmark_results.json",
+        help="Path of the results json. Default: benchmark_results.json",
+    )
+    parser.add_argument(
+        "--baseline",
+        dest="baseline",
+        type=str,
+        default=None,
+        help="Results json of an earlier run to compare with. "
+        "Exits with status 1 if a stage regressed.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        dest="tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative increase of wall time and peak memory compared to "
+        "the baseline. Default: 0.2",
+    )
+    parser.add_argument(
+        "--workspace",
+        dest="workspace",
+        type=str,
+        default=None,
+        help="Folder for the synthetic data and the pipeline output. "
+        "Default: a temporary folder that is removed afterwards",
+    )
+    parser.add_argument(
+        "--multiprocessing",
+        dest="use_multiprocessing",
+        action="store_const",
+        const=True,
+        default=False,
+        help="Run the steps with multiprocessing",
+    )
+    parser.add_argument(
+        "--clustering-method",
+        dest="clustering_method",
+        type=str,
+        default="infomap",
+        help="Clustering method of the pipeline. Default: infomap",
+    )
+    parser.add_argument(
+        "--seed",
+        dest="seed",
+        type=int,
+        default=0,
+        help="Seed of the synthetic data. Default: 0",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+
+    workspace = args.workspace or tempfile.mkdtemp(prefix="ldc-benchmark-")
+    try:
+        results = run_benchmarks(
+            workspace,
+            args.scales,
+            args.stages,
+            use_multiprocessing=args.use_multiprocessing,
+            seed=args.seed,
+            pipeline_args=["--clustering-method", args.clustering_method],
+        )
+    finally:
+        if not args.workspace:
+            shutil.rmtree(workspace)
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions, rows = compare_results(
+            results, read_results(args.baseline), tolerance=args.tolerance
+        )
+        print(f'{"scale":<8} {"stage":<30} {"time":>6} {"rss":>6}')
+        for scale, stage, wall_time_ratio, peak_rss_ratio in rows:
+            print(
+                f"{scale:<8} {stage:<30} {wall_time_ratio:>6.2f} {peak_rss_ratio:>6.2f}"
+            )
+        if regressions:
+            print("Regressions:")
+            print("\n".join(regressions))
+            sys.exit(1)
@@ -0,0 +1,214 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.synthetic_data import generate_dataset
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+scales = dict(
+    small=dict(snapshots_n=3, laws_n=10, depth=2, fan_out=4, seqitems_n=5),
+    medium=dict(snapshots_n=5, laws_n=40, depth=3, fan_out=4, seqitems_n=5),
+    large=dict(snapshots_n=8, laws_n=100, depth=3, fan_out=5, seqitems_n=6),
+)
+
+# Benchmark name, pipeline step and additional arguments
+stages = [
+    ("preprocess", "preprocess", []),
+    ("cluster", "cluster", []),
+    ("cluster_consensus", "cluster", ["--consensus", "5"]),
+    ("cluster_texts", "cluster_texts", []),
+    ("cluster_evolution_mappings", "cluster_evolution_mappings", []),
+    ("cluster_evolution_graph", "cluster_evolution_graph", []),
+    ("cluster_inspection", "cluster_inspection", []),
+    ("cluster_evolution_inspection", "cluster_evolution_inspection", []),
+]
+
+
+def prepare_workspace(workspace, scale, seed=0):
+    """
+    Generate the synthetic data of a scale. The pipeline is executed in
+    {workspace}/{scale}/legal-data-clustering so that the relative paths in
+    utils/statics.py point to {workspace}/{scale}/legal-networks-data.
+    :return: working directory and snapshots
+    """
+    scale_path = os.path.join(workspace, scale)
+    working_dir = os.path.join(scale_path, "legal-data-clustering")
+    os.makedirs(working_dir, exist_ok=True)
+    snapshots = generate_dataset(
+        os.path.join(scale_path, "legal-networks-data", "de"),
+        seed=seed,
+        **scales[scale],
+    )
+    return working_dir, snapshots
+
+
+def run_stage(working_dir, step, snapshots, args=(), use_multiprocessing=False):
+    """
+    Run a pipeline step in a new process.
+    :return: dict of the measurements of run_command
+    """
+    command = [
+        sys.executable,
+        REPOSITORY_PATH,
+        "de",
+        step,
+        "--overwrite",
+        "--snapshots",
+        *snapshots,
+        *args,
+    ]
+    if not use_multiprocessing:
+        command.append("--single-process")
+    return run_command(command, working_dir)
+
+
+def run_command(command, working_dir):
+    """
+    Run a command in a new process.
+    :return: dict with wall time, cpu time and peak resident set size. The cpu time
+        includes the subprocesses of the command. The peak rss is the one of the
+        largest single process of the command and its subprocesses, not their sum.
+    """
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        cwd=working_dir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    # Read stderr before waiting to avoid blocking on a full pipe
+    stderr = process.stderr.read()
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start_time
+    # Negative signal number like subprocess
+    process.returncode = (
+        -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    )
+
+    return dict(
+        wall_time_s=round(wall_time, 3),
+        cpu_time_s=round(rusage.ru_utime + rusage.ru_stime, 3),
+        # ru_maxrss is in kilobytes on Linux
+        peak_rss_mb=round(rusage.ru_maxrss / 1024, 1),
+        returncode=process.returncode,
+        error=(stderr.decode(errors="replace")[-2000:] if process.returncode else None),
+    )
+
+
+def run_benchmarks(
+    workspace,
+    scale_names,
+    stage_names=None,
+    use_multiprocessing=False,
+    seed=0,
+    pipeline_args=(),
+):
+    """
+    Generate the data for all scales and run the stages on them in order.
+    A stage that fails is recorded and the following stages of the scale are
+    skipped.
+    :param pipeline_args: arguments passed to every pipeline step
+    """
+    results = dict(meta=dict(get_meta(), pipeline_args=list(pipeline_args)), results={})
+    for scale in scale_names:
+        start_time = time.perf_counter()
+        working_dir, snapshots = prepare_workspace(workspace, scale, seed)
+        scale_results = dict(
+            generate=dict(wall_time_s=round(time.perf_counter() - start_time, 3))
+        )
+        results["results"][scale] = scale_results
+        for name, step, args in stages:
+            if stage_names and name not in stage_names:
+                continue
+            print(f"{scale} {name}", end=" ", flush=True)
+            scale_results[name] = run_stage(
+                working_dir,
+                step,
+                snapshots,
+                [*pipeline_args, *args],
+                use_multiprocessing,
+            )
+            print(
+                f'{scale_results[name]["wall_time_s"]} s',
+                f'{scale_results[name]["peak_rss_mb"]} MB',
+            )
+            if scale_results[name]["returncode"]:
+                print(scale_results[name]["error"])
+                break
+    return results
+
+
+def get_meta():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPOSITORY_PATH,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return dict(
+        commit=commit,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+    )
+
+
+def compare_results(results, baseline, tolerance=0.2, min_wall_time_diff=0.5):
+    """
+    Compare results with a baseline.
+    A stage regressed if its wall time or peak rss exceeds the baseline by more than
+    the tolerance. Wall time differences below min_wall_time_diff seconds are
+    ignored as noise.
+    :return: list of regression descriptions and rows to print
+    """
+    regressions = []
+    rows = []
+    for scale, scale_results in results["results"].items():
+        baseline_scale_results = baseline["results"].get(scale, {})
+        for stage, result in scale_results.items():
+            baseline_result = baseline_scale_results.get(stage)
+            if not baseline_result or "peak_rss_mb" not in result:
+                continue
+            if result["returncode"]:
+                regressions.append(f"{scale} {stage}: failed")
+                continue
+            wall_time_ratio = result["wall_time_s"] / max(
+                baseline_result["wall_time_s"], 1e-3
+            )
+            peak_rss_ratio = result["peak_rss_mb"] / max(
+                baseline_result["peak_rss_mb"], 1e-3
+            )
+            rows.append((scale, stage, wall_time_ratio, peak_rss_ratio))
+            if (
+                wall_time_ratio > 1 + tolerance
+                and result["wall_time_s"] - baseline_result["wall_time_s"]
+                > min_wall_time_diff
+            ):
+                regressions.append(
+                    f"{scale} {stage}: wall time "
+                    f'{baseline_result["wall_time_s"]} s -> {result["wall_time_s"]} s'
+                )
+            if peak_rss_ratio > 1 + tolerance:
+                regressions.append(
+                    f"{scale} {stage}: peak rss "
+                    f'{baseline_result["peak_rss_mb"]} MB -> {result["peak_rss_mb"]} MB'
+                )
+    return regressions, rows
+
+
+def write_results(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def read_results(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,262 @@
+import itertools
+import json
+import os
+import random
+
+import networkx as nx
+import pandas as pd
+from lxml import etree
+from quantlaw.utils.files import ensure_exists
+from quantlaw.utils.networkx import load_graph_from_csv_files
+
+words = (
+    "gesetz recht pflicht antrag behörde frist verfahren anspruch vertrag "
+    "section chapter person agency court order notice payment state"
+).split()
+
+
+def generate_dataset(
+    data_path,
+    snapshots_n=3,
+    laws_n=10,
+    depth=2,
+    fan_out=4,
+    seqitems_n=5,
+    texts_n=3,
+    reference_density=0.5,
+    change_rate=0.05,
+    seed=0,
+):
+    """
+    Generate a synthetic dataset in the layout of legal-networks-data/{de,us}.
+
+    Every law is a hierarchy of `depth` item levels with `fan_out` children each.
+    The lowest items contain `seqitems_n` seqitems with up to `texts_n` texts.
+    Headings of the first item level alternate between "Buch" and "Chapter" so that
+    both are merged with pp_merge -1. Some laws have no such level.
+    Over the snapshots, a share of `change_rate` of the seqitems is added and
+    removed in each snapshot. Surviving texts are mapped onto themselves.
+
+    :param data_path: e.g. ../legal-networks-data/de
+    :param reference_density: number of references per seqitem
+    :return: list of snapshot names
+    """
+    rng = random.Random(seed)
+    snapshots = [str(2000 + idx) for idx in range(snapshots_n)]
+    laws = [
+        generate_law(rng, law_idx, depth, fan_out, seqitems_n, texts_n)
+        for law_idx in range(laws_n)
+    ]
+    seqitems = [n for law in laws for n in law if n["type"] == "seqitem"]
+    for seqitem in seqitems:
+        seqitem["birth"] = (
+            0 if rng.random() > change_rate else rng.randrange(snapshots_n)
+        )
+        seqitem["death"] = (
+            snapshots_n
+            if rng.random() > change_rate
+            else rng.randrange(seqitem["birth"] + 1, snapshots_n + 1)
+        )
+    references = [
+        tuple(rng.sample(seqitems, 2))
+        for _ in range(int(len(seqitems) * reference_density))
+    ]
+
+    crossreference_graph_folder = ensure_exists(f"{data_path}/4_crossreference_graph")
+    seqitems_folder = ensure_exists(f"{crossreference_graph_folder}/seqitems")
+    snapshot_mapping_folder = ensure_exists(
+        f"{data_path}/5_snapshot_mapping_edgelist/subseqitems"
+    )
+    reference_parsed_folder = ensure_exists(f"{data_path}/2_xml")
+
+    prev_texts = None
+    for snapshot_idx, snapshot in enumerate(snapshots):
+        nodes, edges = get_snapshot_tables(laws, references, snapshot_idx)
+        nodes.drop(columns="texts_count").to_csv(
+            f"{crossreference_graph_folder}/{snapshot}.nodes.csv.gz", index=False
+        )
+        edges.to_csv(
+            f"{crossreference_graph_folder}/{snapshot}.edges.csv.gz", index=False
+        )
+        G = load_graph_from_csv_files(crossreference_graph_folder, snapshot)
+        nx.write_gpickle(G, f"{seqitems_folder}/{snapshot}.gpickle.gz")
+
+        texts = [
+            f"{key}_{text_idx}"
+            for key, texts_count in zip(nodes.key, nodes.texts_count)
+            for text_idx in range(int(texts_count))
+        ]
+        if prev_texts is not None:
+            mapping = {t: t for t in set(prev_texts) & set(texts)}
+            with open(
+                f"{snapshot_mapping_folder}/{snapshots[snapshot_idx - 1]}_{snapshot}"
+                ".json",
+                "w",
+            ) as f:
+                json.dump(mapping, f)
+        prev_texts = texts
+
+    for law in laws:
+        write_law_xml(rng, law, reference_parsed_folder)
+
+    return snapshots
+
+
+def generate_law(rng, law_idx, depth, fan_out, seqitems_n, texts_n):
+    """
+    :return: list of node dicts. The first node is the document.
+    """
+    law_name = f"law{law_idx:04d}"
+    counter = itertools.count()
+
+    def key():
+        return f"{law_name}_{next(counter):06d}"
+
+    document = dict(
+        key=key(),
+        parent="root",
+        type="document",
+        level=0,
+        heading=f"Gesetz {law_idx}",
+        document_type=rng.choice(["statute", "regulation"]),
+    )
+    nodes = [document]
+    # Every third law has no level that is merged with pp_merge -1
+    top_level_heading = ["Buch", "Chapter", "Teil"][law_idx % 3]
+
+    def add_children(parent, level):
+        for idx in range(fan_out):
+            heading = f"{top_level_heading if level == 1 else 'Abschnitt'} {idx + 1}"
+            item = dict(
+                key=key(),
+                parent=parent["key"],
+                type="item",
+                level=level,
+                heading=heading,
+            )
+            nodes.append(item)
+            if level < depth:
+                add_children(item, level + 1)
+            else:
+                for seqitem_idx in range(seqitems_n):
+                    texts_tokens_n = [
+                        rng.randint(5, 200) for _ in range(rng.randint(1, texts_n))
+                    ]
+                    nodes.append(
+                        dict(
+                            key=key(),
+                            parent=item["key"],
+                            type="seqitem",
+                            level=level + 1,
+                            heading=f"§ {seqitem_idx + 1}",
+                            texts_tokens_n=texts_tokens_n,
+                        )
+                    )
+
+    add_children(document, 1)
+    return nodes
+
+
+def get_snapshot_tables(laws, references, snapshot_idx):
+    """
+    Node and edge tables of a snapshot in the format of the crossreference graph
+    csv files.
+    """
+    rows = [dict(key="root", type="root", level=-1, texts_count=0)]
+    edges = []
+    for law in laws:
+        parents = {n["key"]: n["parent"] for n in law}
+        seqitem_rows = [
+            get_seqitem_row(node)
+            for node in law
+            if node["type"] == "seqitem"
+            and node["birth"] <= snapshot_idx < node["death"]
+        ]
+        # Items and documents are as large as their seqitems
+        sizes = {}
+        for row in seqitem_rows:
+            parent = parents[row["key"]]
+            while parent != "root":
+                sizes[parent] = sizes.get(parent, 0) + row["tokens_n"]
+                parent = parents[parent]
+        seqitem_rows = {row["key"]: row for row in seqitem_rows}
+
+        for node in law:
+            if node["key"] in seqitem_rows:
+                rows.append(seqitem_rows[node["key"]])
+            elif node["type"] != "seqitem" and node["key"] in sizes:
+                rows.append(
+                    dict(
+                        {
+                            k: v
+                            for k, v in node.items()
+                            if k not in {"parent", "birth", "death"}
+                        },
+                        **size_attrs(sizes[node["key"]]),
+                        texts_count=0,
+                    )
+                )
+            else:
+                continue
+            edges.append((node["parent"], node["key"], "containment"))
+
+    existing_keys = {row["key"] for row in rows}
+    edges += [
+        (u["key"], v["key"], "reference")
+        for u, v in references
+        if u["key"] in existing_keys and v["key"] in existing_keys
+    ]
+    return (
+        pd.DataFrame(rows),
+        pd.DataFrame(edges, columns=["u", "v", "edge_type"]),
+    )
+
+
+def get_seqitem_row(node):
+    texts_tokens_n = node["texts_tokens_n"]
+    row = dict(
+        key=node["key"],
+        type="seqitem",
+        level=node["level"],
+        heading=node["heading"],
+        **size_attrs(sum(texts_tokens_n)),
+        texts_count=len(texts_tokens_n),
+    )
+    if len(texts_tokens_n) > 1:
+        row["texts_tokens_n"] = ",".join(map(str, texts_tokens_n))
+        row["texts_chars_n"] = ",".join(str(6 * t) for t in texts_tokens_n)
+    return row
+
+
+def size_attrs(tokens_n):
+    return dict(
+        tokens_n=tokens_n,
+        tokens_unique=int(tokens_n * 0.7),
+        chars_n=6 * tokens_n,
+        chars_nowhites=5 * tokens_n,
+    )
+
+
+def write_law_xml(rng, law, folder):
+    """
+    Write the texts of all versions of a law in one xml file as expected by the
+    cluster texts step.
+    """
+    elements = {}
+    for node in law:
+        tag = node["type"]
+        if node["parent"] in elements:
+            elem = etree.SubElement(elements[node["parent"]], tag)
+        else:
+            elem = etree.Element(tag)
+            root = elem
+        elem.set("key", node["key"])
+        elem.set("heading", node["heading"])
+        elements[node["key"]] = elem
+        for tokens_n in node.get("texts_tokens_n", []):
+            text = etree.SubElement(elem, "text")
+            text.text = " ".join(rng.choice(words) for _ in range(tokens_n))
+    law_name = law[0]["key"].split("_")[0]
+    etree.ElementTree(root).write(
+        os.path.join(folder, f"{law_name}.xml"), encoding="utf-8"
+    )
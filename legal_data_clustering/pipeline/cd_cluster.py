@@ -1,21 +1,37 @@
+import os
 from collections import defaultdict
 from itertools import combinations
 
 import networkx as nx
 from cdlib import NodeClustering
-from cdlib.readwrite import write_community_json
 from quantlaw.utils.files import ensure_exists, list_dir
 
 from legal_data_clustering.pipeline import cdlib_custom_algorithms
 from legal_data_clustering.pipeline.cdlib_custom_algorithms import (
     missings_nodes_as_additional_clusters,
 )
+from legal_data_clustering.utils.artifacts import (
+    link_aliases,
+    read_artifacts,
+    resolve_artifact,
+)
+from legal_data_clustering.utils.atomic_files import atomic_path
+from legal_data_clustering.utils.clustering_tables import (
+    NODES_FILE_EXT,
+    clustering_file_exts,
+    list_clusterings,
+    write_clustering,
+    write_node_dictionary,
+)
 from legal_data_clustering.utils.config_handling import (
     check_for_missing_files,
     get_configs_for_snapshots,
+    get_equivalent_items,
     get_no_overwrite_items,
 )
 from legal_data_clustering.utils.config_parsing import filename_for_pp_config
+from legal_data_clustering.utils.instrumentation import phase
+from legal_data_clustering.utils.prefetch import read_gpickle
 
 source_file_ext = ".gpickle.gz"
 target_file_ext = ".json"
@@ -27,33 +43,42 @@ def cd_cluster_prepare(overwrite, snapshots, pp_configs, source_folder, target_f
 
     # Check if source graphs exist
     existing_source_files = set(list_dir(source_folder, source_file_ext))
-    required_source_files = {
-        filename_for_pp_config(
-            **{
-                **item,
-                "seed": None,
-                "markov_time": None,
-                "number_of_modules": None,
-                "consensus": None,
-                "method": None,
-            },
-            file_ext=source_file_ext,
-        )
-        for item in items
-    }
+    required_source_files = {get_source_filename(item) for item in items}
     check_for_missing_files(
         required_source_files, existing_source_files, "preprocessed graphs"
     )
 
+    # Configs with identical source graphs are clustered once and linked to the
+    # clustering of the first of them
+    artifacts = read_artifacts(source_folder)
+    items, aliases = get_equivalent_items(
+        items, lambda item: canonical_cluster_config(item, artifacts)
+    )
+
     if not overwrite:
-        existing_files = list_dir(target_folder, target_file_ext)
+        # Clusterings in any format are kept, e.g. json results of earlier runs
+        existing_files = list_clusterings(target_folder)
         items = get_no_overwrite_items(items, target_file_ext, existing_files)
+        aliases = [
+            (item, alias_of)
+            for item, alias_of in aliases
+            if filename_for_pp_config(**item, file_ext=target_file_ext)
+            not in existing_files
+        ]
+
+    return items, aliases
+
 
-    return items
+def get_nodes_filename(config):
+    """
+    :return: filename of the node dictionary of the label vectors of the
+        clusterings of a preprocessed graph
+    """
+    return get_source_filename(config)[: -len(source_file_ext)] + NODES_FILE_EXT
 
 
-def cd_cluster(config, source_folder, target_folder):
-    source_filename = filename_for_pp_config(
+def get_source_filename(config):
+    return filename_for_pp_config(
         **{
             **config,
             "seed": None,
@@ -64,31 +89,191 @@ def cd_cluster(config, source_folder, target_folder):
         },
         file_ext=source_file_ext,
     )
-    g = nx.read_gpickle(f"{source_folder}/{source_filename}")
 
-    g = compile_source_graph(g, config["method"])
 
+def canonical_cluster_config(config, artifacts):
+    """
+    Clustering parameters and the source graph that the graph of the config is
+    linked to according to the artifacts of the preprocessed graphs.
+    """
+    return dict(
+        source=resolve_artifact(artifacts, get_source_filename(config)),
+        seed=config["seed"],
+        markov_time=config["markov_time"],
+        consensus=config["consensus"],
+        number_of_modules=(
+            None if config["method"] == "louvain" else config["number_of_modules"]
+        ),
+        method=config["method"],
+    )
+
+
+def cd_cluster_link_artifacts(aliases, target_folder):
+    """
+    Link the outputs of configs to the outputs of equivalent configs.
+    :param aliases: aliases returned by cd_cluster_prepare
+    """
+    link_aliases(
+        target_folder,
+        [
+            (
+                filename_for_pp_config(**item, file_ext=file_ext),
+                filename_for_pp_config(**alias_of, file_ext=file_ext),
+            )
+            for item, alias_of in aliases
+            for file_ext in (
+                list(clustering_file_exts.values())
+                + ([] if item["consensus"] else [".gpickle.gz"])
+            )
+        ],
+    )
+
+
+def cd_cluster_input_paths(config, source_folder, *args):
+    return [f"{source_folder}/{get_source_filename(config)}"]
+
+
+def cd_cluster(
+    config,
+    source_folder,
+    target_folder,
+    consensus_tolerance=None,
+    consensus_batch_size=50,
+    formats=("npz",),
+):
+    """
+    :param consensus_tolerance: stop consensus clusterings early, see
+        consensus_clustering
+    :param formats: formats of the clustering. npz and/or json
+    """
+    (source_path,) = cd_cluster_input_paths(config, source_folder)
+    with phase("load"):
+        g = read_gpickle(source_path)
+
+        g = compile_source_graph(g, config["method"])
+        network = build_network(g, config["method"])
+
+    if "npz" in formats:
+        write_nodes(g, config, source_path, target_folder)
+
+    cluster_and_write(
+        g,
+        config,
+        target_folder,
+        consensus_tolerance,
+        consensus_batch_size,
+        network,
+        formats,
+    )
+
+
+def get_sweep_items(items):
+    """
+    Group the items that cluster the same preprocessed graph with the same method.
+    """
+    sweep_items = {}
+    for item in items:
+        key = (get_source_filename(item), item["method"].lower())
+        sweep_items.setdefault(key, []).append(item)
+    return list(sweep_items.values())
+
+
+def cd_cluster_sweep_input_paths(configs, source_folder, *args):
+    return cd_cluster_input_paths(configs[0], source_folder)
+
+
+def cd_cluster_sweep(
+    configs,
+    source_folder,
+    target_folder,
+    consensus_tolerance=None,
+    consensus_batch_size=50,
+    formats=("npz",),
+):
+    """
+    Like cd_cluster for a list of configs returned by get_sweep_items, e.g.
+    different resolutions and seeds. The graph is loaded and compiled and the
+    Infomap network is built once.
+    """
+    (source_path,) = cd_cluster_sweep_input_paths(configs, source_folder)
+    with phase("load"):
+        g = read_gpickle(source_path)
+
+        g = compile_source_graph(g, configs[0]["method"])
+        network = build_network(g, configs[0]["method"])
+
+    if "npz" in formats:
+        write_nodes(g, configs[0], source_path, target_folder)
+
+    for config in configs:
+        cluster_and_write(
+            g,
+            config,
+            target_folder,
+            consensus_tolerance,
+            consensus_batch_size,
+            network,
+            formats,
+        )
+
+
+def write_nodes(g, config, source_path, target_folder):
+    """
+    Write the node dictionary of the clusterings of a preprocessed graph unless it
+    is newer than the graph.
+    """
+    nodes_path = f"{target_folder}/{get_nodes_filename(config)}"
+    if not os.path.exists(nodes_path) or (
+        os.path.getmtime(nodes_path) < os.path.getmtime(source_path)
+    ):
+        with phase("write"), atomic_path(nodes_path) as path:
+            write_node_dictionary(path, list(g.nodes))
+
+
+def cluster_and_write(
+    g,
+    config,
+    target_folder,
+    consensus_tolerance=None,
+    consensus_batch_size=50,
+    network=None,
+    formats=("npz",),
+):
     if not config["consensus"]:
-        clustering, D = cluster(g, config, return_tree=True)
+        with phase("cluster"):
+            clustering, D = cluster(g, config, return_tree=True, network=network)
 
         tree_path = (
             target_folder
             + "/"
             + filename_for_pp_config(**config, file_ext=".gpickle.gz")
         )
-        nx.write_gpickle(D, tree_path)
+        with phase("write"), atomic_path(tree_path) as path:
+            nx.write_gpickle(D, path)
 
     else:
-        clustering = consensus_clustering(g, config)
+        with phase("consensus"):
+            clustering = consensus_clustering(
+                g, config, consensus_tolerance, consensus_batch_size, network
+            )
         target_filename = filename_for_pp_config(**config, file_ext="target_file_ext")
 
     clustering = missings_nodes_as_additional_clusters(clustering)
 
     target_filename = filename_for_pp_config(**config, file_ext=target_file_ext)
-    write_community_json(clustering, f"{target_folder}/{target_filename}")
+    with phase("write"):
+        write_clustering(
+            clustering,
+            f"{target_folder}/{target_filename}",
+            get_nodes_filename(config),
+            formats,
+        )
 
 
-def cluster(g, config, return_tree, seed=None):
+def cluster(g, config, return_tree, seed=None, network=None):
+    """
+    :param network: network of g returned by build_network
+    """
     if config["method"].lower() in ["infomap", "infomap-directed"]:
         directed = bool(config["method"].lower() == "infomap-directed")
         return cdlib_custom_algorithms.infomap(
@@ -98,6 +283,7 @@ def cluster(g, config, return_tree, seed=None):
             number_of_modules=config.get("number_of_modules"),
             return_tree=return_tree,
             directed=directed,
+            network=network,
         )
     elif config["method"].lower() == "louvain":
         return cdlib_custom_algorithms.louvain(
@@ -131,31 +317,63 @@ def compile_source_graph(g, method):
         raise Exception(f"Method {method} not allowed")
 
 
-def consensus_clustering(g, config):
-    clustering_communities = []
-    for idx in range(config["consensus"]):
-        seed = config.get("seed") + idx * 10000
-        clustering = cluster(g, config, return_tree=False, seed=seed)
-        clustering_communities.append(clustering.communities)
-        clustering_method_parameters = clustering.method_parameters
+def build_network(g, method):
+    """
+    :return: Infomap network of a compiled graph that is reused for all its
+        clusterings or None for other methods
+    """
+    if method.lower() in ["infomap", "infomap-directed"]:
+        return cdlib_custom_algorithms.build_infomap_network(
+            g, directed=bool(method.lower() == "infomap-directed")
+        )
+    return None
+
 
+def consensus_clustering(g, config, tolerance=None, batch_size=50, network=None):
+    """
+    Cluster g config["consensus"] times and combine the nodes that are in the same
+    cluster in at least 95% of the runs.
+    :param tolerance: stop early once the consensus clusters did not change and the
+        share of runs in which any two nodes are in the same cluster did not change
+        by more than tolerance in the last batch of runs. The number of runs is
+        added to the method parameters.
+    :param batch_size: number of runs between checks of the early stop
+    :param network: network of g returned by build_network
+    """
     consensus_g = nx.Graph()
     consensus_g.add_nodes_from(g.nodes)
-    for communities in clustering_communities:
-        for community in communities:
+    previous_clusters = previous_agreements = None
+    for idx in range(config["consensus"]):
+        seed = config.get("seed") + idx * 10000
+        clustering = cluster(g, config, return_tree=False, seed=seed, network=network)
+        for community in clustering.communities:
             add_weighted_clique(community, consensus_g)
+        clustering_method_parameters = clustering.method_parameters
+        runs = idx + 1
+
+        if tolerance is not None and runs % batch_size == 0:
+            clusters = {
+                frozenset(x) for x in get_significant_clusters(consensus_g, runs)
+            }
+            agreements = {
+                (u, v): weight / runs
+                for u, v, weight in consensus_g.edges(data="weight")
+            }
+            if previous_clusters == clusters and (
+                get_max_agreement_change(previous_agreements, agreements) <= tolerance
+            ):
+                break
+            previous_clusters, previous_agreements = clusters, agreements
 
-    min_edge = int(len(clustering_communities) * 0.95)
+    if tolerance is not None:
+        clustering_method_parameters = {
+            **clustering_method_parameters,
+            "consensus_runs": runs,
+        }
 
-    edges_below_threshold = [
-        (u, v)
-        for u, v in consensus_g.edges
-        if consensus_g.edges[u, v]["weight"] < min_edge
-    ]
-    consensus_g.remove_edges_from(edges_below_threshold)
-    significant_clusters = list(nx.connected_components(consensus_g))
     significant_clusters = sorted(
-        [list(x) for x in significant_clusters], key=lambda x: -len(x)
+        [list(x) for x in get_significant_clusters(consensus_g, runs)],
+        key=lambda x: -len(x),
     )
 
     clustering = NodeClustering(
@@ -168,6 +386,30 @@ def consensus_clustering(g, config):
     return clustering
 
 
+def get_significant_clusters(consensus_g, runs):
+    """
+    :return: connected components of the nodes that are in the same cluster in at
+        least 95% of the runs
+    """
+    min_edge = int(runs * 0.95)
+    return nx.connected_components(
+        nx.subgraph_view(
+            consensus_g,
+            filter_edge=lambda u, v: consensus_g.edges[u, v]["weight"] >= min_edge,
+        )
+    )
+
+
+def get_max_agreement_change(previous_agreements, agreements):
+    return max(
+        (
+            abs(agreements.get(edge, 0) - previous_agreements.get(edge, 0))
+            for edge in agreements.keys() | previous_agreements.keys()
+        ),
+        default=0,
+    )
+
+
 def add_weighted_clique(nodes, G):
     for u, v in combinations(nodes, 2):
         if not G.has_edge(u, v):
@@ -0,0 +1,349 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+from quantlaw.utils.files import ensure_exists, list_dir
+from scipy import sparse
+
+from legal_data_clustering.pipeline.cd_cluster_evolution_graph import (
+    aggregate_community_flows,
+    get_community_ids_for_rolled_down,
+    get_config_clustering_files,
+    get_edges_table,
+    get_snapshot_mapping,
+    load_preprocessed_mappings,
+)
+from legal_data_clustering.utils.atomic_files import atomic_path
+from legal_data_clustering.utils.clustering_tables import read_clustering
+from legal_data_clustering.utils.config_handling import get_configs
+from legal_data_clustering.utils.config_parsing import filename_for_pp_config
+from legal_data_clustering.utils.instrumentation import log_event, phase
+from legal_data_clustering.utils.snapshot_tables import load_snapshot_mapping_table
+
+target_file_ext = ".flows.csv.gz"
+
+
+def filename_for_flows(prev_snapshot, snapshot, config):
+    return filename_for_pp_config(
+        snapshot=f"{prev_snapshot}-{snapshot}", **config, file_ext=target_file_ext
+    )
+
+
+def get_flow_pairs(snapshots, stride=1, pairs=None):
+    """
+    :param stride: distance of the snapshots of a pair in the list of snapshots
+    :param pairs: pairs of snapshots to use instead of the stride. Pairs with a
+        snapshot that is not in snapshots or that are reversed are skipped.
+    :return: list of tuples of an earlier and a later snapshot
+    """
+    if pairs:
+        skipped_pairs = get_skipped_flow_pairs(snapshots, pairs)
+        return [pair for pair in pairs if tuple(pair) not in skipped_pairs]
+    return list(zip(snapshots[:-stride], snapshots[stride:]))
+
+
+def get_skipped_flow_pairs(snapshots, pairs):
+    """
+    :return: dict of the pairs get_flow_pairs skips and dicts with the reason
+    """
+    skipped_pairs = {}
+    for prev_snapshot, snapshot in pairs:
+        missing = [s for s in (prev_snapshot, snapshot) if s not in snapshots]
+        if missing:
+            skipped_pairs[prev_snapshot, snapshot] = dict(
+                missing_snapshots=",".join(missing)
+            )
+        elif prev_snapshot >= snapshot:
+            skipped_pairs[prev_snapshot, snapshot] = dict(reason="not ascending")
+    return skipped_pairs
+
+
+def report_skipped_flow_pairs(configs, source_folder, pairs):
+    """
+    Log the pairs that are skipped for any of the configs once
+    """
+    events = {}
+    for config in configs:
+        snapshots = get_config_clustering_files(config, source_folder)[1]
+        for pair, reason in get_skipped_flow_pairs(snapshots, pairs).items():
+            events["-".join(pair), tuple(reason.items())] = None
+    for pair, reason in events:
+        log_event("flow_pair_skipped", pair=pair, **dict(reason))
+
+
+def cd_cluster_evolution_flows_prepare(
+    overwrite,
+    cluster_mapping_configs,
+    source_folder,
+    target_folder,
+    stride=1,
+    pairs=None,
+):
+    ensure_exists(target_folder)
+    configs = get_configs(cluster_mapping_configs)
+    if pairs:
+        report_skipped_flow_pairs(configs, source_folder, pairs)
+
+    if not overwrite:
+        existing_files = set(list_dir(target_folder, target_file_ext))
+        configs = [
+            config
+            for config in configs
+            if not all(
+                filename_for_flows(prev_snapshot, snapshot, config) in existing_files
+                for prev_snapshot, snapshot in get_flow_pairs(
+                    get_config_clustering_files(config, source_folder)[1],
+                    stride,
+                    pairs,
+                )
+            )
+        ]
+
+    return configs
+
+
+def cd_cluster_evolution_flows(
+    config,
+    source_folder,
+    snaphot_mapping_folder,
+    subseqitem_mapping_folder,
+    target_folder,
+    stride=1,
+    pairs=None,
+    memory_limit=None,
+):
+    """
+    Write the community flows between pairs of snapshots that are not necessarily
+    consecutive. The tables have the columns of the edges of the evolution graph.
+    :param stride: distance of the snapshots of a pair, e.g. 5 for pairs of
+        snapshots five years apart
+    :param pairs: pairs of snapshots to use instead of the stride
+    :param memory_limit: maximal size of the cached transition matrices in bytes
+    """
+    config_clustering_files, snapshots = get_config_clustering_files(
+        config, source_folder
+    )
+    clustering_files = dict(zip(snapshots, config_clustering_files))
+    transition_matrices = TransitionMatrixLoader(
+        snapshots,
+        config,
+        snaphot_mapping_folder,
+        subseqitem_mapping_folder,
+        memory_limit,
+    )
+
+    community_ids = {}
+    for prev_snapshot, snapshot in get_flow_pairs(snapshots, stride, pairs):
+        for s in [prev_snapshot, snapshot]:
+            if s not in community_ids:
+                with phase("snapshots"):
+                    community_ids[s] = get_community_ids(
+                        s,
+                        clustering_files[s],
+                        config,
+                        source_folder,
+                        subseqitem_mapping_folder,
+                    )
+
+        with phase("snapshot_pairs"):
+            edges = get_flows_edges_table(
+                prev_snapshot,
+                snapshot,
+                transition_matrices,
+                community_ids[prev_snapshot],
+                community_ids[snapshot],
+            )
+
+        path = os.path.join(
+            target_folder, filename_for_flows(prev_snapshot, snapshot, config)
+        )
+        with phase("write"), atomic_path(path) as temp_path:
+            edges.to_csv(temp_path, index=False)
+
+
+def get_community_ids(
+    snapshot, clustering_file, config, source_folder, subseqitem_mapping_folder
+):
+    """
+    :return: the community id of each key of the mapping table of a snapshot
+    """
+    clustering = read_clustering(os.path.join(source_folder, clustering_file))
+    preprocessed_mappings = load_preprocessed_mappings(
+        subseqitem_mapping_folder, snapshot, config
+    )
+    return get_community_ids_for_rolled_down(
+        preprocessed_mappings, clustering.communities
+    )
+
+
+def get_flows_edges_table(
+    prev_snapshot, snapshot, transition_matrices, prev_community_ids, community_ids
+):
+    """
+    :return: the edges table between the communities of two snapshots
+    """
+    matrix = transition_matrices[prev_snapshot, snapshot].tocoo()
+    prev_leaf, prev_text_idx = get_leaves_and_text_idx(
+        matrix.row, transition_matrices.get_texts_offsets(prev_snapshot)
+    )
+    leaf, text_idx = get_leaves_and_text_idx(
+        matrix.col, transition_matrices.get_texts_offsets(snapshot)
+    )
+    snapshot_mapping = dict(
+        prev_leaf=prev_leaf, prev_text_idx=prev_text_idx, leaf=leaf, text_idx=text_idx
+    )
+    flows = aggregate_community_flows(
+        snapshot_mapping,
+        prev_community_ids,
+        community_ids,
+        transition_matrices.get_mapping_table(prev_snapshot),
+        transition_matrices.get_mapping_table(snapshot),
+    )
+    return get_edges_table(prev_snapshot, snapshot, *flows)
+
+
+def get_text_positions(leaf, text_idx, texts_offsets):
+    """
+    Number the texts of a snapshot. Texts of keys with texts are numbered by their
+    position in the texts values, keys without texts by their index after them.
+    """
+    has_texts = texts_offsets[leaf + 1] > texts_offsets[leaf]
+    return np.where(has_texts, texts_offsets[leaf] + text_idx, texts_offsets[-1] + leaf)
+
+
+def get_leaves_and_text_idx(positions, texts_offsets):
+    """
+    Inverse of get_text_positions
+    """
+    texts_n = texts_offsets[-1]
+    is_text = positions < texts_n
+    leaf = np.where(
+        is_text,
+        np.searchsorted(texts_offsets, positions, side="right") - 1,
+        positions - texts_n,
+    )
+    text_idx = np.where(is_text, positions - texts_offsets[leaf], 0)
+    return leaf, text_idx
+
+
+class TransitionMatrixLoader:
+    """
+    Sparse transition matrices between the texts of two snapshots. The entry of a
+    text of the earlier and a text of the later snapshot is 1 if the text is mapped
+    to the later text. Matrices of snapshots that are not consecutive are the
+    products of the matrices of the consecutive snapshots in between.
+    Matrices are created on demand and the most recently used ones are kept in
+    memory.
+    """
+
+    def __init__(
+        self,
+        snapshots,
+        config,
+        snaphot_mapping_folder,
+        subseqitem_mapping_folder,
+        memory_limit=None,
+    ):
+        """
+        :param snapshots: all snapshots in ascending order
+        :param memory_limit: maximal size of the cached matrices in bytes.
+            The last created matrix is kept in any case.
+        """
+        self.snapshots = snapshots
+        self.config = config
+        self.snaphot_mapping_folder = snaphot_mapping_folder
+        self.subseqitem_mapping_folder = subseqitem_mapping_folder
+        self.memory_limit = memory_limit
+        self.cache = OrderedDict()
+        self.cache_sizes = dict()
+        self.mapping_tables = dict()
+
+    def __getitem__(self, pair):
+        if pair in self.cache:
+            self.cache.move_to_end(pair)
+            return self.cache[pair]
+
+        prev_snapshot, snapshot = pair
+        prev_idx = self.snapshots.index(prev_snapshot)
+        idx = self.snapshots.index(snapshot)
+        if prev_idx >= idx:
+            raise ValueError(f"{prev_snapshot} is not before {snapshot}")
+        if idx == prev_idx + 1:
+            matrix = self.load_transition_matrix(prev_snapshot, snapshot)
+        else:
+            # Compose with the prefix, which is reused for further pairs starting
+            # with prev_snapshot
+            in_between = self.snapshots[idx - 1]
+            matrix = (
+                self[prev_snapshot, in_between] @ self[in_between, snapshot]
+            ).tocsr()
+
+        self.cache[pair] = matrix
+        self.cache_sizes[pair] = (
+            matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        )
+        self.evict()
+        return matrix
+
+    def load_transition_matrix(self, prev_snapshot, snapshot):
+        prev_mapping_table = self.get_mapping_table(prev_snapshot)
+        mapping_table = self.get_mapping_table(snapshot)
+        snapshot_mapping = get_snapshot_mapping(
+            self.snaphot_mapping_folder,
+            self.subseqitem_mapping_folder,
+            prev_snapshot,
+            snapshot,
+            prev_mapping_table,
+            mapping_table,
+        )
+        mapped = (snapshot_mapping["prev_leaf"] >= 0) & (snapshot_mapping["leaf"] >= 0)
+        rows = get_text_positions(
+            snapshot_mapping["prev_leaf"][mapped],
+            snapshot_mapping["prev_text_idx"][mapped],
+            prev_mapping_table["texts_tokens_n_offsets"],
+        )
+        cols = get_text_positions(
+            snapshot_mapping["leaf"][mapped],
+            snapshot_mapping["text_idx"][mapped],
+            mapping_table["texts_tokens_n_offsets"],
+        )
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+            shape=(
+                self.get_texts_count(prev_snapshot),
+                self.get_texts_count(snapshot),
+            ),
+        )
+
+    def get_mapping_table(self, snapshot):
+        if snapshot not in self.mapping_tables:
+            self.mapping_tables[snapshot] = load_snapshot_mapping_table(
+                os.path.join(
+                    self.subseqitem_mapping_folder,
+                    f'{snapshot}_{self.config["pp_merge"]}.npz',
+                ),
+                columns=[
+                    "keys",
+                    "tokens_n",
+                    "chars_n",
+                    "texts_tokens_n_offsets",
+                    "texts_tokens_n_values",
+                    "texts_chars_n_values",
+                ],
+            )
+        return self.mapping_tables[snapshot]
+
+    def get_texts_offsets(self, snapshot):
+        return self.get_mapping_table(snapshot)["texts_tokens_n_offsets"]
+
+    def get_texts_count(self, snapshot):
+        texts_offsets = self.get_texts_offsets(snapshot)
+        return int(texts_offsets[-1]) + len(texts_offsets) - 1
+
+    def evict(self):
+        while len(self.cache) > 1 and (
+            self.memory_limit is not None
+            and sum(self.cache_sizes.values()) > self.memory_limit
+        ):
+            pair, _ = self.cache.popitem(last=False)
+            del self.cache_sizes[pair]
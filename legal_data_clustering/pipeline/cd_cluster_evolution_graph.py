@@ -1,15 +1,34 @@
 import json
 import os
-import pickle
-from collections import Counter, defaultdict
+from collections import Counter
 
 import networkx as nx
-from cdlib import readwrite
+import numpy as np
+import pandas as pd
 from quantlaw.utils.files import ensure_exists, list_dir
 
-from legal_data_clustering.utils.config_handling import get_configs
+from legal_data_clustering.pipeline.cd_cluster_evolution_mappings import (
+    filename_for_snapshot_mapping,
+)
+from legal_data_clustering.utils.atomic_files import atomic_path
+from legal_data_clustering.utils.clustering_tables import (
+    list_clusterings,
+    read_clustering,
+)
+from legal_data_clustering.utils.config_handling import get_configs, process_items
 from legal_data_clustering.utils.config_parsing import filename_for_pp_config
-from legal_data_clustering.utils.graph_api import cluster_families
+from legal_data_clustering.utils.graph_api import FamilyTree, cluster_families
+from legal_data_clustering.utils.inspection_tables import write_inspection_table
+from legal_data_clustering.utils.instrumentation import log_event, phase
+from legal_data_clustering.utils.snapshot_tables import (
+    decode_strings,
+    encode_snapshot_mapping,
+    encode_strings,
+    load_snapshot_mapping,
+    load_snapshot_mapping_table,
+)
+
+evolution_graph_file_exts = {"gpickle": ".gpickle.gz", "csv": ".nodes.csv.gz"}
 
 
 def cd_cluster_evolution_graph_prepare(
@@ -19,7 +38,13 @@ def cd_cluster_evolution_graph_prepare(
     snaphot_mapping_folder,
     subseqitem_mapping_folder,
     target_folder,
+    formats=("gpickle",),
+    append=False,
 ):
+    """
+    :param append: keep configs with an existing evolution graph that lacks
+        snapshots to append them, see cd_cluster_evolution_graph
+    """
     ensure_exists(target_folder)
     configs = get_configs(cluster_mapping_configs)
 
@@ -29,15 +54,32 @@ def cd_cluster_evolution_graph_prepare(
             config, source_folder
         )
 
-        mapping_files = list_dir(snaphot_mapping_folder, ".json")
+        # Encoded mappings can replace their json sources
+        mapping_files = list_dir(snaphot_mapping_folder, ".json") + [
+            f[: -len(".mapping.npz")] + ".json"
+            for f in list_dir(subseqitem_mapping_folder, ".mapping.npz")
+        ]
         check_mapping_files(mapping_files, snapshots, config, ".json")
 
-        mapping_files = list_dir(subseqitem_mapping_folder, ".pickle")
-        check_mapping_files(mapping_files, snapshots, config, ".pickle")
-
-    existing_files = set(list_dir(target_folder, ".gpickle.gz"))
-    if not overwrite:
-        get_configs_no_overwrite(configs, existing_files)
+        mapping_files = list_dir(subseqitem_mapping_folder, ".npz")
+        check_mapping_files(mapping_files, snapshots, config, ".npz")
+
+    file_ext = evolution_graph_file_exts[formats[0]]
+    existing_files = set(list_dir(target_folder, file_ext))
+    if not overwrite and append:
+        configs = [
+            config
+            for config in configs
+            if read_evolution_state(
+                os.path.join(
+                    target_folder,
+                    filename_for_pp_config(snapshot="all", **config, file_ext=""),
+                )
+            ).get("snapshots")
+            != get_config_clustering_files(config, source_folder)[1]
+        ]
+    elif not overwrite:
+        configs = get_configs_no_overwrite(configs, existing_files, file_ext)
 
     return configs
 
@@ -49,151 +91,530 @@ def cd_cluster_evolution_graph(
     subseqitem_mapping_folder,
     target_folder,
     regulations,
+    formats=("gpickle",),
+    processes=None,
+    append=False,
+    family_threshold=0.15,
+    family_table_thresholds=None,
+    family_table_formats=("csv",),
 ):
+    """
+    Create a graph with clusters as nodes and edges indicating the dynamics of
+    nodes between snapshots.
+    The nodes of each snapshot and the edges between each pair of consecutive
+    snapshots are collected as tables in independent tasks first.
+    :param formats: gpickle writes a networkx graph. csv writes the node and edge
+        tables without creating a networkx graph.
+    :param processes: number of processes to run the tasks of this config in.
+        None or 1 runs them in the current process.
+    :param append: only process the snapshots after the snapshots of an existing
+        evolution graph and append them to it. The graph is created from scratch
+        if it has no state or its snapshots are not the first snapshots.
+    :param family_threshold: threshold of the families, see cluster_families. The
+        family tree is written for all thresholds.
+    :param family_table_thresholds: thresholds to write a table with the families
+        of each node for
+    :param family_table_formats: csv and/or parquet
+    """
     config_clustering_files, snapshots = get_config_clustering_files(
         config, source_folder
     )
+    use_multiprocessing = bool(processes and processes > 1)
+
+    target_filename_base = os.path.join(
+        target_folder, filename_for_pp_config(snapshot="all", **config, file_ext="")
+    )
+    state = (
+        get_append_state(target_filename_base, snapshots, formats) if append else None
+    )
+    # Snapshots of the existing graph are skipped, except for the community ids of
+    # the last one, which are taken from the state
+    start = len(state["snapshots"]) if state else 0
+    if state:
+        if start == len(snapshots):
+            return
+        log_event("append", snapshots=snapshots[start:])
+
+    with phase("snapshots"):
+        snapshot_results = process_items(
+            list(zip(snapshots[start:], config_clustering_files[start:])),
+            [],
+            action_method=get_snapshot_result,
+            use_multiprocessing=use_multiprocessing,
+            args=(config, source_folder, subseqitem_mapping_folder),
+            processes=processes,
+        )
+    nodes_tables = [nodes_table for nodes_table, _ in snapshot_results]
+    community_ids = ([state["community_ids"]] if state else []) + [
+        community_ids for _, community_ids in snapshot_results
+    ]
+    pair_snapshots = snapshots[max(start - 1, 0) :]
+
+    with phase("snapshot_pairs"):
+        edges_tables = process_items(
+            list(
+                zip(
+                    pair_snapshots[:-1],
+                    pair_snapshots[1:],
+                    community_ids[:-1],
+                    community_ids[1:],
+                )
+            ),
+            [],
+            action_method=get_snapshot_pair_edges_table,
+            use_multiprocessing=use_multiprocessing,
+            args=(config, snaphot_mapping_folder, subseqitem_mapping_folder),
+            processes=processes,
+        )
 
-    first = True
+    nodes = pd.concat(nodes_tables, ignore_index=True)
+    edges = pd.concat(edges_tables, ignore_index=True) if edges_tables else None
+    if edges is None:
+        edges = get_edges_table(None, None, *[np.zeros(0, dtype=int)] * 4)
+
+    with phase("write"):
+        if "csv" in formats:
+            all_nodes, all_edges = nodes, edges
+            if state:
+                prev_nodes, prev_edges = read_evolution_tables(target_filename_base)
+                all_nodes = pd.concat([prev_nodes, nodes], ignore_index=True)
+                all_edges = pd.concat([prev_edges, edges], ignore_index=True)
+            write_evolution_tables(all_nodes, all_edges, target_filename_base)
+
+        if "gpickle" in formats:
+            if state:
+                B = nx.read_gpickle(target_filename_base + ".gpickle.gz")
+            else:
+                B = nx.DiGraph()
+            add_to_evolution_graph(B, nodes, edges)
+            with atomic_path(target_filename_base + ".gpickle.gz") as path:
+                nx.write_gpickle(B, path)
 
-    B = nx.DiGraph()
+    # Write families
+    with phase("families"):
+        previous_tree = state["family_tree"] if state else None
+        node_attrs = dict(previous_tree.node_attrs) if previous_tree else {}
+        node_attrs.update(zip(nodes.key, nodes.tokens_n))
+        family_tree = FamilyTree.from_edges(
+            node_attrs, zip(edges.u, edges.v, edges.tokens_n), previous_tree
+        )
+        write_family_tree(family_tree, target_filename_base)
+        with atomic_path(target_filename_base + ".families.json") as path:
+            with open(path, "w") as f:
+                json.dump(family_tree.get_families(family_threshold), f)
+        if family_table_thresholds:
+            write_inspection_table(
+                family_tree.get_family_table(family_table_thresholds),
+                target_filename_base + ".family_table",
+                family_table_formats,
+            )
 
-    prev_community_id_for_rolled_down = None
-    prev_preprocessed_mappings = None
-    prev_snapshot = None
+        write_evolution_state(target_filename_base, snapshots, community_ids[-1])
 
-    for config_clustering_file, snapshot in zip(config_clustering_files, snapshots):
-        # Add nodes to graph
 
-        clustering = readwrite.read_community_json(
-            os.path.join(source_folder, config_clustering_file)
-        )
+def get_snapshot_result(
+    snapshot_and_clustering_file, config, source_folder, subseqitem_mapping_folder
+):
+    """
+    Task for a single snapshot.
+    :return: the nodes table of the snapshot and the community id of each key
+        of the mapping table
+    """
+    snapshot, config_clustering_file = snapshot_and_clustering_file
+    clustering = read_clustering(os.path.join(source_folder, config_clustering_file))
+    preprocessed_mappings = load_preprocessed_mappings(
+        subseqitem_mapping_folder, snapshot, config
+    )
+    nodes_table = get_snapshot_nodes_table(
+        snapshot, clustering.communities, preprocessed_mappings
+    )
+    community_ids = get_community_ids_for_rolled_down(
+        preprocessed_mappings, clustering.communities
+    )
+    return nodes_table, community_ids
 
-        with open(
-            os.path.join(
-                subseqitem_mapping_folder,
-                f'{snapshot}_{config["pp_merge"]}.pickle',
+
+def get_snapshot_pair_edges_table(
+    pair, config, snaphot_mapping_folder, subseqitem_mapping_folder
+):
+    """
+    Task for a pair of consecutive snapshots.
+    :param pair: tuple of both snapshots and their community ids as returned by
+        get_snapshot_result
+    :return: the edges table between both snapshots
+    """
+    prev_snapshot, snapshot, prev_community_ids, community_ids = pair
+    prev_preprocessed_mappings, preprocessed_mappings = [
+        load_snapshot_mapping_table(
+            os.path.join(subseqitem_mapping_folder, f'{s}_{config["pp_merge"]}.npz'),
+            columns=columns,
+        )
+        for s, columns in [
+            (prev_snapshot, ["keys", "tokens_n"]),
+            (
+                snapshot,
+                [
+                    "keys",
+                    "tokens_n",
+                    "chars_n",
+                    "texts_tokens_n_offsets",
+                    "texts_tokens_n_values",
+                    "texts_chars_n_values",
+                ],
             ),
-            "rb",
-        ) as f:
-            preprocessed_mappings = pickle.load(f)
+        ]
+    ]
+    snapshot_mapping = get_snapshot_mapping(
+        snaphot_mapping_folder,
+        subseqitem_mapping_folder,
+        prev_snapshot,
+        snapshot,
+        prev_preprocessed_mappings,
+        preprocessed_mappings,
+    )
+    flows = aggregate_community_flows(
+        snapshot_mapping,
+        prev_community_ids,
+        community_ids,
+        prev_preprocessed_mappings,
+        preprocessed_mappings,
+    )
+    return get_edges_table(prev_snapshot, snapshot, *flows)
+
+
+def get_snapshot_nodes_table(snapshot, communities, preprocessed_mappings):
+    """
+    :return: DataFrame with a row for each community of a snapshot
+    """
+    counters_dict = get_cluster_law_names_counting_seqitems(
+        preprocessed_mappings, communities
+    )
+    chars_n_dict = get_community_sizes(
+        communities, preprocessed_mappings["cluster_chars_n"]
+    )
+    tokens_n_dict = get_community_sizes(
+        communities, preprocessed_mappings["cluster_tokens_n"]
+    )
 
-        counters_dict = get_cluster_law_names_counting_seqitems(
-            preprocessed_mappings, clustering.communities
+    nodes_contained = []
+    for community_nodes in communities:
+        community_nodes_sorted = sorted(
+            community_nodes,
+            key=lambda n: preprocessed_mappings["cluster_tokens_n"].get(n, 0),
+            reverse=True,
         )
-        most_common_dict = {
-            k: ",".join([f"{elem_k},{count}" for elem_k, count in v.most_common()])
-            for k, v in counters_dict.items()
-        }
-        chars_n_dict = get_community_sizes(
-            clustering.communities,
-            preprocessed_mappings["chars_n"],
+        for n in community_nodes_sorted:
+            assert "," not in n
+        nodes_contained.append(",".join(community_nodes_sorted))
+
+    community_keys = range(len(communities))
+    return pd.DataFrame(
+        dict(
+            key=[f"{snapshot}_{community_key}" for community_key in community_keys],
+            bipartite=snapshot,
+            chars_n=[chars_n_dict[k] for k in community_keys],
+            tokens_n=[tokens_n_dict[k] for k in community_keys],
+            law_names=[
+                ",".join(
+                    [
+                        f"{elem_k},{count}"
+                        for elem_k, count in counters_dict[k].most_common()
+                    ]
+                )
+                for k in community_keys
+            ],
+            nodes_contained=nodes_contained,
         )
-        tokens_n_dict = get_community_sizes(
-            clustering.communities, preprocessed_mappings["tokens_n"]
+    )
+
+
+def get_edges_table(
+    prev_snapshot, snapshot, prev_community_ids, community_ids, tokens_n, chars_n
+):
+    """
+    :return: DataFrame with a row for each edge between two snapshots
+    """
+    return pd.DataFrame(
+        dict(
+            u=[f"{prev_snapshot}_{c}" for c in prev_community_ids],
+            v=[f"{snapshot}_{c}" for c in community_ids],
+            tokens_n=np.asarray(tokens_n, dtype=np.int64),
+            chars_n=np.asarray(chars_n, dtype=np.int64),
         )
+    )
 
-        for community_key, community_nodes in enumerate(clustering.communities):
-            community_nodes_sorted = sorted(
-                community_nodes,
-                key=lambda n: preprocessed_mappings["tokens_n"].get(n, 0),
-                reverse=True,
-            )
-            for n in community_nodes_sorted:
-                assert "," not in n
-            B.add_node(
-                f"{snapshot}_{community_key}",
-                bipartite=snapshot,
-                chars_n=chars_n_dict[community_key],
-                tokens_n=tokens_n_dict[community_key],
-                law_names=most_common_dict[community_key],
-                nodes_contained=",".join(community_nodes_sorted),
-            )
 
-        communities_rolled_down = [
-            [
-                n
-                for rolled_up_node in community_nodes
-                for n in preprocessed_mappings["items_mapping"][rolled_up_node]
-            ]
-            for community_nodes in clustering.communities
-        ]
+def build_evolution_graph(nodes, edges):
+    """
+    Create the evolution graph from node and edge tables at once.
+    All columns except key, u and v are added as attributes.
+    """
+    B = nx.DiGraph()
+    add_to_evolution_graph(B, nodes, edges)
+    return B
+
+
+def add_to_evolution_graph(B, nodes, edges):
+    node_attrs = [c for c in nodes.columns if c != "key"]
+    B.add_nodes_from(
+        zip(nodes.key, nodes[node_attrs].to_dict("records"))
+        if node_attrs
+        else nodes.key
+    )
+    edge_attrs = [c for c in edges.columns if c not in ("u", "v")]
+    B.add_edges_from(zip(edges.u, edges.v, edges[edge_attrs].to_dict("records")))
 
-        community_id_for_rolled_down = {
-            n: community_id
-            for community_id, nodes in enumerate(communities_rolled_down)
-            for n in nodes
+
+def write_evolution_tables(nodes, edges, filename_base):
+    with atomic_path(filename_base + ".nodes.csv.gz") as path:
+        nodes.to_csv(path, index=False)
+    with atomic_path(filename_base + ".edges.csv.gz") as path:
+        edges.to_csv(path, index=False)
+
+
+def read_evolution_tables(filename_base):
+    nodes = pd.read_csv(
+        filename_base + ".nodes.csv.gz",
+        dtype=dict(key=str, bipartite=str, law_names=str, nodes_contained=str),
+        keep_default_na=False,
+    )
+    edges = pd.read_csv(filename_base + ".edges.csv.gz", dtype=dict(u=str, v=str))
+    return nodes, edges
+
+
+def read_families(filename_base, G=None, threshold=0.15):
+    """
+    Get the families at the threshold from the family tree written with the
+    evolution graph. If it is not available, get them from the evolution graph G.
+    """
+    family_tree = read_family_tree(filename_base)
+    if family_tree:
+        return family_tree.get_families(threshold)
+    return cluster_families(G or read_evolution_graph(filename_base), threshold)
+
+
+def write_family_tree(family_tree, filename_base):
+    with atomic_path(filename_base + ".family_tree.json") as path:
+        with open(path, "w") as f:
+            json.dump(family_tree.to_dict(), f)
+
+
+def read_family_tree(filename_base):
+    """
+    :return: the FamilyTree written with the evolution graph or None
+    """
+    if not os.path.exists(filename_base + ".family_tree.json"):
+        return None
+    with open(filename_base + ".family_tree.json") as f:
+        return FamilyTree.from_dict(json.load(f))
+
+
+def write_evolution_state(filename_base, snapshots, community_ids):
+    """
+    Write the state needed to append snapshots to an evolution graph: its
+    snapshots and the community ids of the last snapshot as returned by
+    get_snapshot_result. The family tree is part of the state as well.
+    """
+    with atomic_path(filename_base + ".state.npz") as path:
+        np.savez(
+            path,
+            snapshots=encode_strings(snapshots),
+            community_ids=np.asarray(community_ids, dtype=np.int64),
+        )
+
+
+def read_evolution_state(filename_base):
+    """
+    :return: dict with the snapshots and the community ids of the last snapshot
+        of an evolution graph or an empty dict if it has no state
+    """
+    if not os.path.exists(filename_base + ".state.npz"):
+        return {}
+    with np.load(filename_base + ".state.npz") as state:
+        return dict(
+            snapshots=decode_strings(state["snapshots"]),
+            community_ids=state["community_ids"],
+        )
+
+
+def get_append_state(filename_base, snapshots, formats):
+    """
+    :return: state of the existing evolution graph with its family tree if
+        snapshots can be appended to it, else None
+    """
+    state = read_evolution_state(filename_base)
+    file_exts = [evolution_graph_file_exts[f] for f in formats] + [".family_tree.json"]
+    if (
+        not state
+        or state["snapshots"] != snapshots[: len(state["snapshots"])]
+        or not all(os.path.exists(filename_base + ext) for ext in file_exts)
+        or ("csv" in formats and not os.path.exists(filename_base + ".edges.csv.gz"))
+    ):
+        return None
+    return dict(**state, family_tree=read_family_tree(filename_base))
+
+
+def read_evolution_graph(filename_base):
+    """
+    Read the evolution graph from a gpickle or, if not available, from its tables.
+    """
+    if os.path.exists(filename_base + ".gpickle.gz"):
+        return nx.read_gpickle(filename_base + ".gpickle.gz")
+    return build_evolution_graph(*read_evolution_tables(filename_base))
+
+
+def load_preprocessed_mappings(subseqitem_mapping_folder, snapshot, config):
+    """
+    Load the mapping table of a snapshot and derive the lookups
+    for the nodes of the preprocessed graph.
+    """
+    preprocessed_mappings = load_snapshot_mapping_table(
+        os.path.join(subseqitem_mapping_folder, f'{snapshot}_{config["pp_merge"]}.npz'),
+        columns=[
+            "keys",
+            "cluster_keys",
+            "contracted_to",
+            "seqitem_counts",
+            "tokens_n",
+            "chars_n",
+            "texts_tokens_n_offsets",
+            "texts_tokens_n_values",
+            "texts_chars_n_values",
+        ],
+    )
+    key_idx = {k: idx for idx, k in enumerate(preprocessed_mappings["keys"])}
+    preprocessed_mappings["cluster_key_idx"] = {
+        k: idx for idx, k in enumerate(preprocessed_mappings["cluster_keys"])
+    }
+
+    # Sizes are only required for the nodes of the preprocessed graph
+    for attr in ["tokens_n", "chars_n"]:
+        values = preprocessed_mappings[attr]
+        preprocessed_mappings[f"cluster_{attr}"] = {
+            k: int(values[key_idx[k]])
+            for k in preprocessed_mappings["cluster_keys"]
+            if k in key_idx and not np.isnan(values[key_idx[k]])
         }
+    preprocessed_mappings["cluster_seqitem_counts"] = dict(
+        zip(
+            preprocessed_mappings["cluster_keys"],
+            preprocessed_mappings["seqitem_counts"],
+        )
+    )
+    return preprocessed_mappings
+
+
+def get_community_ids_for_rolled_down(preprocessed_mappings, communities):
+    """
+    :return: array with the community id of each key of the mapping table
+        or -1 if the key is not contracted into a clustered node
+    """
+    cluster_key_idx = preprocessed_mappings["cluster_key_idx"]
+    cluster_community_ids = np.full(len(cluster_key_idx), -1, dtype=np.int64)
+    for community_id, community_nodes in enumerate(communities):
+        for n in community_nodes:
+            cluster_community_ids[cluster_key_idx[n]] = community_id
+
+    contracted_to = preprocessed_mappings["contracted_to"]
+    return np.where(contracted_to >= 0, cluster_community_ids[contracted_to], -1)
+
 
-        if not first:
-
-            with open(
-                os.path.join(snaphot_mapping_folder, f"{prev_snapshot}_{snapshot}.json")
-            ) as f:
-                mapping = json.load(f)
-
-            # draw edges
-            edges_tokens_n = defaultdict(int)
-            edges_chars_n = defaultdict(int)
-            for prev_leaf_and_text_idx, leaf_and_text_idx in mapping.items():
-                prev_leaf, prev_text_idx = prev_leaf_and_text_idx.rsplit("_", 1)
-                leaf, text_idx = leaf_and_text_idx.rsplit("_", 1)
-
-                text_idx = int(text_idx)
-
-                try:
-                    prev_community_id = prev_community_id_for_rolled_down[prev_leaf]
-                except KeyError as err:
-                    report_mapping_error(err, prev_preprocessed_mappings["tokens_n"])
-                    continue
-
-                try:
-                    community_id = community_id_for_rolled_down[leaf]
-                except KeyError as err:
-                    report_mapping_error(err, preprocessed_mappings["tokens_n"])
-                    continue
-
-                prev_community_name = f"{prev_snapshot}_{prev_community_id}"
-                community_name = f"{snapshot}_{community_id}"
-                edge = (prev_community_name, community_name)
-
-                if leaf in preprocessed_mappings["texts_tokens_n"]:
-                    texts_tokens_n = preprocessed_mappings["texts_tokens_n"][leaf]
-                    texts_chars_n = preprocessed_mappings["texts_chars_n"][leaf]
-                    tokens_n = texts_tokens_n[text_idx]
-                    chars_n = texts_chars_n[text_idx]
-                else:
-                    assert text_idx == 0
-                    tokens_n = preprocessed_mappings["tokens_n"][leaf]
-                    chars_n = preprocessed_mappings["chars_n"][leaf]
-
-                # Use the tokens_n and chars_n values of the later year
-                edges_tokens_n[edge] += tokens_n
-                edges_chars_n[edge] += chars_n
-
-            B.add_edges_from(edges_tokens_n.keys())
-            nx.set_edge_attributes(B, edges_tokens_n, "tokens_n")
-            nx.set_edge_attributes(B, edges_chars_n, "chars_n")
-
-        first = False
-        prev_snapshot = snapshot
-        prev_community_id_for_rolled_down = community_id_for_rolled_down
-        prev_preprocessed_mappings = preprocessed_mappings
-
-    nx.write_gpickle(
-        B,
-        f"{target_folder}/"
-        f'{filename_for_pp_config(snapshot="all", **config, file_ext=".gpickle.gz")}',
+def get_snapshot_mapping(
+    snaphot_mapping_folder,
+    subseqitem_mapping_folder,
+    prev_snapshot,
+    snapshot,
+    prev_preprocessed_mappings,
+    preprocessed_mappings,
+):
+    """
+    Load the encoded mapping between two snapshots.
+    If it was not encoded in advance, encode the json mapping.
+    """
+    encoded_path = os.path.join(
+        subseqitem_mapping_folder,
+        filename_for_snapshot_mapping(prev_snapshot, snapshot),
+    )
+    if os.path.exists(encoded_path):
+        return load_snapshot_mapping(encoded_path)
+
+    with open(
+        os.path.join(snaphot_mapping_folder, f"{prev_snapshot}_{snapshot}.json")
+    ) as f:
+        mapping = json.load(f)
+    snapshot_mapping, missing_leaves = encode_snapshot_mapping(
+        mapping, prev_preprocessed_mappings["keys"], preprocessed_mappings["keys"]
     )
+    for leaf in missing_leaves:
+        log_event("leaf_not_found", leaf=leaf)
+    return snapshot_mapping
 
-    # Write families
-    families = cluster_families(B, threshold=0.15)
-    path = (
-        f"{target_folder}/"
-        f'{filename_for_pp_config(snapshot="all", **config, file_ext=".families.json")}'
+
+def aggregate_community_flows(
+    snapshot_mapping,
+    prev_community_id_for_rolled_down,
+    community_id_for_rolled_down,
+    prev_preprocessed_mappings,
+    preprocessed_mappings,
+):
+    """
+    Sum the sizes of the texts mapped between the communities of two snapshots.
+    The sizes of the later snapshot are used.
+    :return: arrays of previous community ids, community ids, tokens_n and chars_n
+    """
+    prev_leaf = snapshot_mapping["prev_leaf"]
+    leaf = snapshot_mapping["leaf"]
+    text_idx = snapshot_mapping["text_idx"]
+
+    prev_community_ids = np.where(
+        prev_leaf >= 0, prev_community_id_for_rolled_down[prev_leaf], -1
+    )
+    community_ids = np.where(leaf >= 0, community_id_for_rolled_down[leaf], -1)
+
+    for leaf_idx in np.unique(prev_leaf[(prev_community_ids == -1) & (prev_leaf >= 0)]):
+        report_mapping_error(leaf_idx, prev_preprocessed_mappings)
+    for leaf_idx in np.unique(leaf[(community_ids == -1) & (leaf >= 0)]):
+        report_mapping_error(leaf_idx, preprocessed_mappings)
+
+    mapped = (prev_community_ids >= 0) & (community_ids >= 0)
+    prev_community_ids = prev_community_ids[mapped]
+    community_ids = community_ids[mapped]
+    leaf = leaf[mapped]
+    text_idx = text_idx[mapped]
+
+    # Use the tokens_n and chars_n values of the later year
+    texts_offsets = preprocessed_mappings["texts_tokens_n_offsets"]
+    has_texts = texts_offsets[leaf + 1] > texts_offsets[leaf]
+    assert not text_idx[~has_texts].any()
+    texts_positions = texts_offsets[leaf[has_texts]] + text_idx[has_texts]
+
+    tokens_n = preprocessed_mappings["tokens_n"][leaf]
+    tokens_n[has_texts] = preprocessed_mappings["texts_tokens_n_values"][
+        texts_positions
+    ]
+    chars_n = preprocessed_mappings["chars_n"][leaf]
+    chars_n[has_texts] = preprocessed_mappings["texts_chars_n_values"][texts_positions]
+    # NaN sizes would become arbitrary integers in the edges table
+    missing_sizes = ~(np.isfinite(tokens_n) & np.isfinite(chars_n))
+    if missing_sizes.any():
+        raise ValueError(
+            "Mapped keys without tokens_n or chars_n: "
+            + ", ".join(
+                preprocessed_mappings["keys"][leaf_idx]
+                for leaf_idx in np.unique(leaf[missing_sizes])
+            )
+        )
+
+    communities_count = int(community_ids.max(initial=-1)) + 1
+    edge_codes, edge_idx = np.unique(
+        prev_community_ids * communities_count + community_ids, return_inverse=True
+    )
+    return (
+        edge_codes // communities_count,
+        edge_codes % communities_count,
+        np.bincount(edge_idx, weights=tokens_n, minlength=len(edge_codes)),
+        np.bincount(edge_idx, weights=chars_n, minlength=len(edge_codes)),
     )
-    with open(path, "w") as f:
-        json.dump(families, f)
 
 
 def get_cluster_law_names_counting_seqitems(preprocessed_mappings, communities):
@@ -204,7 +625,9 @@ def get_cluster_law_names_counting_seqitems(preprocessed_mappings, communities):
                 "_".join(community_node.split("_")[:-1])
                 for community_node in community_nodes
                 for _ in range(
-                    preprocessed_mappings["seqitem_counts"].get(community_node, 0)
+                    preprocessed_mappings["cluster_seqitem_counts"].get(
+                        community_node, 0
+                    )
                 )
             ]
         )
@@ -217,20 +640,20 @@ def check_mapping_files(mapping_files, snapshots, config, ending):
             mapping_file = f"{snapshot1}_{snapshot2}.json"
             if mapping_file not in mapping_files:
                 raise Exception(f"mapping {mapping_file} is missing")
-    elif ending == ".pickle":
+    elif ending == ".npz":
         for snapshot in snapshots:
-            mapping_file = f'{snapshot}_{config["pp_merge"]}.pickle'
+            mapping_file = f'{snapshot}_{config["pp_merge"]}.npz'
             if mapping_file not in mapping_files:
                 raise Exception(f"mapping {mapping_file} is missing")
     else:
-        raise Exception(f"Invalid ending '{ending}' (use '.json'|'.pickle')!")
+        raise Exception(f"Invalid ending '{ending}' (use '.json'|'.npz')!")
 
 
-def get_configs_no_overwrite(configs, existing_files):
+def get_configs_no_overwrite(configs, existing_files, file_ext=".gpickle.gz"):
     configs = [
         config
         for config in configs
-        if filename_for_pp_config(snapshot="all", **config, file_ext=".gpickle.gz")
+        if filename_for_pp_config(snapshot="all", **config, file_ext=file_ext)
         not in existing_files
     ]
     return configs
@@ -241,7 +664,7 @@ def get_config_clustering_files(config, source_folder):
     get all clusterings for a given config. (Multiple snapshots to be mapped)
     ::return filenames, snapshots
     """
-    existing_clustering = set(list_dir(source_folder, ".json"))
+    existing_clustering = set(list_clusterings(source_folder))
     config_filename_part = filename_for_pp_config(
         snapshot="", **config, file_ext=".json"
     )
@@ -264,7 +687,11 @@ def get_community_sizes(communities, node_sizes):
     return community_sizes
 
 
-def report_mapping_error(err, tokens_n_dict):
-    err_tokens_n = tokens_n_dict[err.args[0]]
-    if err_tokens_n:
-        print(err.args[0], "not found and has", err_tokens_n, "tokens")
+def report_mapping_error(key_idx, preprocessed_mappings):
+    err_tokens_n = preprocessed_mappings["tokens_n"][key_idx]
+    if err_tokens_n and not np.isnan(err_tokens_n):
+        log_event(
+            "mapped_node_not_found",
+            key=preprocessed_mappings["keys"][key_idx],
+            tokens_n=err_tokens_n,
+        )
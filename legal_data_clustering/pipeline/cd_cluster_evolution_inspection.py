@@ -1,148 +1,230 @@
 import os
 
-import networkx as nx
-from quantlaw.utils.files import ensure_exists, list_dir
-from quantlaw.utils.networkx import hierarchy_graph
+import pandas as pd
+from quantlaw.utils.files import ensure_exists
 
+from legal_data_clustering.pipeline.cd_cluster_evolution_graph import (
+    read_evolution_graph,
+    read_families,
+)
 from legal_data_clustering.utils.config_handling import get_configs
 from legal_data_clustering.utils.config_parsing import filename_for_pp_config
-from legal_data_clustering.utils.graph_api import cluster_families, get_heading_path
+from legal_data_clustering.utils.html_report import write_report
+from legal_data_clustering.utils.inspection_tables import (
+    inspection_file_exts,
+    write_inspection_table,
+)
+from legal_data_clustering.utils.snapshot_index import get_snapshot_index_loader
 
 source_file_ext = ".json"
 
+inspection_table_columns = [
+    "family",
+    "leading_cluster",
+    "cluster",
+    "year",
+    "leading",
+    "cluster_tokens_n",
+    "node",
+    "tokens_n",
+    "tokens_n_quote",
+    "document_type",
+    "heading_path",
+]
+
 
 def cd_cluster_evolution_inspection_prepare(
     overwrite,
     cluster_mapping_configs,
     source_folder,
-    crossreference_graph_folder,
     target_folder,
+    compress=False,
+    formats=("htm",),
 ):
     ensure_exists(target_folder)
 
     configs = get_configs(cluster_mapping_configs)
 
-    existing_files = set(list_dir(target_folder, ".htm"))
     if not overwrite:
+        existing_files = set(os.listdir(target_folder))
         configs = [
             config
             for config in configs
-            if filename_for_pp_config(snapshot="all", **config, file_ext=".htm")
-            not in existing_files
-        ]
-    if configs:
-        global cd_cluster_evolution_inspection_graphs
-        cd_cluster_evolution_inspection_graphs = {
-            f[: -len(".gpickle.gz")]: hierarchy_graph(
-                nx.read_gpickle(os.path.join(crossreference_graph_folder, f))
+            if not all(
+                filename_for_pp_config(snapshot="all", **config, file_ext=file_ext)
+                in existing_files
+                for file_ext in inspection_file_exts(formats, compress)
             )
-            for f in list_dir(crossreference_graph_folder, ".gpickle.gz")
-        }
+        ]
 
     return configs
 
 
-def cd_cluster_evolution_inspection(config, dataset, source_folder, target_folder):
-    global cd_cluster_evolution_inspection_graphs
+def cd_cluster_evolution_inspection(
+    config,
+    dataset,
+    source_folder,
+    target_folder,
+    crossreference_graph_folder,
+    snapshot_index_folder,
+    memory_limit=None,
+    page_size=None,
+    compress=False,
+    formats=("htm",),
+    family_threshold=0.15,
+):
+    """
+    :param memory_limit: maximal size of the snapshot indexes kept in memory
+        in bytes
+    :param page_size: number of families per report file. All in one file if None.
+    :param compress: write gzip compressed reports
+    :param formats: outputs to write. htm, csv and/or parquet
+    :param family_threshold: threshold of the families, see cluster_families
+    """
+    snapshot_indexes = get_snapshot_index_loader(
+        crossreference_graph_folder, snapshot_index_folder, memory_limit
+    )
     source_filename_base = filename_for_pp_config(snapshot="all", **config, file_ext="")
 
-    G = nx.read_gpickle(
-        os.path.join(source_folder, source_filename_base + ".gpickle.gz")
-    )
+    source_path_base = os.path.join(source_folder, source_filename_base)
+    G = read_evolution_graph(source_path_base)
 
-    families = cluster_families(G, 0.15)
-    destination = f"{target_folder}/{source_filename_base}.htm"
-    generate_inspection(G, families, destination)
-
-
-def generate_inspection(G, families, destination):
-    toc = "<h1>TOC</h1><table><th>Index</th><th>Leading cluster</th>\n"
-    for idx, family_nodes in enumerate(families[:100]):
-        toc += (
-            f"<tr>"
-            f'<td><a href="#idx_{idx}">Family {idx}</a></td>'
-            f"<td> – "
-            f'<a href="#leading_{family_nodes[0]}">{family_nodes[0]}</a>'
-            f"</td>"
-            f"</li>\n"
-        )
-    toc += "</table>\n\n"
-
-    content = "<h1>Content</h1>"
-    for idx, family_nodes in enumerate(families[:100]):
-        content += (
-            f"<h2>"
-            f'<a name="idx_{idx}"></a>'
-            f'<a href="#top">Family {idx} – {family_nodes[0]}</a>'
-            f"</h2>\n"
+    families = read_families(source_path_base, G, family_threshold)
+    inspection_table = get_inspection_table(G, families[:100], snapshot_indexes)
+    write_inspection_table(
+        inspection_table, os.path.join(target_folder, source_filename_base), formats
+    )
+    if "htm" in formats:
+        generate_inspection(
+            inspection_table,
+            target_folder,
+            source_filename_base,
+            page_size=page_size,
+            compress=compress,
         )
-        content += '<div style="padding: 0 40px">'
 
-        family_nodes_sorted = sorted(
-            family_nodes,
-            key=lambda x: (x.split("_")[0], family_nodes.index(x)),
-        )
 
-        content += "<i>"
-        for idx, cluster in enumerate(family_nodes_sorted):
-            if idx:
-                content += " | "
-            content += f'<a href="#leading_{cluster}">{cluster}</a>'
-        content += "</i>"
-        last_year = None
-        for cluster in family_nodes_sorted:
-            year = cluster.split("_")[0]
-            if last_year is not None and last_year != year:
-                content += "<hr>"
-            content += (
-                f"<h3>"
-                f'<a name="leading_{cluster}"></a>'
-                f'<a href="#top">{cluster}</a>'
-                f"</h3>\n"
+def get_inspection_table(G, families, snapshot_indexes):
+    """
+    Table with a row for each node of each cluster of each family.
+    Clusters are sorted by year and their position in the family.
+    The node data is looked up once per snapshot.
+    """
+    clusters = pd.DataFrame(
+        [
+            (family_idx, family_nodes[0], position, cluster)
+            for family_idx, family_nodes in enumerate(families)
+            for position, cluster in enumerate(family_nodes)
+        ],
+        columns=["family", "leading_cluster", "position", "cluster"],
+    )
+    clusters["year"] = clusters.cluster.str.split("_").str[0]
+    clusters["leading"] = clusters.position == 0
+    clusters["cluster_tokens_n"] = [G.nodes[c]["tokens_n"] for c in clusters.cluster]
+    clusters["node"] = [
+        G.nodes[c]["nodes_contained"].split(",") for c in clusters.cluster
+    ]
+    nodes = (
+        clusters.sort_values(["family", "year", "position"], kind="stable")
+        .explode("node")
+        .reset_index(drop=True)
+    )
+
+    node_data = pd.concat(
+        [
+            snapshot_indexes[year]
+            .loc[year_nodes.node, ["tokens_n", "document_type", "heading_path"]]
+            .set_index(year_nodes.index)
+            for year, year_nodes in nodes.groupby("year", sort=True)
+        ]
+    )
+    nodes = nodes.join(node_data)
+    nodes["tokens_n_quote"] = nodes.tokens_n / nodes.cluster_tokens_n * 100
+    return nodes[inspection_table_columns]
+
+
+def generate_inspection(
+    inspection_table,
+    target_folder,
+    filename_base,
+    page_size=None,
+    compress=False,
+):
+    families = inspection_table.groupby("family", sort=False)
+    leading_clusters = families.leading_cluster.first()
+
+    def toc(section_href):
+        yield "<h1>TOC</h1><table><th>Index</th><th>Leading cluster</th>\n"
+        for idx, leading_cluster in enumerate(leading_clusters):
+            href = section_href(idx)
+            yield (
+                f"<tr>"
+                f'<td><a href="{href}#idx_{idx}">Family {idx}</a></td>'
+                f"<td> – "
+                f'<a href="{href}#leading_{leading_cluster}">{leading_cluster}</a>'
+                f"</td>"
+                f"</li>\n"
             )
-            if cluster == family_nodes[0]:
-                content += "<i>LEADING</i>"
-            content += "<table>"
-            cluster_tokens_n = G.nodes[cluster]["tokens_n"]
-            for node in G.nodes[cluster]["nodes_contained"].split(","):
-
-                G_hierarchy = cd_cluster_evolution_inspection_graphs[year]
-                tokens_n_quote = (
-                    G_hierarchy.nodes[node]["tokens_n"] / cluster_tokens_n * 100
-                )
-                content += (
-                    '<tr><td style="text-align: right; padding-right: 2em;">'
-                    + f"{tokens_n_quote:.2f} %</td><td>"
-                    + G_hierarchy.nodes[node].get("document_type", "")
-                    + "</td><td>"
-                    + get_heading_path(G_hierarchy, node)
-                    + "</td></tr>"
-                )
-            content += "</table>"
-
-            last_year = year
-
-        content += "</div><hr>"
-    with open(destination, "w") as f:
-        f.write(
-            """<!DOCTYPE html>
-            <html>
-            <head>
-            <meta charset="utf-8"/>
-            <style>
-            td {
-                vertical-align:top;
-            }
-            body {
-                white-space: nowrap;
-                font-family: Arial, Helvetica, sans-serif;
-            }
-            </style>
-            </head>
-            <body>
-            <a name="top"></a>
-        """
+        yield "</table>\n\n"
+        yield "<h1>Content</h1>"
+
+    write_report(
+        target_folder,
+        filename_base,
+        (family_section(idx, family_rows) for idx, family_rows in families),
+        len(leading_clusters),
+        page_size=page_size,
+        compress=compress,
+        toc=toc,
+    )
+
+
+def family_section(idx, family_rows):
+    leading_cluster = family_rows.leading_cluster.iat[0]
+    yield (
+        f"<h2>"
+        f'<a name="idx_{idx}"></a>'
+        f'<a href="#top">Family {idx} – {leading_cluster}</a>'
+        f"</h2>\n"
+    )
+    yield '<div style="padding: 0 40px">'
+
+    yield "<i>"
+    yield " | ".join(
+        f'<a href="#leading_{cluster}">{cluster}</a>'
+        for cluster in family_rows.cluster.unique()
+    )
+    yield "</i>"
+    last_year = None
+    for (year, cluster), cluster_rows in family_rows.groupby(
+        ["year", "cluster"], sort=False
+    ):
+        if last_year is not None and last_year != year:
+            yield "<hr>"
+        yield (
+            f"<h3>"
+            f'<a name="leading_{cluster}"></a>'
+            f'<a href="#top">{cluster}</a>'
+            f"</h3>\n"
         )
-        f.write(toc)
-        f.write(content)
-        f.write("</body></html>")
+        if cluster_rows.leading.iat[0]:
+            yield "<i>LEADING</i>"
+        yield "<table>"
+        for tokens_n_quote, document_type, heading_path in zip(
+            cluster_rows.tokens_n_quote,
+            cluster_rows.document_type,
+            cluster_rows.heading_path,
+        ):
+            yield (
+                '<tr><td style="text-align: right; padding-right: 2em;">'
+                + f"{tokens_n_quote:.2f} %</td><td>"
+                + document_type
+                + "</td><td>"
+                + heading_path
+                + "</td></tr>"
+            )
+        yield "</table>"
+
+        last_year = year
+
+    yield "</div><hr>"
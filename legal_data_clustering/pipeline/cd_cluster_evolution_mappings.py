@@ -1,5 +1,5 @@
+import json
 import os
-import pickle
 import re
 from collections import Counter
 
@@ -7,9 +7,21 @@ import networkx as nx
 import pandas as pd
 from quantlaw.utils.files import ensure_exists, list_dir
 
+from legal_data_clustering.utils.atomic_files import atomic_path
+from legal_data_clustering.utils.instrumentation import log_event, phase
+from legal_data_clustering.utils.snapshot_tables import (
+    encode_snapshot_mapping,
+    write_snapshot_mapping,
+    write_snapshot_mapping_table,
+)
+
 
 def filename_for_mapping(mapping):
-    return f'{mapping["snapshot"]}_{mapping["pp_merge"]}.pickle'
+    return f'{mapping["snapshot"]}_{mapping["pp_merge"]}.npz'
+
+
+def filename_for_snapshot_mapping(prev_snapshot, snapshot):
+    return f"{prev_snapshot}_{snapshot}.mapping.npz"
 
 
 def cd_cluster_evolution_mappings_prepare(
@@ -34,7 +46,7 @@ def cd_cluster_evolution_mappings_prepare(
         for subseqitems_snapshot in subseqitems_snapshots
     ]
 
-    existing_files = set(list_dir(target_folder, ".pickle"))
+    existing_files = set(list_dir(target_folder, ".npz"))
     if not overwrite:
         mappings = [
             mapping
@@ -62,68 +74,135 @@ def cd_cluster_evolution_mappings(
         ]
     )
     if len(filenames) > 1:
-        print("Found multiple matching preprocessed graphs. Taking", filenames[0])
+        log_event(
+            "multiple_preprocessed_graphs", filenames=filenames, taken=filenames[0]
+        )
     elif not filenames:
         raise Exception("Not preprocessed graphs found for", pattern)
     filename = filenames[0]
 
-    G = nx.read_gpickle(os.path.join(preprocessed_graph_folder, filename))
-    cluster_level_nodes = set(G.nodes())
-    del G
+    with phase("load"):
+        G = nx.read_gpickle(os.path.join(preprocessed_graph_folder, filename))
+        cluster_level_nodes = set(G.nodes())
+        del G
 
-    df_nodes = pd.read_csv(
-        os.path.join(source_folder, item["snapshot"] + ".nodes.csv.gz"),
-        dtype={"texts_tokens_n": str, "texts_chars_n": str},
-    )
-    df_edges = pd.read_csv(
-        os.path.join(source_folder, item["snapshot"] + ".edges.csv.gz")
-    )
+        df_nodes = pd.read_csv(
+            os.path.join(source_folder, item["snapshot"] + ".nodes.csv.gz"),
+            dtype={"texts_tokens_n": str, "texts_chars_n": str},
+        )
+        df_edges = pd.read_csv(
+            os.path.join(source_folder, item["snapshot"] + ".edges.csv.gz")
+        )
     containment_edges = df_edges[df_edges.edge_type == "containment"]
     parents = {v: u for v, u in zip(containment_edges.v, containment_edges.u)}
 
-    items_mapping = {k: [] for k in cluster_level_nodes}
+    cluster_keys = sorted(cluster_level_nodes)
+    cluster_key_idx = {k: idx for idx, k in enumerate(cluster_keys)}
 
-    for key in df_nodes.key:
-        contracted_to = get_contracted_node(key, parents, cluster_level_nodes)
-        if contracted_to:
-            items_mapping[contracted_to].append(key)
+    contracted_to = [
+        cluster_key_idx.get(get_contracted_node(key, parents, cluster_level_nodes), -1)
+        for key in df_nodes.key
+    ]
 
     node_seqitem_counts = Counter(
-        get_contracted_node(key, parents, cluster_level_nodes)
-        for key in df_nodes[df_nodes.type == "seqitem"].key
+        idx
+        for idx, node_type in zip(contracted_to, df_nodes.type)
+        if node_type == "seqitem" and idx != -1
     )
-    node_seqitem_counts = dict(node_seqitem_counts)
+    seqitem_counts = [node_seqitem_counts[idx] for idx in range(len(cluster_keys))]
 
-    tokens_n = {k: v for k, v in zip(df_nodes.key, df_nodes.tokens_n) if not pd.isna(v)}
-    chars_n = {k: v for k, v in zip(df_nodes.key, df_nodes.chars_n) if not pd.isna(v)}
     # Details of the size of the children if a child of a node is a text and
     # the node has more than one child
-    texts_tokens_n = {
-        k: list(map(int, v.split(",")))
-        for k, v in zip(df_nodes.key, df_nodes.texts_tokens_n)
-        if not pd.isna(v)
-    }
-    texts_chars_n = {
-        k: list(map(int, v.split(",")))
-        for k, v in zip(df_nodes.key, df_nodes.texts_chars_n)
-        if not pd.isna(v)
-    }
-    document_type = {
-        k: v for k, v in zip(df_nodes.key, df_nodes.document_type) if not pd.isna(v)
-    }
-
-    prepared_data = dict(
-        items_mapping=items_mapping,
-        tokens_n=tokens_n,
-        chars_n=chars_n,
-        seqitem_counts=node_seqitem_counts,
-        texts_tokens_n=texts_tokens_n,
-        texts_chars_n=texts_chars_n,
-        document_type=document_type,
+    texts_tokens_n = [
+        None if pd.isna(v) else list(map(int, v.split(",")))
+        for v in df_nodes.texts_tokens_n
+    ]
+    texts_chars_n = [
+        None if pd.isna(v) else list(map(int, v.split(",")))
+        for v in df_nodes.texts_chars_n
+    ]
+    document_type = [None if pd.isna(v) else v for v in df_nodes.document_type]
+
+    with phase("write"), atomic_path(
+        os.path.join(target_folder, filename_for_mapping(item))
+    ) as path:
+        write_snapshot_mapping_table(
+            path,
+            keys=list(df_nodes.key),
+            cluster_keys=cluster_keys,
+            contracted_to=contracted_to,
+            seqitem_counts=seqitem_counts,
+            tokens_n=df_nodes.tokens_n.astype(float),
+            chars_n=df_nodes.chars_n.astype(float),
+            texts_tokens_n=texts_tokens_n,
+            texts_chars_n=texts_chars_n,
+            document_type=document_type,
+        )
+
+
+def cd_cluster_evolution_snapshot_mappings_prepare(
+    overwrite, source_folder, snapshot_mapping_folder, target_folder, snapshots
+):
+    """
+    Get the pairs of consecutive snapshots whose mapping must be encoded.
+    """
+    ensure_exists(target_folder)
+
+    subseqitems_snapshots = sorted(
+        f.split(".")[0] for f in list_dir(f"{source_folder}/", ".edges.csv.gz")
     )
+    if snapshots:
+        subseqitems_snapshots = [s for s in subseqitems_snapshots if s in snapshots]
+
+    mapping_files = set(list_dir(snapshot_mapping_folder, ".json"))
+    items = [
+        dict(prev_snapshot=prev_snapshot, snapshot=snapshot)
+        for prev_snapshot, snapshot in zip(
+            subseqitems_snapshots[:-1], subseqitems_snapshots[1:]
+        )
+        if f"{prev_snapshot}_{snapshot}.json" in mapping_files
+    ]
+
+    existing_files = set(list_dir(target_folder, ".mapping.npz"))
+    if not overwrite:
+        items = [
+            item
+            for item in items
+            if filename_for_snapshot_mapping(**item) not in existing_files
+        ]
+
+    return items
+
+
+def cd_cluster_evolution_snapshot_mappings(
+    item, source_folder, snapshot_mapping_folder, target_folder
+):
+    """
+    Convert the json mapping between two snapshots into integer coded arrays
+    referencing the keys in the order of the nodes csv files.
+    """
+    prev_keys, keys = [
+        pd.read_csv(
+            os.path.join(source_folder, snapshot + ".nodes.csv.gz"), usecols=["key"]
+        ).key
+        for snapshot in (item["prev_snapshot"], item["snapshot"])
+    ]
+    with open(
+        os.path.join(
+            snapshot_mapping_folder,
+            f'{item["prev_snapshot"]}_{item["snapshot"]}.json',
+        )
+    ) as f:
+        mapping = json.load(f)
+
+    encoded_mapping, missing_leaves = encode_snapshot_mapping(mapping, prev_keys, keys)
+    for leaf in missing_leaves:
+        log_event("leaf_not_found", leaf=leaf)
 
-    with open(os.path.join(target_folder, filename_for_mapping(item)), "wb") as f:
-        pickle.dump(prepared_data, f)
+    with atomic_path(
+        os.path.join(target_folder, filename_for_snapshot_mapping(**item))
+    ) as path:
+        write_snapshot_mapping(path, encoded_mapping)
 
 
 def get_contracted_node(node, parents, cluster_level_nodes):
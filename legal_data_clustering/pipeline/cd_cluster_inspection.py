@@ -1,24 +1,51 @@
-from quantlaw.utils.files import ensure_exists, list_dir
+import os
 
+import numpy as np
+import pandas as pd
+from quantlaw.utils.files import ensure_exists
+
+from legal_data_clustering.utils.clustering_tables import (
+    list_clusterings,
+    read_clustering,
+)
 from legal_data_clustering.utils.config_handling import get_configs_for_snapshots
 from legal_data_clustering.utils.config_parsing import filename_for_pp_config
-from legal_data_clustering.utils.graph_api import (
-    get_clustering_result,
-    get_heading_path,
-    hierarchy_graph,
+from legal_data_clustering.utils.html_report import write_report
+from legal_data_clustering.utils.inspection_tables import (
+    inspection_file_exts,
+    write_inspection_table,
 )
+from legal_data_clustering.utils.snapshot_index import get_snapshot_index_loader
 
 source_file_ext = ".json"
 
+inspection_table_columns = [
+    "community_rank",
+    "community",
+    "community_tokens_n",
+    "community_tokens_n_quote",
+    "node",
+    "tokens_n",
+    "tokens_n_quote",
+    "document_type",
+    "heading_path",
+]
+
 
 def cd_cluster_inspection_prepare(
-    overwrite, snapshots, meta_config, source_folder, target_folder
+    overwrite,
+    snapshots,
+    meta_config,
+    source_folder,
+    target_folder,
+    compress=False,
+    formats=("htm",),
 ):
     ensure_exists(target_folder)
     items = get_configs_for_snapshots(snapshots, meta_config)
 
     # Check if source graphs exist
-    existing_source_files = set(list_dir(source_folder, source_file_ext))
+    existing_source_files = set(list_clusterings(source_folder))
     required_source_files = {
         filename_for_pp_config(**item, file_ext=source_file_ext) for item in items
     }
@@ -29,11 +56,14 @@ def cd_cluster_inspection_prepare(
         )
 
     if not overwrite:
-        existing_files = list_dir(target_folder, ".htm")
+        existing_files = set(os.listdir(target_folder))
         items = [
             item
             for item in items
-            if filename_for_pp_config(**item, file_ext=".htm") not in existing_files
+            if not all(
+                filename_for_pp_config(**item, file_ext=file_ext) in existing_files
+                for file_ext in inspection_file_exts(formats, compress)
+            )
         ]
 
     return items
@@ -41,83 +71,126 @@ def cd_cluster_inspection_prepare(
 
 def cd_cluster_inspection(
     config,
-    dataset,
     source_folder,
     target_folder,
-    regulations,
+    crossreference_graph_folder,
+    snapshot_index_folder,
+    memory_limit=None,
+    page_size=None,
+    compress=False,
+    formats=("htm",),
 ):
+    """
+    :param memory_limit: maximal size of the snapshot indexes kept in memory
+        in bytes
+    :param page_size: number of communities per report file. All in one file if None.
+    :param compress: write gzip compressed reports
+    :param formats: outputs to write. htm, csv and/or parquet
+    """
+    snapshot_indexes = get_snapshot_index_loader(
+        crossreference_graph_folder, snapshot_index_folder, memory_limit
+    )
     source_filename_base = filename_for_pp_config(**config, file_ext="")
 
-    clustering = get_clustering_result(
-        f"{source_folder}/{source_filename_base}{source_file_ext}",
-        dataset,
-        graph_type="seqitems",
-        regulations=regulations,
+    clustering = read_clustering(
+        os.path.join(source_folder, source_filename_base + source_file_ext)
+    )
+    inspection_table = get_inspection_table(
+        clustering.communities, snapshot_indexes[config["snapshot"]]
     )
+    write_inspection_table(
+        inspection_table, os.path.join(target_folder, source_filename_base), formats
+    )
+    if "htm" in formats:
+        generate_inspection(
+            inspection_table,
+            target_folder,
+            source_filename_base,
+            page_size=page_size,
+            compress=compress,
+        )
 
-    content = """<!DOCTYPE html>
-        <html>
-        <head>
-        <meta charset="utf-8"/>
-        <style>
-        td {
-            vertical-align:top;
-        }
-        body {
-            white-space: nowrap;
-            font-family: Arial, Helvetica, sans-serif;
-        }
-        </style>
-        </head>
-        <body>
+
+def get_inspection_table(communities, snapshot_index):
+    """
+    Table with a row for each node of each community.
+    Communities are sorted by their number of tokens, nodes within a community as
+    well.
     """
+    nodes = pd.DataFrame(
+        dict(
+            community=np.repeat(
+                np.arange(len(communities)), [len(c) for c in communities]
+            ),
+            node=[n for c in communities for n in c],
+        )
+    )
+    nodes = nodes.join(
+        snapshot_index.loc[
+            nodes.node, ["tokens_n", "document_type", "heading_path"]
+        ].reset_index(drop=True)
+    )
+
+    community_tokens_n = nodes.groupby("community").tokens_n.sum()
+    community_ranks = pd.Series(
+        np.arange(1, len(community_tokens_n) + 1),
+        index=community_tokens_n.sort_values(ascending=False, kind="stable").index,
+    )
+    nodes["community_rank"] = nodes.community.map(community_ranks)
+    nodes["community_tokens_n"] = nodes.community.map(community_tokens_n)
+    nodes["community_tokens_n_quote"] = (
+        nodes.community_tokens_n / community_tokens_n.sum() * 100
+    )
+    nodes["tokens_n_quote"] = (
+        nodes.tokens_n / nodes.community_tokens_n.where(nodes.community_tokens_n != 0)
+    ) * 100
+
+    nodes = nodes.sort_values(
+        ["community_rank", "tokens_n"], ascending=[True, False], kind="stable"
+    )
+    return nodes[inspection_table_columns].reset_index(drop=True)
 
-    community_tokens_n = [
-        sum(clustering.graph.nodes[n].get("tokens_n", 0) for n in nodes)
-        for nodes in clustering.communities
-    ]
 
-    G_hierarchy = hierarchy_graph(clustering.graph)
+def generate_inspection(
+    inspection_table, target_folder, filename_base, page_size=None, compress=False
+):
+    communities = inspection_table.groupby("community_rank", sort=False)
+    write_report(
+        target_folder,
+        filename_base,
+        (community_section(community_rows) for _, community_rows in communities),
+        communities.ngroups,
+        page_size=page_size,
+        compress=compress,
+    )
 
-    corpus_tokens_n = sum(community_tokens_n)
 
-    for idx_by_size, (community_id, tokens_n) in enumerate(
-        sorted(enumerate(community_tokens_n), key=lambda x: -x[-1])
+def community_section(community_rows):
+    community_rank = community_rows.community_rank.iat[0]
+    community_id = community_rows.community.iat[0]
+    tokens_n = community_rows.community_tokens_n.iat[0]
+    community_tokens_n_quote = community_rows.community_tokens_n_quote.iat[0]
+    yield (
+        f"<h3>"
+        f"{community_rank} | "
+        f"Community {community_id} | "
+        f"{tokens_n} Tokens | "
+        f"{community_tokens_n_quote:.1f} %"
+        f"</h3>"
+    )
+    yield "<table><th>Tokens [%]</th><th>Type</th><th>Heading path</th>"
+    for node_tokens_n_quote, document_type, heading_path in zip(
+        community_rows.tokens_n_quote,
+        community_rows.document_type,
+        community_rows.heading_path,
     ):
-        content += (
-            f"<h3>"
-            f"{idx_by_size+1} | "
-            f"Community {community_id} | "
-            f"{tokens_n} Tokens | "
-            f"{tokens_n/corpus_tokens_n*100:.1f} %"
-            f"</h3>"
-        )
-        content += "<table><th>Tokens [%]</th><th>Type</th><th>Heading path</th>"
-        data = sorted(
-            [
-                (
-                    clustering.graph.nodes[n].get("tokens_n", 0),
-                    clustering.graph.nodes[n].get("document_type", ""),
-                    get_heading_path(G_hierarchy, n),
-                )
-                for n in clustering.communities[community_id]
-            ],
-            key=lambda x: -x[0],
+        node_tokens_n_quotient = f"{node_tokens_n_quote:.2f}" if tokens_n else "-"
+        yield (
+            f"<tr>"
+            f'<td style="text-align: right; padding-right: 2em">'
+            f"{node_tokens_n_quotient}</td>"
+            f"<td>{document_type}</td>"
+            f"<td>{heading_path}</td>"
+            f"</tr>"
         )
-        for node_tokens_n, document_type, heading_path in data:
-            node_tokens_n_quotient = (
-                f"{node_tokens_n/tokens_n*100:.2f}" if tokens_n else "-"
-            )
-            content += (
-                f"<tr>"
-                f'<td style="text-align: right; padding-right: 2em">'
-                f"{node_tokens_n_quotient}</td>"
-                f"<td>{document_type}</td>"
-                f"<td>{heading_path}</td>"
-                f"</tr>"
-            )
-        content += "</table>"
-    content += "</body></html>"
-
-    with open(f"{target_folder}/{source_filename_base}.htm", "w") as f:
-        f.write(content)
+    yield "</table>"
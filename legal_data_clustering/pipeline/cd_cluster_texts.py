@@ -1,9 +1,12 @@
 import os
 import re
+from functools import partial
 
 from lxml import etree
 from quantlaw.utils.files import ensure_exists, list_dir
 
+from legal_data_clustering.utils.atomic_files import atomic_path
+from legal_data_clustering.utils.clustering_tables import list_clusterings
 from legal_data_clustering.utils.config_handling import (
     check_for_missing_files,
     get_configs_for_snapshots,
@@ -11,6 +14,7 @@ from legal_data_clustering.utils.config_handling import (
 )
 from legal_data_clustering.utils.config_parsing import filename_for_pp_config
 from legal_data_clustering.utils.graph_api import get_clustering_result
+from legal_data_clustering.utils.prefetch import prefetch
 
 source_file_ext = ".json"
 
@@ -22,7 +26,7 @@ def cd_cluster_texts_prepare(
     items = get_configs_for_snapshots(snapshots, pp_configs)
 
     # Check if source graphs exist
-    existing_source_files = set(list_dir(source_folder, source_file_ext))
+    existing_source_files = set(list_clusterings(source_folder))
     required_source_files = {
         filename_for_pp_config(**item, file_ext=source_file_ext) for item in items
     }
@@ -51,7 +55,6 @@ def cd_cluster_texts(
         graph_type="clustering",
         regulations=regulations,
     )
-    result_path = ensure_exists(f"{target_folder}/{source_filename_base}")
 
     reference_parsed_files = {
         os.path.splitext(f)[0]: f
@@ -74,52 +77,89 @@ def cd_cluster_texts(
         ]
     ) == len(reference_parsed_files)
 
-    for idx, community_nodes in enumerate(clustering.communities):
-        community_text = get_community_text(
-            community_nodes, reference_parsed_folders, reference_parsed_files
-        )
-        write_community_text(result_path, idx, community_text)
+    # Parse the files of the next communities while a community is processed
+    trees = prefetch(
+        partial(parse_reference_parsed_file, reference_parsed_folders, filename)
+        for community_nodes in clustering.communities
+        for filename in get_community_files(community_nodes, reference_parsed_files)
+    )
+
+    # The folder appears when all texts are written
+    with atomic_path(f"{target_folder}/{source_filename_base}") as result_path:
+        ensure_exists(result_path)
+        for idx, community_nodes in enumerate(clustering.communities):
+            community_text = get_community_text(
+                community_nodes,
+                reference_parsed_folders,
+                reference_parsed_files,
+                trees=trees,
+            )
+            write_community_text(result_path, idx, community_text)
 
 
 remove_cfr_volume = re.compile(r"v\d+_")
 
 
+def get_node_filename(node):
+    node_filename = "_".join(node.split("_")[:-1])
+    # remove volumes from cfr keys
+    if node_filename.startswith("cfr"):
+        node_filename = remove_cfr_volume.sub("_", node_filename)
+    return node_filename
+
+
+def get_community_files(community_nodes, reference_parsed_files):
+    """
+    :return: the files get_community_text parses for a community in this order
+    """
+    filenames = []
+    for node in sorted(community_nodes):
+        filename = reference_parsed_files[get_node_filename(node)]
+        if not filenames or filenames[-1] != filename:
+            filenames.append(filename)
+    return filenames
+
+
+def parse_reference_parsed_file(reference_parsed_folders, filename):
+    # try to find the file in a reference_parsed_folder
+    for reference_parsed_folder in reference_parsed_folders:
+        try:
+            return etree.parse(os.path.join(reference_parsed_folder, filename))
+        except OSError:
+            if reference_parsed_folder == reference_parsed_folders[-1]:
+                # Last element
+                raise
+
+
 def get_community_text(
-    community_nodes, reference_parsed_folders, reference_parsed_files
+    community_nodes, reference_parsed_folders, reference_parsed_files, trees=None
 ):
+    """
+    :param trees: iterator of the parsed files in the order of get_community_files.
+        If None, the files are parsed when needed.
+    """
     loaded_file_name = None
     loaded_file_tree = None
     community_text = ""
     for node in sorted(community_nodes):
-        node_filename = "_".join(node.split("_")[:-1])
-        # remove volumes from cfr keys
-        if node_filename.startswith("cfr"):
-            node_filename = remove_cfr_volume.sub("_", node_filename)
-
-        if loaded_file_name != node_filename:
-            community_text += "\n\n\n" + node_filename + "\n\n"
+        node_filename = get_node_filename(node)
+        community_text += "\n\n\n" + node_filename + "\n\n"
 
+        # Consecutive nodes of a file are looked up in the same tree
+        if loaded_file_name != reference_parsed_files[node_filename]:
             loaded_file_name = reference_parsed_files[node_filename]
-
-            # try to find the file in a reference_parsed_folder
-            for reference_parsed_folder in reference_parsed_folders:
-                try:
-
-                    loaded_file_tree = etree.parse(
-                        os.path.join(reference_parsed_folder, loaded_file_name)
-                    )
-                    break
-                except OSError:
-                    if reference_parsed_folder == reference_parsed_folders[-1]:
-                        # Last element
-                        raise
+            loaded_file_tree = (
+                next(trees)
+                if trees is not None
+                else parse_reference_parsed_file(
+                    reference_parsed_folders, loaded_file_name
+                )
+            )
         elem = loaded_file_tree.find(f"//*[@key='{node}']")
         if elem is None:
             elem = loaded_file_tree.getroot()
-            assert elem.attrib['key'] == node
-        tag_text_generator = get_descendants_texts(
-            elem
-        )
+            assert elem.attrib["key"] == node
+        tag_text_generator = get_descendants_texts(elem)
         tag_text = " ".join(tag_text_generator)
         community_text += tag_text + " "
     return community_text
@@ -8,13 +8,27 @@ import pandas as pd
 from quantlaw.utils.files import ensure_exists, list_dir
 from quantlaw.utils.networkx import decay_function, sequence_graph
 
+from legal_data_clustering.utils.artifacts import (
+    graph_content_hash,
+    link_aliases,
+    link_identical_artifacts,
+    record_artifacts,
+)
+from legal_data_clustering.utils.atomic_files import atomic_path
 from legal_data_clustering.utils.config_handling import (
+    canonical_pp_config,
     check_for_missing_files,
+    get_equivalent_items,
     get_no_overwrite_items,
 )
 from legal_data_clustering.utils.config_parsing import filename_for_pp_config
 from legal_data_clustering.utils.graph_api import quotient_decision_graph
-from legal_data_clustering.utils.nodes_merging import quotient_graph_with_merge
+from legal_data_clustering.utils.instrumentation import log_event, phase
+from legal_data_clustering.utils.nodes_merging import (
+    get_graph_edges_order,
+    quotient_graph_from_tables,
+)
+from legal_data_clustering.utils.prefetch import read_table
 
 target_file_ext = ".gpickle.gz"
 
@@ -39,17 +53,50 @@ def cd_preprocessing_prepare(
         for pp_co_occurrence in pp_configs["pp_co_occurrences"]
         for pp_co_occurrence_type in pp_configs["pp_co_occurrence_types"]
     ]
+    # Equivalent configs are linked to the graph of the first of them
+    items, aliases = get_equivalent_items(items, canonical_pp_config)
 
-    # Check if source graphs exist
-    existing_source_files = set(list_dir(f"{source_folder}/seqitems", ".gpickle.gz"))
-    required_source_files = {f"{snapshot}.gpickle.gz" for snapshot in snapshots}
-    check_for_missing_files(required_source_files, existing_source_files, "graphs")
+    # Check if source tables exist
+    existing_source_files = set(list_dir(source_folder, ".csv.gz"))
+    required_source_files = {
+        f"{snapshot}.{table}.csv.gz"
+        for snapshot in snapshots
+        for table in ["nodes", "edges"]
+    }
+    check_for_missing_files(required_source_files, existing_source_files, "tables")
 
     if not overwrite:
         existing_files = list_dir(target_folder, target_file_ext)
         items = get_no_overwrite_items(items, target_file_ext, existing_files)
+        aliases = [
+            (item, alias_of)
+            for item, alias_of in aliases
+            if filename_for_pp_config(**item, file_ext=target_file_ext)
+            not in existing_files
+        ]
 
-    return items
+    return items, aliases
+
+
+def cd_preprocessing_link_artifacts(logs, aliases, target_folder):
+    """
+    Record the content hashes of the written graphs and link graphs of equivalent
+    configs and identical graphs.
+    :param logs: results of cd_preprocessing
+    :param aliases: aliases returned by cd_preprocessing_prepare
+    """
+    record_artifacts(target_folder, [log for log in logs if log])
+    link_aliases(
+        target_folder,
+        [
+            (
+                filename_for_pp_config(**item, file_ext=target_file_ext),
+                filename_for_pp_config(**alias_of, file_ext=target_file_ext),
+            )
+            for item, alias_of in aliases
+        ],
+    )
+    link_identical_artifacts(target_folder)
 
 
 def get_decision_network(path):
@@ -64,8 +111,42 @@ def get_decision_network(path):
     return get_decision_network._cache[path]
 
 
+def cd_preprocessing_input_paths(config, source_folder, *args):
+    return [
+        f"{source_folder}/{config['snapshot']}.nodes.csv.gz",
+        f"{source_folder}/{config['snapshot']}.edges.csv.gz",
+    ]
+
+
+def load_crossreference_tables(nodes_path, edges_path):
+    """
+    Load the nodes and edges of a crossreference graph like
+    load_graph_from_csv_files: without subseqitems and without authority edges.
+    :return: the nodes table and the edges table in the order of the edges of the
+        graph with the positions of the nodes in the nodes table as u and v
+    """
+    nodes = read_table(nodes_path)
+    nodes = nodes[(nodes.type != "subseqitem").to_numpy()].reset_index(drop=True)
+
+    edges = read_table(edges_path, usecols=["u", "v", "edge_type"])
+    node_positions = pd.Index(nodes.key)
+    u = node_positions.get_indexer(edges.u)
+    v = node_positions.get_indexer(edges.v)
+    edge_types = edges.edge_type.to_numpy()
+    mask = (u != -1) & (v != -1)
+    u, v, edge_types = u[mask], v[mask], edge_types[mask]
+
+    # Authority edges are removed after the edges are ordered, as they affect the
+    # order of the adjacency of a loaded graph
+    order = get_graph_edges_order(u, v)
+    order = order[edge_types[order] != "authority"]
+    edges = pd.DataFrame(dict(u=u[order], v=v[order], edge_type=edge_types[order]))
+
+    return nodes, edges
+
+
 def cd_preprocessing(config, source_folder, target_folder, decision_network_path):
-    source_path = f"{source_folder}/seqitems/{config['snapshot']}.gpickle.gz"
+    nodes_path, edges_path = cd_preprocessing_input_paths(config, source_folder)
     graph_target_path = (
         f"{target_folder}/{filename_for_pp_config(**config, file_ext=target_file_ext)}"
     )
@@ -76,37 +157,36 @@ def cd_preprocessing(config, source_folder, target_folder, decision_network_path
 
     seq_decay_func = decay_function(config["pp_decay"])
 
-    G = nx.read_gpickle(source_path)
-
-    # Remove authority edges
-    G.remove_edges_from(
-        [
-            (u, v, k)
-            for u, v, k, d in G.edges(keys=True, data="edge_type")
-            if d == "authority"
-        ]
-    )
+    with phase("load"):
+        nodes, edges = load_crossreference_tables(nodes_path, edges_path)
 
-    mqG, nodes_mapping = quotient_graph_with_merge(
-        G, merge_threshold=config["pp_merge"]
-    )
+    with phase("contract"):
+        mqG, nodes_mapping = quotient_graph_from_tables(
+            config["snapshot"], nodes, edges, merge_threshold=config["pp_merge"]
+        )
 
-    smqG = sequence_graph(
-        mqG, seq_decay_func=seq_decay_func, seq_ref_ratio=config["pp_ratio"]
-    )
+    with phase("sequence"):
+        smqG = sequence_graph(
+            mqG, seq_decay_func=seq_decay_func, seq_ref_ratio=config["pp_ratio"]
+        )
 
-    check_missing_edges(mqG, smqG)
+        check_missing_edges(mqG, smqG)
 
     if config["pp_co_occurrence"] != 0:
-        missing_nodes = add_co_occurrences(
-            config, smqG, G, nodes_mapping, decision_network_path
-        )
+        with phase("co_occurrence"):
+            citekeys = (
+                dict(nodes.set_index("key").citekey.dropna())
+                if "citekey" in nodes
+                else {}
+            )
+            missing_nodes = add_co_occurrences(
+                config, smqG, citekeys, nodes_mapping, decision_network_path
+            )
 
-        pd.DataFrame(
-            list(missing_nodes.items()), columns=["missing_node", "count"]
-        ).sort_values("count", ascending=False).to_csv(
-            missing_nodes_target_path, index=False
-        )
+            with atomic_path(missing_nodes_target_path) as path:
+                pd.DataFrame(
+                    list(missing_nodes.items()), columns=["missing_node", "count"]
+                ).sort_values("count", ascending=False).to_csv(path, index=False)
 
     if config["pp_co_occurrence"] == -1:
         edges_to_remove = [
@@ -116,7 +196,12 @@ def cd_preprocessing(config, source_folder, target_folder, decision_network_path
         ]
         smqG.remove_edges_from(edges_to_remove)
 
-    nx.write_gpickle(smqG, graph_target_path)
+    with phase("write"):
+        content_hash = graph_content_hash(smqG)
+        with atomic_path(graph_target_path) as path:
+            nx.write_gpickle(smqG, path)
+
+    return dict(file=os.path.basename(graph_target_path), content_hash=content_hash)
 
 
 def check_missing_edges(mqG, smqG):
@@ -144,7 +229,7 @@ def simplify_citekey(citekey):
         return citekey
 
 
-def add_co_occurrences(config, G, G_orig, nodes_mapping, decision_network_path):
+def add_co_occurrences(config, G, citekeys, nodes_mapping, decision_network_path):
     C = get_decision_network(decision_network_path)
     cooccurrence_weight = (
         config["pp_co_occurrence"] if config["pp_co_occurrence"] > 0 else 1
@@ -165,18 +250,18 @@ def add_co_occurrences(config, G, G_orig, nodes_mapping, decision_network_path):
         v: k for k, v in nx.get_node_attributes(G, "citekey").items() if v
     }
     for k, v in nodes_mapping.items():
-        if "citekey" in G_orig.nodes[k]:
-            citekey = G_orig.nodes[k]["citekey"]
+        if k in citekeys:
+            citekey = citekeys[k]
             simplified_citekey = simplify_citekey(citekey)
             if (
                 simplified_citekey in nodes_citekey_mapping
                 and nodes_citekey_mapping[simplified_citekey] != v
             ):
-                print(
-                    "Conflict:",
-                    simplified_citekey,
-                    nodes_citekey_mapping[simplified_citekey],
-                    v,
+                log_event(
+                    "citekey_conflict",
+                    citekey=simplified_citekey,
+                    node=nodes_citekey_mapping[simplified_citekey],
+                    other_node=v,
                 )
             nodes_citekey_mapping[simplified_citekey] = v
 
@@ -247,11 +332,10 @@ def add_co_occurrences(config, G, G_orig, nodes_mapping, decision_network_path):
         )
 
         cooccurrence_factor = total_weight_reference / total_weight_cooccurrence
-        print(
+        log_event(
             "cooccurrence_factor",
-            cooccurrence_factor,
-            "for",
-            filename_for_pp_config(**config, file_ext=""),
+            value=cooccurrence_factor,
+            config=filename_for_pp_config(**config, file_ext=""),
         )
 
         for u, v, k, edge_type in G.edges(keys=True, data="edge_type"):
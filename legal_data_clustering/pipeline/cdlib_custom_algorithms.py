@@ -7,6 +7,8 @@ from cdlib import NodeClustering
 from cdlib.utils import convert_graph_formats
 from community import generate_dendrogram, partition_at_level
 
+from legal_data_clustering.utils.cpu_budget import get_thread_limit
+
 
 def infomap(
     g,
@@ -16,6 +18,7 @@ def infomap(
     number_of_modules=None,
     return_tree=False,
     directed=False,
+    network=None,
 ):
     """
     Infomap is based on ideas of information theory.
@@ -34,6 +37,9 @@ def infomap(
                         the algorithm (default: False)
     :param directed: whether to treat a directed graph as directed
                      (default: False)
+    :param network: network of g returned by build_infomap_network with the
+                    same options and directed, to reuse it for several seeds
+                    and markov times (default: None)
     :return: NodeClustering object
 
     :Example:
@@ -60,22 +66,24 @@ def infomap(
 
     g = convert_graph_formats(g, nx.Graph)
 
-    g1 = nx.convert_node_labels_to_integers(g, label_attribute="name")
-    name_map = nx.get_node_attributes(g1, "name")
-    coms_to_node = defaultdict(list)
-
-    options_compiled = options + f" --markov-time {markov_time}"
+    run_options = f"--markov-time {markov_time}"
     if number_of_modules:
-        options_compiled += f" --preferred-number-of-modules {number_of_modules}"
+        run_options += f" --preferred-number-of-modules {number_of_modules}"
     if seed is not None:
-        options_compiled += f" --seed {seed}"
-    if directed:
-        options_compiled += " -d"
+        run_options += f" --seed {seed}"
+
+    # Infomap resets its config and random number generator only if the options
+    # of a run differ from the previous run. A repeated run gets a new network to
+    # give the same result as the first one.
+    if network is None or network[0].last_run_options == run_options:
+        network = build_infomap_network(g, options, directed)
+    im, g1 = network
+    # Appended to the options of the constructor for this run
+    im.run(run_options)
+    im.last_run_options = run_options
 
-    im = imp.Infomap(options_compiled)
-    for u, v, data in g1.edges(data=True):
-        im.add_link(u, v, weight=data["weight"])
-    im.run()
+    name_map = nx.get_node_attributes(g1, "name")
+    coms_to_node = defaultdict(list)
 
     for depth in range(1, im.maxTreeDepth()):
         coms_to_node = defaultdict(list)
@@ -135,6 +143,34 @@ def infomap(
         return clustering, D
 
 
+def build_infomap_network(
+    g, options="--inner-parallelization --silent", directed=False
+):
+    """
+    Create an Infomap instance with the links of g. It can be run repeatedly with
+    different seeds and markov times, see infomap.
+
+    :return: tuple of the Infomap instance and g with integer node labels
+    """
+    g = convert_graph_formats(g, nx.Graph)
+    g1 = nx.convert_node_labels_to_integers(g, label_attribute="name")
+
+    # Without further threads inner parallelization only adds overhead
+    options_compiled = (
+        options.replace("--inner-parallelization", "").strip()
+        if get_thread_limit() == 1
+        else options
+    )
+    if directed:
+        options_compiled += " -d"
+
+    im = imp.Infomap(options_compiled)
+    im.last_run_options = None
+    for u, v, data in g1.edges(data=True):
+        im.add_link(u, v, weight=data["weight"])
+    return im, g1
+
+
 def louvain(g, weight="weight", resolution=1.0, seed=None, return_tree=False):
     """
     Louvain  maximizes a modularity score for each community.
@@ -125,6 +125,51 @@ def get_parser():
         "edges and negotiate common result.",
     )
 
+    parser.add_argument(
+        "--cluster-formats",
+        dest="cluster_formats",
+        nargs="+",
+        type=str,
+        choices=["npz", "json"],
+        default=["npz"],
+        help="Output formats of the clusterings. "
+        "npz writes an int32 label vector per clustering and a node dictionary per "
+        "preprocessed graph. json writes the communities as lists of node keys. "
+        "Later steps read either format. Default: npz",
+    )
+
+    parser.add_argument(
+        "--sweep",
+        dest="sweep",
+        action="store_const",
+        const=True,
+        default=False,
+        help="Cluster all configs of a preprocessed graph and clustering method, "
+        "e.g. several markov times and seeds, in one item. The graph is loaded and "
+        "compiled and its Infomap network is built once per item.",
+    )
+
+    parser.add_argument(
+        "--consensus-tolerance",
+        dest="consensus_tolerance",
+        type=float,
+        default=None,
+        help="Stop a consensus clustering before all --consensus runs are done, once "
+        "the consensus clusters did not change and the share of runs in which two "
+        "nodes are in the same cluster did not change by more than this tolerance "
+        "in the last batch of runs. The number of runs is recorded in the method "
+        "parameters of the clustering. E.g. 0.01",
+    )
+
+    parser.add_argument(
+        "--consensus-batch-size",
+        dest="consensus_batch_size",
+        type=int,
+        default=50,
+        help="Number of consensus runs between checks of --consensus-tolerance. "
+        "Default: 50",
+    )
+
     parser.add_argument(
         "--number-of-modules",
         dest="numbers_of_modules",
@@ -152,4 +197,249 @@ def get_parser():
         default=["infomap"],
         help="Choose clustering method. infomap or louvain",
     )
+
+    # Cluster evolution args
+    parser.add_argument(
+        "--evolution-graph-format",
+        dest="evolution_graph_formats",
+        nargs="+",
+        type=str,
+        choices=["gpickle", "csv"],
+        default=["gpickle"],
+        help="Output formats of the cluster evolution graph. "
+        "gpickle writes a networkx graph. "
+        "csv writes node and edge tables without creating a networkx graph. "
+        "Default: gpickle",
+    )
+    parser.add_argument(
+        "--evolution-graph-append",
+        dest="evolution_graph_append",
+        action="store_const",
+        const=True,
+        default=False,
+        help="Append new snapshots to existing cluster evolution graphs instead of "
+        "skipping them. Only the new snapshots and the pair of the last existing "
+        "and the first new snapshot are processed. Ignored with --overwrite.",
+    )
+    parser.add_argument(
+        "--family-threshold",
+        dest="family_threshold",
+        type=float,
+        default=0.15,
+        help="Share of the tokens of two clusters an edge of the cluster evolution "
+        "graph must have to join them to a family. Used by the cluster evolution "
+        "graph and inspection steps. Default: 0.15",
+    )
+    parser.add_argument(
+        "--family-table-thresholds",
+        dest="family_table_thresholds",
+        nargs="+",
+        type=float,
+        default=None,
+        help="Write a table with the family of each cluster at each of these "
+        "thresholds in the cluster evolution graph step",
+    )
+    parser.add_argument(
+        "--family-table-formats",
+        dest="family_table_formats",
+        nargs="+",
+        type=str,
+        default=["csv"],
+        choices=["csv", "parquet"],
+        help="Formats of the family table. parquet requires pyarrow. Default: csv",
+    )
+    parser.add_argument(
+        "--flow-stride",
+        dest="flow_stride",
+        type=int,
+        default=1,
+        help="Distance of the snapshots whose community flows the cluster evolution "
+        "flows step writes, e.g. 5 for snapshots five years apart. Default: 1",
+    )
+    parser.add_argument(
+        "--flow-pairs",
+        dest="flow_pairs",
+        nargs="+",
+        type=str,
+        default=None,
+        help="Pairs of snapshots as 1994-2019 for the cluster evolution flows step "
+        "instead of --flow-stride",
+    )
+    parser.add_argument(
+        "--flows-memory-limit",
+        dest="flows_memory_limit",
+        type=int,
+        default=2048,
+        help="Memory in MB a process may use to cache transition matrices "
+        "in the cluster evolution flows step. 0 for no limit. Default: 2048",
+    )
+
+    # Inspection args
+    parser.add_argument(
+        "--inspection-memory-limit",
+        dest="inspection_memory_limit",
+        type=int,
+        default=2048,
+        help="Memory in MB a process may use to cache snapshot data "
+        "for the inspection steps. 0 for no limit. Default: 2048",
+    )
+    parser.add_argument(
+        "--report-page-size",
+        dest="report_page_size",
+        type=int,
+        default=0,
+        help="Number of communities (cluster inspection) or families "
+        "(cluster evolution inspection) per report file. 0 writes one file. "
+        "Default: 0",
+    )
+    parser.add_argument(
+        "--report-gzip",
+        dest="report_gzip",
+        action="store_const",
+        const=True,
+        default=False,
+        help="Write gzip compressed inspection reports",
+    )
+    parser.add_argument(
+        "--inspection-formats",
+        dest="inspection_formats",
+        nargs="+",
+        type=str,
+        choices=["htm", "csv", "parquet"],
+        default=["htm"],
+        help="Outputs of the cluster inspection and the cluster evolution "
+        "inspection. htm writes a report. csv and parquet write a table with a row "
+        "for each node of each community or of each cluster of each family. "
+        "parquet requires pyarrow. Default: htm",
+    )
+
+    # Instrumentation args
+    parser.add_argument(
+        "--run-log",
+        dest="run_log",
+        type=str,
+        default=None,
+        help="Append a json line for each processed item to this file. It contains "
+        "the wall time, cpu time, peak memory, bytes read and written, the timings "
+        "of the phases of the step and the events (e.g. warnings) of the item.",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile_folder",
+        type=str,
+        default=None,
+        help="Write cProfile stats of each processed item to this folder",
+    )
+    parser.add_argument(
+        "--status-file",
+        dest="status_file",
+        type=str,
+        default=None,
+        help="Json file that is regularly replaced with the progress of the running "
+        "step: completed and remaining items, throughput, ETA and the item each "
+        "worker is processing",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        dest="progress_interval",
+        type=int,
+        default=60,
+        help="Seconds between progress lines. 0 to disable. Default: 60",
+    )
+
+    # Fault tolerance args
+    parser.add_argument(
+        "--retries",
+        dest="retries",
+        type=int,
+        default=2,
+        help="Number of retries of an item failing with a transient error "
+        "(e.g. a connection or timeout error). Default: 2",
+    )
+    parser.add_argument(
+        "--failures-manifest",
+        dest="failures_manifest",
+        type=str,
+        default=None,
+        help="Json lines file the failed items are appended to. The other items of "
+        "a step are processed nevertheless. Default: failures.jsonl in the temp "
+        "folder of the dataset",
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_const",
+        const=True,
+        default=False,
+        help="Skip the items completed by the previous run, also with --overwrite. "
+        "Completed items are recorded in checkpoints.jsonl in the temp folder of the "
+        "dataset.",
+    )
+
+    parser.add_argument(
+        "--cpus",
+        dest="cpus",
+        type=int,
+        default=None,
+        help="Number of cpus used by a step. They are split between the processes "
+        "of the step and the OpenMP/BLAS threads of each process, e.g. Infomap "
+        "threads. Steps with fewer items than cpus use fewer processes with more "
+        "threads each. Default: all cpus but two",
+    )
+
+    parser.add_argument(
+        "--prefetch",
+        dest="prefetch",
+        type=int,
+        default=1,
+        help="Number of input graphs, tables or xml files loaded on background "
+        "threads ahead of the item or community that is processed. Graphs and "
+        "tables are prefetched for the next items of a process. 0 to disable. "
+        "Default: 1",
+    )
+
+    # Executor args
+    parser.add_argument(
+        "--executor",
+        dest="executor",
+        type=str,
+        choices=["local", "file-queue", "task-queue"],
+        default="local",
+        help="Backend to distribute the items of a step with. local uses a "
+        "multiprocessing pool. file-queue uses a folder shared by the workers. "
+        "task-queue uses a broker. Workers on other machines are started with the "
+        "worker step and the same executor args. Default: local",
+    )
+    parser.add_argument(
+        "--queue-folder",
+        dest="queue_folder",
+        type=str,
+        default=None,
+        help="Folder of the file-queue executor on a file system shared by all "
+        "workers. Default: queue in the temp folder of the dataset",
+    )
+    parser.add_argument(
+        "--broker-url",
+        dest="broker_url",
+        type=str,
+        default="local",
+        help="Broker of the task-queue executor: redis://host:port/db or local for "
+        "workers on this machine. Default: local",
+    )
+    parser.add_argument(
+        "--local-workers",
+        dest="local_workers",
+        type=int,
+        default=None,
+        help="Number of workers a step starts on this machine for the file-queue "
+        "and task-queue executors. Default: the number of processes of the step",
+    )
+    parser.add_argument(
+        "--worker-idle-timeout",
+        dest="worker_idle_timeout",
+        type=int,
+        default=0,
+        help="Seconds after which the worker step stops if it receives no task. "
+        "0 to run until stopped. Default: 0",
+    )
     return parser
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+
+from legal_data_clustering.utils.atomic_files import atomic_path
+from legal_data_clustering.utils.execution import append_json_line
+
+# jsonl file in an output folder that records the content hashes of its files and
+# which files are links to an identical file. It is not matched by the list_dir
+# filters of the steps. Later lines of a file override earlier ones.
+MANIFEST_FILENAME = "artifacts.jsonl"
+
+
+class HashWriter:
+    """
+    File-like object that hashes the data written to it
+    """
+
+    def __init__(self):
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+
+
+def graph_content_hash(G):
+    """
+    Hash of the attributes, nodes and edges of a graph. The name of the graph is not
+    included, as it differs for configs that result in identical graphs.
+    """
+    writer = HashWriter()
+    pickle.dump(
+        (
+            {k: v for k, v in G.graph.items() if k != "name"},
+            G._node,
+            G._adj,
+            getattr(G, "_pred", None),
+        ),
+        writer,
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
+    return writer.hash.hexdigest()
+
+
+def read_artifacts(folder):
+    """
+    :return: dict of the filenames in the manifest of a folder and their latest
+        records
+    """
+    path = os.path.join(folder, MANIFEST_FILENAME)
+    artifacts = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    artifacts[record["file"]] = record
+    return artifacts
+
+
+def record_artifacts(folder, records):
+    for record in records:
+        append_json_line(os.path.join(folder, MANIFEST_FILENAME), record)
+
+
+def resolve_artifact(artifacts, filename):
+    """
+    :return: the filename of the file that filename is a link to
+    """
+    while artifacts.get(filename, {}).get("alias_of"):
+        filename = artifacts[filename]["alias_of"]
+    return filename
+
+
+def link_file(source_path, path):
+    """
+    Replace path with a hardlink to source_path or a copy, if the file system does
+    not support hardlinks.
+    """
+    if os.path.exists(path) and os.path.samefile(source_path, path):
+        return
+    with atomic_path(path) as temp_path:
+        try:
+            os.link(source_path, temp_path)
+        except OSError:
+            shutil.copyfile(source_path, temp_path)
+
+
+def link_aliases(folder, aliases):
+    """
+    Link files to the files of equivalent configs.
+    :param aliases: tuples of a filename and the filename it is an alias of
+    """
+    records = []
+    for filename, alias_of in aliases:
+        source_path = os.path.join(folder, alias_of)
+        if filename == alias_of or not os.path.exists(source_path):
+            continue
+        link_file(source_path, os.path.join(folder, filename))
+        records.append(dict(file=filename, alias_of=alias_of))
+    record_artifacts(folder, records)
+
+
+def link_identical_artifacts(folder):
+    """
+    Link files with the same content hash in the manifest of a folder to the first
+    of them.
+    """
+    first_filenames = {}
+    records = []
+    for filename, record in read_artifacts(folder).items():
+        content_hash = record.get("content_hash")
+        path = os.path.join(folder, filename)
+        if not content_hash or record.get("alias_of") or not os.path.exists(path):
+            continue
+        if content_hash not in first_filenames:
+            first_filenames[content_hash] = filename
+            continue
+        link_file(os.path.join(folder, first_filenames[content_hash]), path)
+        records.append(
+            dict(
+                file=filename,
+                content_hash=content_hash,
+                alias_of=first_filenames[content_hash],
+            )
+        )
+    record_artifacts(folder, records)
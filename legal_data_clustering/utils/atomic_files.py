@@ -0,0 +1,44 @@
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+# Hidden folder in the target folder for outputs that are being written. It is not
+# matched by list_dir filters of file extensions.
+TEMP_FOLDER_NAME = ".tmp"
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Yields a temporary path to write a file or a folder to. It is renamed to path
+    only if the block completes without an error, so that partially written outputs
+    never appear under their final name.
+    The temporary path has the same filename, so that writers inferring the
+    compression from the file extension behave the same.
+    """
+    folder, filename = os.path.split(path)
+    temp_folder = os.path.join(
+        folder, TEMP_FOLDER_NAME, f"{os.getpid()}-{threading.get_ident()}"
+    )
+    os.makedirs(temp_folder, exist_ok=True)
+    temp_path = os.path.join(temp_folder, filename)
+    try:
+        yield temp_path
+        if os.path.isdir(temp_path) and os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(temp_path, path)
+    finally:
+        remove_path(temp_path)
+        for empty_folder in [temp_folder, os.path.dirname(temp_folder)]:
+            try:
+                os.rmdir(empty_folder)
+            except OSError:
+                pass
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,157 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from cdlib import NodeClustering, readwrite
+from quantlaw.utils.files import list_dir
+
+from legal_data_clustering.utils.atomic_files import atomic_path, remove_path
+from legal_data_clustering.utils.snapshot_tables import decode_strings, encode_strings
+
+# json writes the communities as lists of node keys. npz writes a label vector per
+# clustering that refers to a node dictionary per preprocessed graph.
+clustering_file_exts = {"json": ".json", "npz": ".labels.npz"}
+
+NODES_FILE_EXT = ".nodes.npz"
+
+
+def write_node_dictionary(path, nodes):
+    np.savez(path, keys=encode_strings(nodes))
+
+
+def load_node_dictionary(path):
+    """
+    Load the node keys written by write_node_dictionary. The dictionary is shared
+    by all clusterings of a graph and cached while the file is unchanged.
+    """
+    return _load_node_dictionary(path, os.path.getmtime(path))
+
+
+@lru_cache(maxsize=8)
+def _load_node_dictionary(path, mtime):
+    with np.load(path) as table:
+        return decode_strings(table["keys"])
+
+
+def encode_labels(communities, nodes):
+    """
+    :return: int32 array with the index of the community of each node or -1 for
+        nodes without a community
+    """
+    node_idx = {node: idx for idx, node in enumerate(nodes)}
+    labels = np.full(len(nodes), -1, dtype=np.int32)
+    for community_idx, community in enumerate(communities):
+        community_nodes_idx = [node_idx[node] for node in community]
+        if (labels[community_nodes_idx] != -1).any():
+            raise ValueError("Overlapping communities cannot be encoded as labels")
+        labels[community_nodes_idx] = community_idx
+    return labels
+
+
+def decode_labels(labels, nodes, communities_n):
+    """
+    :return: list of the communities of labels. The nodes of a community are in the
+        order of nodes.
+    """
+    communities = [[] for _ in range(communities_n)]
+    for node, label in zip(nodes, labels.tolist()):
+        if label != -1:
+            communities[label].append(node)
+    return communities
+
+
+def write_labels(path, clustering, nodes_filename, nodes):
+    """
+    Write a clustering as label vector.
+    :param nodes_filename: filename of the node dictionary in the same folder
+    :param nodes: keys of the node dictionary
+    """
+    metadata = dict(
+        algorithm=clustering.method_name,
+        params=clustering.method_parameters,
+        coverage=clustering.node_coverage,
+        communities_n=len(clustering.communities),
+    )
+    np.savez(
+        path,
+        labels=encode_labels(clustering.communities, nodes),
+        nodes_filename=encode_strings([nodes_filename]),
+        metadata=encode_strings([json.dumps(metadata)]),
+    )
+
+
+def load_labels(path):
+    """
+    :return: the node keys, the label vector and the metadata of a clustering
+        written by write_labels
+    """
+    with np.load(path) as table:
+        (nodes_filename,) = decode_strings(table["nodes_filename"])
+        (metadata,) = decode_strings(table["metadata"])
+        labels = table["labels"]
+    nodes = load_node_dictionary(os.path.join(os.path.dirname(path), nodes_filename))
+    return nodes, labels, json.loads(metadata)
+
+
+def write_clustering(clustering, path, nodes_filename, formats=("npz",)):
+    """
+    :param path: path of the clustering with the .json file extension. Other
+        formats replace it with their file extension.
+    :param nodes_filename: filename of the node dictionary for npz
+    """
+    filename_base = path[: -len(clustering_file_exts["json"])]
+    # Outputs of a previous run in other formats are outdated
+    for clustering_format, file_ext in clustering_file_exts.items():
+        if clustering_format not in formats:
+            remove_path(filename_base + file_ext)
+    if "json" in formats:
+        with atomic_path(path) as temp_path:
+            readwrite.write_community_json(clustering, temp_path)
+    if "npz" in formats:
+        nodes = load_node_dictionary(
+            os.path.join(os.path.dirname(path), nodes_filename)
+        )
+        with atomic_path(filename_base + clustering_file_exts["npz"]) as temp_path:
+            write_labels(temp_path, clustering, nodes_filename, nodes)
+
+
+def read_clustering(path):
+    """
+    Read a clustering written by write_clustering.
+    :param path: path of the clustering with the .json file extension. The label
+        vector is read instead if it exists.
+    :return: NodeClustering without graph like cdlib.readwrite.read_community_json
+    """
+    labels_path = (
+        path[: -len(clustering_file_exts["json"])] + clustering_file_exts["npz"]
+    )
+    if not os.path.exists(labels_path):
+        return readwrite.read_community_json(path)
+
+    nodes, labels, metadata = load_labels(labels_path)
+    clustering = NodeClustering(
+        decode_labels(labels, nodes, metadata["communities_n"]),
+        None,
+        metadata["algorithm"],
+        metadata["params"],
+    )
+    clustering.node_coverage = metadata["coverage"]
+    return clustering
+
+
+def list_clusterings(folder, formats=None):
+    """
+    :param formats: formats the clusterings must exist in. Clusterings in any format
+        are listed if None.
+    :return: filenames of the clusterings with the .json file extension
+    """
+    filenames = [
+        {
+            f[: -len(file_ext)] + clustering_file_exts["json"]
+            for f in list_dir(folder, file_ext)
+        }
+        for clustering_format, file_ext in clustering_file_exts.items()
+        if formats is None or clustering_format in formats
+    ]
+    return sorted(set.intersection(*filenames) if formats else set.union(*filenames))
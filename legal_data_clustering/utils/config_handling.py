@@ -1,6 +1,16 @@
+import json
 import multiprocessing
 
 from legal_data_clustering.utils.config_parsing import filename_for_pp_config
+from legal_data_clustering.utils.cpu_budget import limit_threads, split_cpu_budget
+from legal_data_clustering.utils.execution import (
+    IsolatedAction,
+    execution_settings,
+    get_execution,
+)
+from legal_data_clustering.utils.executors import get_executor
+from legal_data_clustering.utils.instrumentation import instrument
+from legal_data_clustering.utils.progress import get_progress_reporter
 
 
 def process_items(
@@ -12,6 +22,7 @@ def process_items(
     chunksize=None,
     processes=None,
     spawn=False,
+    input_paths=None,
 ):
     if len(selected_items) > 0:
         filtered_items = []
@@ -21,23 +32,64 @@ def process_items(
                     filtered_items.append(item)
                     break
         items = filtered_items
-    if not processes:
-        processes = int(multiprocessing.cpu_count() - 2)
-    if use_multiprocessing and len(items) > 1:
-        if spawn:
-            ctx = multiprocessing.get_context("spawn")
-        else:
-            ctx = multiprocessing.get_context()
-            # A bit slower, but it reimports everything which is necessary
-            # to make matplotlib working.
-            # Chunksize should be higher or none.
-        with ctx.Pool(processes=processes) as p:
-            logs = p.starmap(action_method, [(i, *args) for i in items], chunksize)
-    else:
-        logs = []
-        for item in items:
-            logs.append(action_method(item, *args))
+    items = list(items)
+    step = getattr(action_method, "__name__", type(action_method).__name__)
+    with get_execution(step) as execution:
+        if execution:
+            items = execution.pending_items(items)
+        logs = run_items(
+            step,
+            items,
+            action_method,
+            use_multiprocessing,
+            args,
+            chunksize,
+            processes,
+            spawn,
+            execution,
+            input_paths,
+        )
+        if execution:
+            execution.check()
+    return logs
 
+
+def run_items(
+    step,
+    items,
+    action_method,
+    use_multiprocessing,
+    args,
+    chunksize,
+    processes,
+    spawn,
+    execution,
+    input_paths,
+):
+    action_method = instrument(action_method)
+    if execution:
+        action_method = IsolatedAction(
+            action_method,
+            execution_settings["retries"],
+            execution_settings["retry_delay"],
+        )
+    # Workers of a pool cannot start a pool themselves
+    if multiprocessing.current_process().daemon:
+        use_multiprocessing = False
+    use_multiprocessing = use_multiprocessing and len(items) > 1
+    processes, threads = split_cpu_budget(
+        len(items) if use_multiprocessing else 1, processes
+    )
+    executor = get_executor(
+        use_multiprocessing, processes, chunksize, spawn, input_paths
+    )
+
+    logs = [None] * len(items)
+    with limit_threads(threads), get_progress_reporter(step, items) as reporter:
+        for idx, log in executor.map_unordered(action_method, items, args, reporter):
+            logs[idx] = execution.record(items[idx], log) if execution else log
+            if reporter:
+                reporter.finish(idx)
     return logs
 
 
@@ -106,3 +158,35 @@ def simplify_config_for_preprocessed_graph(config):
     config["method"] = None
     config["file_ext"] = ".gpickle.gz"
     return config
+
+
+def canonical_pp_config(config):
+    """
+    Set the preprocessing parameters that do not affect the preprocessed graph to
+    None. Without sequence edges the decay is not used, without co-occurrences the
+    co-occurrence type is not used.
+    """
+    config = config.copy()
+    if not config["pp_ratio"]:
+        config["pp_decay"] = None
+    if not config.get("pp_co_occurrence"):
+        config["pp_co_occurrence_type"] = None
+    return config
+
+
+def get_equivalent_items(items, canonical_config):
+    """
+    Group items with the same canonical config.
+    :param canonical_config: function returning the canonical config of an item
+    :return: the first item of each group and tuples of each other item and the
+        first item of its group
+    """
+    first_items = {}
+    aliases = []
+    for item in items:
+        key = json.dumps(canonical_config(item), sort_keys=True, default=str)
+        if key in first_items:
+            aliases.append((item, first_items[key]))
+        else:
+            first_items[key] = item
+    return list(first_items.values()), aliases
@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+from contextlib import contextmanager
+
+from threadpoolctl import threadpool_limits
+
+# Number of cpus shared by the processes of a step and the threads of OpenMP and
+# BLAS libraries (e.g. Infomap and scipy) in each process. None uses all cpus but
+# two. threads is the number of threads per process of the running step.
+cpu_settings = dict(cpus=None, threads=None)
+
+# Read by OpenMP and BLAS libraries when they are loaded, i.e. by new processes
+thread_env_vars = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+def configure_cpu_budget(cpus=None):
+    cpu_settings["cpus"] = cpus
+
+
+def get_thread_limit():
+    """
+    :return: number of threads a process may use or None if not limited
+    """
+    if cpu_settings["threads"]:
+        return cpu_settings["threads"]
+    # Workers started with spawn inherit the environment only
+    if multiprocessing.current_process().daemon and os.environ.get("OMP_NUM_THREADS"):
+        return int(os.environ["OMP_NUM_THREADS"])
+    return None
+
+
+def get_cpu_budget():
+    """
+    :return: number of cpus of a step. Steps nested in an item get the threads of
+        the item.
+    """
+    thread_limit = get_thread_limit()
+    if thread_limit:
+        return thread_limit
+    if cpu_settings["cpus"]:
+        return cpu_settings["cpus"]
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = multiprocessing.cpu_count()
+    return max(cpus - 2, 1)
+
+
+def split_cpu_budget(items_n, processes=None):
+    """
+    Split the cpu budget between processes and threads per process. A few large
+    items get few processes with many threads, many items get many processes with
+    a single thread.
+    :param items_n: number of items that are processed in parallel
+    :param processes: maximum number of processes, e.g. to limit the memory usage
+    :return: tuple of the number of processes and of threads per process
+    """
+    budget = get_cpu_budget()
+    processes = max(min(processes or budget, budget, items_n), 1)
+    return processes, max(budget // processes, 1)
+
+
+@contextmanager
+def limit_threads(threads):
+    """
+    Limit the threads of OpenMP and BLAS libraries of this process and of
+    processes started in the block. Libraries that are loaded already, e.g. by
+    numpy or Infomap, are limited with threadpoolctl. The environment variables only
+    reach libraries that are loaded later, e.g. in spawned workers.
+    """
+    previous_threads = cpu_settings["threads"]
+    previous_env = {var: os.environ.get(var) for var in thread_env_vars}
+    cpu_settings["threads"] = threads
+    os.environ.update({var: str(threads) for var in thread_env_vars})
+    try:
+        with threadpool_limits(limits=threads):
+            yield
+    finally:
+        cpu_settings["threads"] = previous_threads
+        for var, value in previous_env.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
@@ -0,0 +1,205 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+from legal_data_clustering.utils.instrumentation import log_event
+
+# Settings of the current run
+execution_settings = dict(
+    failures_path=None, checkpoint_path=None, retries=0, retry_delay=1, resume=False
+)
+
+# Executions active in this process. Only the outermost process_items call isolates
+# failures and writes checkpoints. Failures of nested calls fail the outer item.
+active_executions = []
+
+# Errors that may not occur again when an item is retried, e.g. a network file
+# system hiccup or a truncated read of a file that is written concurrently.
+transient_errors = (
+    ConnectionError,
+    TimeoutError,
+    BlockingIOError,
+    InterruptedError,
+    EOFError,
+    MemoryError,
+)
+
+
+def configure_execution(
+    failures_path=None, checkpoint_path=None, retries=0, retry_delay=1, resume=False
+):
+    """
+    Enable the fault tolerant execution of process_items.
+    :param failures_path: jsonl file failed items are appended to. If set, a failing
+        item does not stop the other items. The step raises an ItemsFailedError
+        after all items are processed.
+    :param checkpoint_path: jsonl file completed items are appended to. It is
+        cleared unless resume is set.
+    :param retries: number of retries of items failing with a transient error
+    :param retry_delay: seconds to wait before the first retry. Doubles with each
+        retry.
+    :param resume: skip the items completed according to the checkpoint file
+    """
+    execution_settings.update(
+        failures_path=failures_path,
+        checkpoint_path=checkpoint_path,
+        retries=retries,
+        retry_delay=retry_delay,
+        resume=resume,
+    )
+    for path in [failures_path, checkpoint_path]:
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    if checkpoint_path and not resume and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+class ItemsFailedError(Exception):
+    pass
+
+
+class ItemFailure:
+    """
+    Result of an item that failed in an IsolatedAction.
+    """
+
+    def __init__(self, error, error_traceback, attempts):
+        self.error = error
+        self.traceback = error_traceback
+        self.attempts = attempts
+
+
+class IsolatedAction:
+    """
+    Wraps an action method to return an ItemFailure instead of raising an exception.
+    Items failing with a transient error are retried.
+    """
+
+    def __init__(self, action_method, retries=0, retry_delay=1):
+        self.action_method = action_method
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def __call__(self, item, *args):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return self.action_method(item, *args)
+            except Exception as e:
+                if attempt <= self.retries and isinstance(e, transient_errors):
+                    log_event(
+                        "retry", attempt=attempt, error=f"{type(e).__name__}: {e}"
+                    )
+                    time.sleep(self.retry_delay * 2 ** (attempt - 1))
+                    continue
+                return ItemFailure(
+                    f"{type(e).__name__}: {e}", traceback.format_exc(), attempt
+                )
+
+
+class Execution:
+    """
+    Records completed and failed items of a process_items call.
+    """
+
+    def __init__(self, step, failures_path, checkpoint_path, resume, **kwargs):
+        self.step = step
+        self.failures_path = failures_path
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.failures_n = 0
+        self.items_n = 0
+
+    def __enter__(self):
+        active_executions.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        active_executions.remove(self)
+
+    def pending_items(self, items):
+        """
+        :return: items that are not completed according to the checkpoint file
+        """
+        if self.resume and self.checkpoint_path:
+            completed = read_checkpoint(self.checkpoint_path, self.step)
+            items = [item for item in items if item_key(item) not in completed]
+        self.items_n = len(items)
+        return items
+
+    def record(self, item, result):
+        """
+        Record the result of an item.
+        :return: the result or None if the item failed
+        """
+        if isinstance(result, ItemFailure):
+            self.failures_n += 1
+            if self.failures_path:
+                append_json_line(
+                    self.failures_path,
+                    dict(
+                        step=self.step,
+                        item=item,
+                        error=result.error,
+                        attempts=result.attempts,
+                        time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        traceback=result.traceback,
+                    ),
+                )
+            print(f"{self.step} failed for {item}: {result.error}", flush=True)
+            return None
+        if self.checkpoint_path:
+            append_json_line(self.checkpoint_path, dict(step=self.step, item=item))
+        return result
+
+    def check(self):
+        if self.failures_n:
+            message = (
+                f"{self.failures_n} of {self.items_n} items of {self.step} failed."
+            )
+            if self.failures_path:
+                message += f" See {self.failures_path}"
+            raise ItemsFailedError(message)
+
+
+def get_execution(step):
+    """
+    :return: an Execution or a context yielding None if the execution of the items
+        is not fault tolerant
+    """
+    if (
+        not (
+            execution_settings["failures_path"] or execution_settings["checkpoint_path"]
+        )
+        or active_executions
+        or multiprocessing.current_process().daemon
+    ):
+        return contextlib.nullcontext()
+    return Execution(step, **execution_settings)
+
+
+def item_key(item):
+    return json.dumps(item, sort_keys=True, default=str)
+
+
+def read_checkpoint(path, step):
+    """
+    :return: set of the keys of the completed items of a step
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return {item_key(record["item"]) for record in records if record["step"] == step}
+
+
+def append_json_line(path, record):
+    line = json.dumps(record, default=str) + "\n"
+    with open(path, "a") as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
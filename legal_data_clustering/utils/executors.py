@@ -0,0 +1,694 @@
+import math
+import multiprocessing
+import os
+import pickle
+import queue
+import shutil
+import socket
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+
+from quantlaw.utils.files import ensure_exists, list_dir
+
+from legal_data_clustering.utils.atomic_files import atomic_path
+from legal_data_clustering.utils.execution import configure_execution
+from legal_data_clustering.utils.prefetch import (
+    clear_prefetched_inputs,
+    prefetch_inputs,
+    prefetch_settings,
+)
+from legal_data_clustering.utils.progress import (
+    ProgressAction,
+    configure_progress,
+    init_progress_worker,
+    report_worker_start,
+)
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+executor_backends = ["local", "file-queue", "task-queue"]
+
+# Settings of the current run
+executor_settings = dict(
+    backend="local",
+    queue_folder=None,
+    broker_url="local",
+    local_workers=None,
+    lease_timeout=600,
+    poll_interval=0.5,
+)
+
+
+def configure_executor(
+    backend="local",
+    queue_folder=None,
+    broker_url="local",
+    local_workers=None,
+    lease_timeout=600,
+    poll_interval=0.5,
+):
+    """
+    Select the backend process_items distributes items with if multiprocessing is
+    used.
+    :param backend: local uses a multiprocessing pool. file-queue writes the tasks
+        to queue_folder, from which workers on all machines sharing the folder claim
+        them. task-queue sends the tasks via a broker.
+    :param queue_folder: folder of the file-queue. It must be on a file system
+        shared by all workers.
+    :param broker_url: redis://... or local for a broker for workers on this machine
+    :param local_workers: number of workers a step starts on this machine for the
+        file-queue or task-queue backend. Defaults to the number of processes of the
+        step. 0 to rely on workers started with the worker step.
+    :param lease_timeout: seconds after which a file-queue task claimed by a worker
+        that stopped sending heartbeats is queued again
+    """
+    if backend not in executor_backends:
+        raise Exception(
+            f"Executor {backend} not allowed. Options: {', '.join(executor_backends)}"
+        )
+    if backend == "file-queue" and not queue_folder:
+        raise Exception("The file-queue executor requires a queue folder")
+    executor_settings.update(
+        backend=backend,
+        queue_folder=queue_folder,
+        broker_url=broker_url,
+        local_workers=local_workers,
+        lease_timeout=lease_timeout,
+        poll_interval=poll_interval,
+    )
+
+
+def get_executor(
+    use_multiprocessing, processes, chunksize=None, spawn=False, input_paths=None
+):
+    """
+    :param input_paths: function returning the paths of the gpickles and tables an
+        item reads with prefetch.read_gpickle or prefetch.read_table. Items processed
+        in this process or in a local pool prefetch them.
+    """
+    if not use_multiprocessing:
+        return SequentialExecutor(input_paths)
+    backend = executor_settings["backend"]
+    local_workers = (
+        processes
+        if executor_settings["local_workers"] is None
+        else executor_settings["local_workers"]
+    )
+    if backend == "local":
+        return LocalPoolExecutor(processes, chunksize, spawn, input_paths)
+    elif backend == "file-queue":
+        return FileQueueExecutor(
+            executor_settings["queue_folder"],
+            local_workers,
+            executor_settings["lease_timeout"],
+            executor_settings["poll_interval"],
+        )
+    elif backend == "task-queue":
+        return TaskQueueExecutor(
+            get_broker(executor_settings["broker_url"]),
+            local_workers,
+            executor_settings["poll_interval"],
+        )
+
+
+class RemoteTaskError(Exception):
+    """
+    An item failed in a worker. The message contains the traceback of the worker.
+    """
+
+
+# Executors map an action method over the items and yield tuples of the index of an
+# item and its result as soon as an item is finished. If a progress reporter is
+# given, they announce the start of items to it.
+
+
+def map_with_prefetch(action_method, task_queue, input_paths=None, start=None):
+    """
+    Process the tasks of a queue one after another until None is received. Tasks
+    are tuples of the index of an item, the item and the args. If input_paths is
+    given, the tasks already in the queue are taken ahead and their inputs are
+    loaded while a task is processed.
+    :param start: function called with the index of an item before it is processed
+    """
+    lookahead = 1 + (prefetch_settings["depth"] if input_paths else 0)
+    next_tasks = deque()
+    stopped = False
+    prefetched_paths = []
+    try:
+        while True:
+            while not stopped and len(next_tasks) < lookahead:
+                try:
+                    # Only wait for a task if there is nothing to process
+                    task = task_queue.get(block=not next_tasks)
+                except queue.Empty:
+                    break
+                if task is None:
+                    stopped = True
+                else:
+                    next_tasks.append(task)
+            if not next_tasks:
+                return
+            if input_paths:
+                for _, item, args in next_tasks:
+                    prefetched_paths += prefetch_inputs(input_paths(item, *args))
+            idx, item, args = next_tasks.popleft()
+            if start:
+                start(idx)
+            yield idx, action_method(item, *args)
+    finally:
+        clear_prefetched_inputs(prefetched_paths)
+
+
+class SequentialExecutor:
+    def __init__(self, input_paths=None):
+        self.input_paths = input_paths
+
+    def map_unordered(self, action_method, items, args, reporter=None):
+        task_queue = queue.SimpleQueue()
+        for idx, item in enumerate(items):
+            task_queue.put((idx, item, args))
+        task_queue.put(None)
+        yield from map_with_prefetch(
+            action_method,
+            task_queue,
+            self.input_paths,
+            (lambda idx: reporter.start(os.getpid(), idx)) if reporter else None,
+        )
+
+
+class LocalPoolExecutor:
+    def __init__(self, processes, chunksize=None, spawn=False, input_paths=None):
+        """
+        :param input_paths: see get_executor. Instead of a pool, each process gets
+            its items via its own queue. Items are sent one by one, but up to the
+            prefetch depth ahead, so that the process prefetches their inputs.
+            chunksize is not used then.
+        """
+        self.processes = processes
+        self.chunksize = chunksize
+        self.spawn = spawn
+        self.input_paths = input_paths
+
+    def map_unordered(self, action_method, items, args, reporter=None):
+        if self.spawn:
+            ctx = multiprocessing.get_context("spawn")
+        else:
+            ctx = multiprocessing.get_context()
+            # A bit slower, but it reimports everything which is necessary
+            # to make matplotlib working.
+            # Chunksize should be higher or none.
+        start_queue = ctx.Queue() if reporter else None
+        if reporter:
+            reporter.attach_queue(start_queue)
+        tasks = [(idx, item, args) for idx, item in enumerate(items)]
+        if self.input_paths and prefetch_settings["depth"]:
+            yield from self.map_with_prefetching_workers(
+                ctx, action_method, tasks, start_queue
+            )
+            return
+        with ctx.Pool(
+            processes=self.processes,
+            initializer=init_progress_worker,
+            initargs=(start_queue,),
+        ) as p:
+            # Results are received as soon as an item is finished
+            yield from p.imap_unordered(
+                ProgressAction(action_method), tasks, self.chunksize or 1
+            )
+
+    def map_with_prefetching_workers(self, ctx, action_method, tasks, start_queue):
+        workers_n = min(self.processes or os.cpu_count(), len(tasks))
+        result_queue = ctx.Queue()
+        task_queues = [ctx.Queue() for _ in range(workers_n)]
+        workers = [
+            ctx.Process(
+                target=run_prefetching_worker,
+                args=(
+                    worker_idx,
+                    action_method,
+                    self.input_paths,
+                    task_queues[worker_idx],
+                    result_queue,
+                    start_queue,
+                ),
+                daemon=True,
+            )
+            for worker_idx in range(workers_n)
+        ]
+        for worker in workers:
+            worker.start()
+
+        pending_tasks = deque(tasks)
+
+        def send_task(worker_idx):
+            task_queues[worker_idx].put(
+                pending_tasks.popleft() if pending_tasks else None
+            )
+
+        try:
+            # One item for each worker first, so that few items are spread over
+            # all workers
+            for _ in range(1 + prefetch_settings["depth"]):
+                for worker_idx in range(workers_n):
+                    if pending_tasks:
+                        send_task(worker_idx)
+            for _ in tasks:
+                # Results are received as soon as an item is finished
+                while True:
+                    try:
+                        worker_idx, idx, success, result = result_queue.get(timeout=1)
+                        break
+                    except queue.Empty:
+                        check_prefetching_workers(workers)
+                send_task(worker_idx)
+                if not success:
+                    raise result
+                yield idx, result
+        finally:
+            stop_local_workers(workers)
+            # Tasks that were not taken must not block the exit of this process
+            for task_queue in task_queues:
+                task_queue.cancel_join_thread()
+
+
+def run_prefetching_worker(
+    worker_idx, action_method, input_paths, task_queue, result_queue, start_queue
+):
+    """
+    Process the tasks of a queue until None is received. Puts tuples of the index
+    of the worker and of the item, whether it succeeded and its result or exception
+    to the result queue.
+    """
+    init_progress_worker(start_queue)
+
+    def capture_exception(item, *args):
+        try:
+            return True, action_method(item, *args)
+        except Exception as e:
+            return False, e
+
+    for idx, (success, result) in map_with_prefetch(
+        capture_exception, task_queue, input_paths, report_worker_start
+    ):
+        result_queue.put((worker_idx, idx, success, result))
+
+
+def check_prefetching_workers(workers):
+    # Workers only stop after they received None. A worker that stopped with an
+    # error, e.g. because it was killed, lost the items sent to it.
+    for worker in workers:
+        if not worker.is_alive() and worker.exitcode != 0:
+            raise Exception(f"A worker stopped with exit code {worker.exitcode}")
+
+
+def new_job_id():
+    # Sortable by creation time, so that workers process older jobs first
+    return f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def dump_task(job_id, idx, action_method, item, args):
+    return pickle.dumps((job_id, idx, action_method, item, args))
+
+
+def run_task(payload):
+    """
+    :return: tuple of the job id and the pickled result of the task
+    """
+    job_id, idx, action_method, item, args = pickle.loads(payload)
+    try:
+        result = (idx, True, action_method(item, *args))
+    except Exception as e:
+        result = (idx, False, f"{type(e).__name__}: {e}\n{traceback.format_exc()}")
+    return job_id, pickle.dumps(result)
+
+
+def load_result(payload):
+    idx, success, result = pickle.loads(payload)
+    if not success:
+        raise RemoteTaskError(result)
+    return idx, result
+
+
+def prepare_worker():
+    """
+    Items are processed in a worker like in a worker of a local pool. Nested
+    process_items calls use a local pool, do not report their progress and do not
+    record checkpoints.
+    """
+    configure_executor()
+    configure_progress()
+    configure_execution()
+
+
+def start_local_workers(target, args, workers_n):
+    workers = [
+        multiprocessing.Process(target=target, args=args, daemon=True)
+        for _ in range(workers_n)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def stop_local_workers(workers):
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
+
+
+def check_local_workers(workers):
+    if workers and all(
+        not worker.is_alive() and worker.exitcode != 0 for worker in workers
+    ):
+        raise Exception(
+            "All local workers stopped with exit codes "
+            + ", ".join(str(worker.exitcode) for worker in workers)
+        )
+
+
+class FileQueueExecutor:
+    """
+    Work stealing via a shared folder. A job is a folder with a file for each task
+    in {job}/tasks. A worker claims a task by renaming it to {job}/claimed, which is
+    atomic, touches the claimed file as heartbeat while processing it and writes the
+    result atomically to {job}/results.
+    Workers must run in a working directory in which the relative paths of the items
+    resolve to the same data, e.g. a checkout of the repository on the shared file
+    system.
+    """
+
+    def __init__(
+        self, queue_folder, local_workers, lease_timeout=600, poll_interval=0.5
+    ):
+        self.queue_folder = queue_folder
+        self.local_workers = local_workers
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+
+    def map_unordered(self, action_method, items, args, reporter=None):
+        job_id = new_job_id()
+        job_folder = os.path.join(self.queue_folder, job_id)
+        for subfolder in ["tasks", "claimed", "results"]:
+            ensure_exists(os.path.join(job_folder, subfolder))
+        # Written atomically, so that workers never read a partially written task
+        for idx, item in enumerate(items):
+            with atomic_path(
+                os.path.join(job_folder, "tasks", filename_for_task(idx))
+            ) as path:
+                with open(path, "wb") as f:
+                    f.write(dump_task(job_id, idx, action_method, item, args))
+
+        workers = start_local_workers(
+            run_file_queue_worker,
+            (self.queue_folder, job_id, None, self.poll_interval, self.lease_timeout),
+            self.local_workers,
+        )
+        try:
+            pending = set(range(len(items)))
+            while pending:
+                received = False
+                for filename in list_dir(os.path.join(job_folder, "results"), ".pkl"):
+                    path = os.path.join(job_folder, "results", filename)
+                    with open(path, "rb") as f:
+                        payload = f.read()
+                    os.remove(path)
+                    idx, result = load_result(payload)
+                    if idx in pending:
+                        pending.remove(idx)
+                        received = True
+                        yield idx, result
+                self.check_claims(job_folder, reporter)
+                check_local_workers(workers)
+                if not received:
+                    time.sleep(self.poll_interval)
+        finally:
+            stop_local_workers(workers)
+            shutil.rmtree(job_folder, ignore_errors=True)
+
+    def check_claims(self, job_folder, reporter):
+        claimed_folder = os.path.join(job_folder, "claimed")
+        for filename in os.listdir(claimed_folder):
+            task_filename, worker_id = filename.split(".pkl.", 1)
+            path = os.path.join(claimed_folder, filename)
+            try:
+                heartbeat_age = time.time() - os.path.getmtime(path)
+                if heartbeat_age > self.lease_timeout:
+                    # The worker died. Queue the task again
+                    os.rename(
+                        path, os.path.join(job_folder, "tasks", task_filename + ".pkl")
+                    )
+                elif reporter:
+                    reporter.start(worker_id, int(task_filename))
+            except FileNotFoundError:
+                # Finished in the meantime
+                pass
+
+
+def filename_for_task(idx):
+    return f"{idx:08d}.pkl"
+
+
+def run_file_queue_worker(
+    queue_folder, job_id=None, idle_timeout=None, poll_interval=0.5, lease_timeout=600
+):
+    """
+    Process tasks of a file-queue until no task is found for idle_timeout seconds.
+    :param job_id: process only tasks of this job. If None, tasks of all jobs in the
+        queue folder are processed.
+    :param idle_timeout: None to run until the process is stopped
+    """
+    prepare_worker()
+    ensure_exists(queue_folder)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    idle_since = time.time()
+    while True:
+        claim = claim_file_task(queue_folder, job_id, worker_id)
+        if not claim:
+            if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        job_folder, claimed_path, task_filename = claim
+        with Heartbeat(claimed_path, lease_timeout / 4):
+            with open(claimed_path, "rb") as f:
+                payload = f.read()
+            _, result = run_task(payload)
+        # Skip the result if the job was finished or the task was queued again in
+        # the meantime
+        if os.path.exists(claimed_path):
+            with atomic_path(
+                os.path.join(job_folder, "results", task_filename)
+            ) as path:
+                with open(path, "wb") as f:
+                    f.write(result)
+            os.remove(claimed_path)
+        idle_since = time.time()
+
+
+def claim_file_task(queue_folder, job_id, worker_id):
+    """
+    :return: tuple of the job folder, the path of the claimed task and its filename
+        or None if no task is available
+    """
+    job_ids = [job_id] if job_id else sorted(os.listdir(queue_folder))
+    for job_id in job_ids:
+        job_folder = os.path.join(queue_folder, job_id)
+        try:
+            task_filenames = list_dir(os.path.join(job_folder, "tasks"), ".pkl")
+        except OSError:
+            # Finished in the meantime
+            continue
+        for task_filename in task_filenames:
+            claimed_path = os.path.join(
+                job_folder, "claimed", f"{task_filename}.{worker_id}"
+            )
+            try:
+                os.rename(
+                    os.path.join(job_folder, "tasks", task_filename), claimed_path
+                )
+            except FileNotFoundError:
+                # Claimed by another worker
+                continue
+            return job_folder, claimed_path, task_filename
+    return None
+
+
+class Heartbeat:
+    """
+    Touch a file regularly while the block is executed.
+    """
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return
+
+
+class TaskQueueExecutor:
+    """
+    Sends the tasks to a queue of a broker and receives the results from a queue of
+    the job. Workers started with the worker step on other machines process tasks
+    of all jobs.
+    Unlike with the file-queue, tasks of a worker that dies are not sent again.
+    """
+
+    tasks_queue = "ldc:tasks"
+
+    def __init__(self, broker, local_workers, poll_interval=0.5):
+        self.broker = broker
+        self.local_workers = local_workers
+        self.poll_interval = poll_interval
+
+    def map_unordered(self, action_method, items, args, reporter=None):
+        job_id = new_job_id()
+        results_queue = results_queue_for_job(job_id)
+        self.broker.declare(self.tasks_queue)
+        self.broker.declare(results_queue)
+        for idx, item in enumerate(items):
+            self.broker.push(
+                self.tasks_queue, dump_task(job_id, idx, action_method, item, args)
+            )
+
+        workers = start_local_workers(
+            run_task_queue_worker,
+            (self.broker, None, self.poll_interval),
+            self.local_workers,
+        )
+        try:
+            pending = set(range(len(items)))
+            while pending:
+                payload = self.broker.pop(results_queue, self.poll_interval)
+                if payload is None:
+                    check_local_workers(workers)
+                    continue
+                idx, result = load_result(payload)
+                if idx in pending:
+                    pending.remove(idx)
+                    yield idx, result
+        finally:
+            stop_local_workers(workers)
+            self.broker.delete(results_queue)
+            self.broker.close()
+
+
+def results_queue_for_job(job_id):
+    return f"ldc:results:{job_id}"
+
+
+def run_task_queue_worker(broker, idle_timeout=None, poll_interval=0.5):
+    """
+    Process tasks of the broker until no task is received for idle_timeout seconds.
+    :param idle_timeout: None to run until the process is stopped
+    """
+    prepare_worker()
+    idle_since = time.time()
+    while True:
+        payload = broker.pop(TaskQueueExecutor.tasks_queue, poll_interval)
+        if payload is None:
+            if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                return
+            continue
+        job_id, result = run_task(payload)
+        broker.push(results_queue_for_job(job_id), result)
+        idle_since = time.time()
+
+
+def get_broker(broker_url):
+    if broker_url == "local":
+        return LocalBroker()
+    elif broker_url.startswith("redis://"):
+        return RedisBroker(broker_url)
+    raise Exception(f"Broker {broker_url} not supported. Options: local, redis://...")
+
+
+class LocalBroker:
+    """
+    Stand-in broker for workers on this machine, e.g. to test the task-queue
+    backend. Queues must be declared before the workers are started.
+    """
+
+    def __init__(self):
+        self.manager = multiprocessing.Manager()
+        self.queues = {}
+
+    def __getstate__(self):
+        # The manager stays in the process that created it. Workers only need the
+        # queue proxies.
+        return dict(manager=None, queues=self.queues)
+
+    def declare(self, name):
+        if name not in self.queues:
+            self.queues[name] = self.manager.Queue()
+
+    def push(self, name, payload):
+        self.queues[name].put(payload)
+
+    def pop(self, name, timeout):
+        try:
+            return self.queues[name].get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def delete(self, name):
+        self.queues.pop(name, None)
+
+    def close(self):
+        self.manager.shutdown()
+
+
+class RedisBroker:
+    """
+    Broker using redis lists. Requires the redis package.
+    """
+
+    def __init__(self, url):
+        if redis is None:
+            raise ImportError("The redis broker requires the redis package")
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+
+    def __getstate__(self):
+        return dict(url=self.url)
+
+    def __setstate__(self, state):
+        self.__init__(state["url"])
+
+    def declare(self, name):
+        pass
+
+    def push(self, name, payload):
+        self.client.rpush(name, payload)
+
+    def pop(self, name, timeout):
+        # BLPOP removes the element atomically, so each task is claimed once
+        result = self.client.blpop([name], timeout=max(math.ceil(timeout), 1))
+        return result[1] if result else None
+
+    def delete(self, name):
+        self.client.delete(name)
+
+    def close(self):
+        self.client.close()
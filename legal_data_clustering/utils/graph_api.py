@@ -1,11 +1,14 @@
 import itertools
+import math
 import os
 from collections import Counter, defaultdict
 
 import networkx as nx
-from cdlib import NodeClustering, readwrite
+import pandas as pd
+from cdlib import NodeClustering
 from quantlaw.utils.networkx import get_leaves, hierarchy_graph
 
+from legal_data_clustering.utils.clustering_tables import read_clustering
 from legal_data_clustering.utils.config_handling import (
     simplify_config_for_preprocessed_graph,
 )
@@ -69,7 +72,8 @@ def get_clustering_result(
 ):
     """
     read the clustering result and the respective graph.
-    ::param cluster_path: path of the cdlib.readwrite.write_community_json output
+    ::param cluster_path: path of the clustering with the .json file extension, see
+        clustering_tables.read_clustering
     ::param dataset: 'de' or 'us'
     ::param graph_type: 'clustering' for the rolled up graph.
         Other options: subseqitems, seqitems
@@ -119,7 +123,7 @@ def get_clustering_result(
     else:
         raise Exception(f"graph_type {graph_type} not allowed")
 
-    clustering = readwrite.read_community_json(
+    clustering = read_clustering(
         path_prefix
         + (
             (US_REG_CD_CLUSTER_PATH if regulations else US_CD_CLUSTER_PATH)
@@ -236,19 +240,176 @@ def quotient_decision_graph(G, merge_decisions, merge_statutes):
 
 
 def cluster_families(G, threshold, attr="tokens_n"):
-    H = filter_edges_for_cluster_families(G, threshold, attr)
-    components = list(nx.connected_components(H.to_undirected()))
-    components.sort(
-        key=lambda nodes_set: (
-            max([H.nodes[n][attr] for n in nodes_set]),
-            sorted(nodes_set)[-1],
-        ),
-        reverse=True,
+    """
+    Group the nodes of an evolution graph into families. Nodes are in the same
+    family if they are connected by edges whose attr is at least the threshold
+    share of the attr of both adjacent nodes.
+    Families are ordered by their largest node, nodes by size.
+    """
+    return cluster_families_from_edges(
+        dict(G.nodes(data=attr)), G.edges(data=attr), threshold
     )
-    components = [
-        sorted(c, key=lambda n: (H.nodes[n][attr], n), reverse=True) for c in components
+
+
+def cluster_families_from_edges(node_attrs, edges, threshold, previous_families=None):
+    """
+    Like cluster_families, but for node attrs and edges given as (u, v, attr)
+    without a graph.
+    :param previous_families: families of a part of the graph that are extended by
+        the edges, e.g. of the earlier snapshots of an evolution graph
+    """
+    families = nx.utils.UnionFind(node_attrs)
+    for family in previous_families or []:
+        families.union(*family)
+    for u, v, edge_attr in edges:
+        if is_family_edge(edge_attr, node_attrs[u], node_attrs[v], threshold):
+            families.union(u, v)
+    return sorted_families(families, node_attrs)
+
+
+def is_family_edge(edge_attr, u_attr, v_attr, threshold):
+    return edge_attr >= u_attr * threshold and edge_attr >= v_attr * threshold
+
+
+def get_critical_ratio(edge_attr, u_attr, v_attr):
+    """
+    :return: the smaller share of the edge attr in the attrs of the adjacent nodes,
+        i.e. about the largest threshold at which an edge is a family edge
+    """
+    return min(
+        edge_attr / u_attr if u_attr else math.inf,
+        edge_attr / v_attr if v_attr else math.inf,
+    )
+
+
+# Relative difference of critical ratios within which rounding can change their
+# order compared to is_family_edge
+RATIO_TOLERANCE = 1e-9
+
+
+class FamilyTree:
+    """
+    The families of an evolution graph for all thresholds at once. Edges are
+    processed by descending critical ratio and only the edges that join two
+    families are kept, together with edges that are tied with them. Ratios only
+    order the edges. The families at a threshold are the result of the kept edges
+    that are family edges at the threshold, the same as of cluster_families.
+    """
+
+    def __init__(self, node_attrs, edges):
+        """
+        :param node_attrs: dict of the attr of each node
+        :param edges: list of tuples of the ratio, the nodes and the attr of each
+            kept edge in descending order of the ratio
+        """
+        self.node_attrs = node_attrs
+        self.edges = edges
+
+    @classmethod
+    def from_edges(cls, node_attrs, edges, previous_tree=None):
+        """
+        :param edges: edges as (u, v, attr)
+        :param previous_tree: tree of a part of the graph that is extended by the
+            edges, e.g. of the earlier snapshots of an evolution graph. Its edges
+            are the only edges of that part that can join families.
+        """
+        ratios = [
+            (
+                get_critical_ratio(edge_attr, node_attrs[u], node_attrs[v]),
+                u,
+                v,
+                edge_attr,
+            )
+            for u, v, edge_attr in edges
+        ]
+        if previous_tree:
+            ratios = previous_tree.edges + ratios
+        ratios.sort(key=lambda edge: edge[0], reverse=True)
+
+        families = nx.utils.UnionFind(node_attrs)
+        kept_edges = []
+        last_merge_ratio = math.inf
+        for ratio, u, v, edge_attr in ratios:
+            if families[u] != families[v]:
+                families.union(u, v)
+                last_merge_ratio = ratio
+                kept_edges.append((ratio, u, v, edge_attr))
+            elif last_merge_ratio <= ratio * (1 + RATIO_TOLERANCE):
+                # The nodes may be joined by edges with about the same ratio that
+                # are not family edges at a threshold at which this edge is one
+                kept_edges.append((ratio, u, v, edge_attr))
+        return cls(node_attrs, kept_edges)
+
+    def get_families(self, threshold):
+        """
+        :return: the families at the threshold ordered like cluster_families
+        """
+        families = nx.utils.UnionFind(self.node_attrs)
+        for ratio, u, v, edge_attr in self.edges:
+            if ratio < threshold * (1 - RATIO_TOLERANCE):
+                break
+            if is_family_edge(
+                edge_attr, self.node_attrs[u], self.node_attrs[v], threshold
+            ):
+                families.union(u, v)
+        return sorted_families(families, self.node_attrs)
+
+    def get_family_table(self, thresholds):
+        """
+        :return: DataFrame with the family of each node at each threshold. Families
+            are numbered by their position in get_families.
+        """
+        return pd.DataFrame(
+            [
+                (threshold, family_idx, n)
+                for threshold in thresholds
+                for family_idx, family in enumerate(self.get_families(threshold))
+                for n in family
+            ],
+            columns=["threshold", "family", "key"],
+        )
+
+    def to_dict(self):
+        """
+        :return: dict that can be written as json. Infinite ratios are None.
+        """
+        return dict(
+            nodes=self.node_attrs,
+            edges=[
+                (None if ratio == math.inf else ratio, u, v, edge_attr)
+                for ratio, u, v, edge_attr in self.edges
+            ],
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["nodes"],
+            [
+                (math.inf if ratio is None else ratio, u, v, edge_attr)
+                for ratio, u, v, edge_attr in data["edges"]
+            ],
+        )
+
+
+def sorted_families(families, node_attrs):
+    """
+    :param families: UnionFind with a set for each family
+    :return: list of families as lists of nodes
+    """
+    components = defaultdict(list)
+    component_keys = dict()
+    for n, attr in node_attrs.items():
+        root = families[n]
+        components[root].append(n)
+        max_attr, max_node = component_keys.get(root, (attr, n))
+        component_keys[root] = (max(max_attr, attr), max(max_node, n))
+
+    roots = sorted(components, key=lambda root: component_keys[root], reverse=True)
+    return [
+        sorted(components[root], key=lambda n: (node_attrs[n], n), reverse=True)
+        for root in roots
     ]
-    return components
 
 
 def filter_edges_for_cluster_families(G, threshold, attr):
@@ -0,0 +1,119 @@
+import gzip
+import os
+from contextlib import ExitStack
+
+from legal_data_clustering.utils.atomic_files import atomic_path
+
+report_header = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8"/>
+<style>
+td {
+    vertical-align:top;
+}
+body {
+    white-space: nowrap;
+    font-family: Arial, Helvetica, sans-serif;
+}
+</style>
+</head>
+<body>
+<a name="top"></a>
+"""
+
+report_footer = "</body></html>"
+
+
+def report_file_ext(compress=False):
+    return ".htm.gz" if compress else ".htm"
+
+
+def filename_for_report_page(filename_base, page=0, compress=False):
+    """
+    The first page is named like an unpaginated report. Further pages are numbered
+    starting at 2.
+    """
+    page_suffix = f".{page + 1}" if page else ""
+    return f"{filename_base}{page_suffix}{report_file_ext(compress)}"
+
+
+def open_report(path, compress=False):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8", buffering=2**20)
+
+
+def write_report(
+    target_folder,
+    filename_base,
+    sections,
+    sections_n,
+    page_size=None,
+    compress=False,
+    toc=None,
+):
+    """
+    Streams a html report to one or more files. Only the section that is currently
+    written is kept in memory.
+
+    :param sections: iterable of sections. Each section is an iterable of html
+        strings.
+    :param sections_n: number of sections
+    :param page_size: number of sections per file. If None or 0, all sections are
+        written to one file.
+    :param compress: write gzip compressed files
+    :param toc: function returning the html strings to prepend to the first page.
+        It gets a function that returns the filename of the page containing a
+        section (as href prefix) for a section index.
+    :return: list of the written filenames
+    """
+    page_size = page_size or max(sections_n, 1)
+    pages_n = max((sections_n - 1) // page_size + 1, 1)
+    filenames = [
+        filename_for_report_page(filename_base, page, compress)
+        for page in range(pages_n)
+    ]
+
+    def section_href(section_idx):
+        return filenames[section_idx // page_size] if pages_n > 1 else ""
+
+    sections = iter(sections)
+    # Pages are renamed to their final names in reverse order after all pages are
+    # written. The first page, which is checked to skip existing reports, appears
+    # last.
+    with ExitStack() as page_paths:
+        for page, filename in enumerate(filenames):
+            path = page_paths.enter_context(
+                atomic_path(os.path.join(target_folder, filename))
+            )
+            with open_report(path, compress) as f:
+                f.write(report_header)
+                if pages_n > 1:
+                    f.write(page_navigation(filenames, page))
+                if page == 0 and toc:
+                    f.writelines(toc(section_href))
+                for section in next_sections(sections, page_size):
+                    f.writelines(section)
+                f.write(report_footer)
+    return filenames
+
+
+def next_sections(sections, n):
+    for _ in range(n):
+        section = next(sections, None)
+        if section is None:
+            return
+        yield section
+
+
+def page_navigation(filenames, current_page):
+    links = [
+        (
+            f"<b>{page + 1}</b>"
+            if page == current_page
+            else f'<a href="{filename}">{page + 1}</a>'
+        )
+        for page, filename in enumerate(filenames)
+    ]
+    return "<p>Pages: " + " | ".join(links) + "</p>\n"
@@ -0,0 +1,34 @@
+from legal_data_clustering.utils.atomic_files import atomic_path
+from legal_data_clustering.utils.html_report import report_file_ext
+
+table_file_exts = {"csv": ".csv.gz", "parquet": ".parquet"}
+
+
+def inspection_file_exts(formats, compress=False):
+    """
+    File extensions of the outputs of an inspection step.
+    :param formats: list containing htm, csv and/or parquet
+    :param compress: whether the htm report is gzip compressed
+    """
+    return [
+        (
+            report_file_ext(compress)
+            if file_format == "htm"
+            else table_file_exts[file_format]
+        )
+        for file_format in formats
+    ]
+
+
+def write_inspection_table(df, path_base, formats):
+    """
+    Write an inspection table in all requested table formats.
+    Formats that are not table formats (e.g. htm) are ignored.
+    Parquet requires pyarrow or fastparquet.
+    """
+    if "csv" in formats:
+        with atomic_path(path_base + table_file_exts["csv"]) as path:
+            df.to_csv(path, index=False)
+    if "parquet" in formats:
+        with atomic_path(path_base + table_file_exts["parquet"]) as path:
+            df.to_parquet(path, index=False)
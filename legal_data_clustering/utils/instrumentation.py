@@ -0,0 +1,173 @@
+import cProfile
+import hashlib
+import json
+import os
+import re
+import resource
+import time
+from contextlib import contextmanager
+
+MAX_EVENTS_PER_RECORD = 1000
+
+# Settings of the current run. Forked worker processes inherit them.
+run_settings = dict(run_log_path=None, profile_folder=None)
+
+# Records of the items currently processed in this process. The innermost item is
+# the last one.
+active_records = []
+
+
+def configure_instrumentation(run_log_path=None, profile_folder=None):
+    """
+    Enable the instrumentation of process_items.
+    :param run_log_path: jsonl file a record of each processed item is appended to
+    :param profile_folder: folder to write a cProfile stats file for each item to.
+        The files can be inspected with pstats, snakeviz or converted for flamegraph
+        viewers.
+    """
+    run_settings["run_log_path"] = run_log_path
+    run_settings["profile_folder"] = profile_folder
+    for path in [run_log_path and os.path.dirname(run_log_path), profile_folder]:
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+
+def instrumentation_enabled():
+    return bool(run_settings["run_log_path"] or run_settings["profile_folder"])
+
+
+class InstrumentedAction:
+    """
+    Wraps an action method of process_items to record the processing of each item.
+    It is picklable as long as the action method is.
+    """
+
+    def __init__(self, action_method, run_log_path=None, profile_folder=None):
+        self.action_method = action_method
+        self.run_log_path = run_log_path
+        self.profile_folder = profile_folder
+
+    def __call__(self, item, *args):
+        record = dict(
+            step=self.action_method.__name__,
+            item=describe_item(item),
+            pid=os.getpid(),
+            start=time.strftime("%Y-%m-%dT%H:%M:%S"),
+            phases={},
+            events=[],
+            events_dropped=0,
+        )
+        io_start = read_process_io()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        profile = cProfile.Profile() if self.profile_folder else None
+
+        active_records.append(record)
+        try:
+            if profile:
+                result = profile.runcall(self.action_method, item, *args)
+            else:
+                result = self.action_method(item, *args)
+            record["status"] = "ok"
+            return result
+        except BaseException as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            active_records.pop()
+            record["wall_time_s"] = round(time.perf_counter() - wall_start, 4)
+            record["cpu_time_s"] = round(time.process_time() - cpu_start, 4)
+            # Peak of the process so far. Items processed earlier in the same
+            # process may have caused it.
+            record["peak_rss_mb"] = round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+            )
+            io_end = read_process_io()
+            if io_start and io_end:
+                record["input_bytes"] = io_end["rchar"] - io_start["rchar"]
+                record["output_bytes"] = io_end["wchar"] - io_start["wchar"]
+            if profile:
+                record["profile"] = write_profile(profile, self.profile_folder, record)
+            if self.run_log_path:
+                write_record(self.run_log_path, record)
+
+
+def instrument(action_method):
+    """
+    Wrap an action method if the instrumentation is enabled.
+    """
+    if not instrumentation_enabled():
+        return action_method
+    return InstrumentedAction(action_method, **run_settings)
+
+
+@contextmanager
+def phase(name):
+    """
+    Measure the wall time of a phase of the item currently processed.
+    Phases with the same name are summed up.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if active_records:
+            phases = active_records[-1]["phases"]
+            phases[name] = round(phases.get(name, 0) + time.perf_counter() - start, 4)
+
+
+def log_event(name, **data):
+    """
+    Attach an event, e.g. a warning, to the record of the item currently processed.
+    Without an active record the event is printed.
+    """
+    if not active_records:
+        print(name, *[f"{k}={v}" for k, v in data.items()])
+        return
+    record = active_records[-1]
+    if len(record["events"]) < MAX_EVENTS_PER_RECORD:
+        record["events"].append(dict(event=name, **data))
+    else:
+        record["events_dropped"] += 1
+
+
+def describe_item(item):
+    if isinstance(item, dict):
+        return item
+    description = repr(item)
+    return description if len(description) <= 200 else description[:200] + "..."
+
+
+def read_process_io():
+    """
+    Characters read and written by the process (Linux only).
+    """
+    try:
+        with open("/proc/self/io") as f:
+            return {
+                key: int(value)
+                for key, value in (line.split(": ") for line in f.read().splitlines())
+            }
+    except OSError:
+        return None
+
+
+def write_profile(profile, profile_folder, record):
+    item_json = json.dumps(record["item"], default=str)
+    item_label = re.sub(r"[^\w\-]+", "_", item_json).strip("_")
+    if len(item_label) > 100:
+        # Keep the names of items with a long description distinct
+        item_hash = hashlib.md5(item_json.encode()).hexdigest()[:8]
+        item_label = f"{item_label[:100]}_{item_hash}"
+    filename = f'{record["step"]}_{item_label}_{record["pid"]}.prof'
+    path = os.path.join(profile_folder, filename)
+    profile.dump_stats(path)
+    return path
+
+
+def write_record(path, record):
+    # Single appending write, so that lines of parallel processes do not interleave
+    line = json.dumps(record, default=str) + "\n"
+    with open(path, "a") as f:
+        f.write(line)
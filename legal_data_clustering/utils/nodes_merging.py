@@ -1,4 +1,6 @@
 import networkx as nx
+import numpy as np
+import pandas as pd
 import regex
 from quantlaw.utils.networkx import hierarchy_graph
 
@@ -167,3 +169,138 @@ def is_node_contracted(G, node, merge_threshold=0, merge_attribute="chars_n"):
         return False
     else:
         return True
+
+
+def quotient_graph_from_tables(
+    name, nodes, edges, self_loops=False, merge_threshold=0, merge_attribute="chars_n"
+):
+    """
+    Same as quotient_graph_with_merge for the graph of a nodes and an edges table,
+    but without building that graph. The contraction is computed on arrays of node
+    positions.
+    :param name: name of the graph of the tables
+    :param nodes: table with a key column and a column per node attribute. Missing
+        values are omitted from the node attributes.
+    :param edges: table with the columns u, v and edge_type, where u and v are the
+        positions of the nodes in the nodes table. The edges must be in the order
+        of the edges of the graph, see get_graph_edges_order.
+    """
+    keys = nodes.key.tolist()
+    positions = np.arange(len(keys))
+    u = edges.u.to_numpy()
+    v = edges.v.to_numpy()
+    edge_types = edges.edge_type.to_numpy()
+
+    containment = edge_types == "containment"
+    parents = np.full(len(keys), -1)
+    parents[v[containment]] = u[containment]
+    assert len(np.unique(v[containment])) == containment.sum()
+
+    is_root = parents == -1
+    is_child_of_root = ~is_root & is_root[parents]
+    if merge_threshold == -1:
+        contracted = contracted_below_chapter_book_from_tables(nodes, parents)
+    else:
+        values = nodes[merge_attribute].to_numpy(dtype=float)[parents]
+        if np.isnan(values[~is_root & ~is_child_of_root]).any():
+            raise KeyError(merge_attribute)
+        contracted = ~(values > merge_threshold)
+    contracted &= ~is_root & ~is_child_of_root
+
+    merge_parents = np.where(contracted, parents, positions)
+    while True:
+        next_merge_parents = merge_parents[merge_parents]
+        if np.array_equal(next_merge_parents, merge_parents):
+            break
+        merge_parents = next_merge_parents
+
+    nG = nx.MultiDiGraph()
+    nG.add_nodes_from(
+        (key, {attr: value for attr, value in attrs.items() if not pd.isna(value)})
+        for key, attrs, is_contracted in zip(keys, nodes.to_dict("records"), contracted)
+        if not is_contracted
+    )
+
+    # Reference edges between the merge parents, containment edges if the target
+    # is still in the quotient graph
+    is_reference = np.isin(edge_types, ["reference", "authority"])
+    sources = np.where(is_reference, merge_parents[u], u)
+    targets = np.where(is_reference, merge_parents[v], v)
+    keep = np.where(is_reference, self_loops | (sources != targets), ~contracted[v])
+    assert not contracted[u[keep & ~is_reference]].any()
+    nG.add_edges_from(
+        (keys[source], keys[target], {"edge_type": edge_type})
+        for source, target, edge_type in zip(
+            sources[keep], targets[keep], edge_types[keep]
+        )
+    )
+
+    nG.graph["name"] = "_".join(
+        [str(name), "merged_quotient_graph", merge_attribute, str(merge_threshold)]
+    )
+
+    nodes_mapping = dict(zip(keys, [keys[idx] for idx in merge_parents]))
+
+    return nG, nodes_mapping
+
+
+def get_graph_edges_order(u, v):
+    """
+    Order of edges added to a MultiDiGraph in G.edges: by the source node, then by
+    the first edge between the same nodes, then by the order the edges were added.
+    :param u: positions of the source nodes in the order of the nodes of the graph
+    :param v: positions of the target nodes
+    """
+    pairs = u.astype(np.int64) * (max(u.max(), v.max()) + 1 if len(u) else 0) + v
+    _, first_idx, pair_idx = np.unique(pairs, return_index=True, return_inverse=True)
+    return np.lexsort((np.arange(len(u)), first_idx[pair_idx.reshape(-1)], u))
+
+
+def get_depths(parents):
+    """
+    Depths of the nodes of a tree given as the position of the parent of each node
+    or -1 for roots
+    """
+    depths = (parents != -1).astype(int)
+    ancestors = parents.copy()
+    while True:
+        idx = np.flatnonzero(ancestors != -1)
+        if not len(idx):
+            return depths
+        depths[idx] = depths[idx] + depths[ancestors[idx]]
+        ancestors[idx] = ancestors[ancestors[idx]]
+
+
+def contracted_below_chapter_book_from_tables(nodes, parents):
+    """
+    contracted_below_chapter_book for all nodes of a nodes table
+    :param parents: position of the parent of each node or -1
+    """
+    positions = np.arange(len(parents))
+    matches = np.array(
+        [
+            isinstance(heading, str) and bool(chapter_buch_pattern.match(heading))
+            for heading in nodes.get("heading", [None] * len(nodes))
+        ],
+        dtype=bool,
+    )
+    depths = get_depths(parents)
+    levels = [np.flatnonzero(depths == depth) for depth in range(depths.max() + 1)]
+
+    # The first node root first that is a chapter or book
+    mapped = np.where(matches & (nodes.key != "root").to_numpy(), positions, -1)
+    for idx in levels[1:]:
+        mapped[idx] = np.where(
+            mapped[parents[idx]] != -1, mapped[parents[idx]], mapped[idx]
+        )
+
+    # Whether any descendant is a chapter or book
+    has_matching_descendant = np.zeros(len(parents), dtype=bool)
+    for idx in reversed(levels[1:]):
+        np.logical_or.at(
+            has_matching_descendant,
+            parents[idx],
+            matches[idx] | has_matching_descendant[idx],
+        )
+
+    return (mapped != positions) & ((mapped != -1) | ~has_matching_descendant[parents])
@@ -0,0 +1,116 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import networkx as nx
+import pandas as pd
+
+# Number of loads ahead of the consumer. 0 loads synchronously.
+prefetch_settings = dict(depth=1)
+
+# Futures of gpickles and csv tables loaded ahead of the items processed next in this
+# process
+prefetched_inputs = {}
+
+# Thread pool of this process. Threads do not survive a fork, so workers create
+# their own.
+thread_pools = {}
+
+
+def configure_prefetch(depth=1):
+    prefetch_settings["depth"] = depth
+
+
+def get_thread_pool():
+    pid = os.getpid()
+    if pid not in thread_pools:
+        thread_pools.clear()
+        thread_pools[pid] = ThreadPoolExecutor(
+            max_workers=max(prefetch_settings["depth"], 1),
+            thread_name_prefix="prefetch",
+        )
+    return thread_pools[pid]
+
+
+def prefetch(loaders, depth=None):
+    """
+    Iterate over the results of loaders while the next results are loaded on
+    background threads. At most depth results are loaded ahead, so that the memory
+    usage is bounded. gzip decompression and lxml parsing release the GIL and overlap
+    with the processing of the current result.
+    :param loaders: iterable of functions without arguments
+    """
+    depth = prefetch_settings["depth"] if depth is None else depth
+    if not depth:
+        for loader in loaders:
+            yield loader()
+        return
+
+    loaders = iter(loaders)
+    pool = get_thread_pool()
+    futures = deque()
+    try:
+        for loader in loaders:
+            futures.append(pool.submit(loader))
+            if len(futures) > depth:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def read_input(path):
+    if path.endswith((".csv", ".csv.gz")):
+        return pd.read_csv(path)
+    return nx.read_gpickle(path)
+
+
+def prefetch_inputs(paths):
+    """
+    Start loading gpickles and csv tables that read_gpickle or read_table will be
+    called with.
+    :return: the paths that are loaded
+    """
+    if not prefetch_settings["depth"]:
+        return []
+    started = []
+    for path in paths:
+        if path not in prefetched_inputs and os.path.exists(path):
+            prefetched_inputs[path] = get_thread_pool().submit(read_input, path)
+            started.append(path)
+    return started
+
+
+def read_gpickle(path):
+    """
+    Like nx.read_gpickle, but takes a graph prefetched with prefetch_inputs.
+    Each prefetched graph is returned once, as callers may modify it.
+    """
+    future = prefetched_inputs.pop(path, None)
+    if future is not None:
+        return future.result()
+    return nx.read_gpickle(path)
+
+
+def read_table(path, usecols=None):
+    """
+    Like pd.read_csv, but takes a table prefetched with prefetch_inputs.
+    Prefetched tables contain all columns, usecols are selected afterwards.
+    """
+    future = prefetched_inputs.pop(path, None)
+    if future is not None:
+        table = future.result()
+        return table[usecols] if usecols is not None else table
+    return pd.read_csv(path, usecols=usecols)
+
+
+def clear_prefetched_inputs(paths):
+    """
+    Drop prefetched inputs that were not read, e.g. because an item failed.
+    """
+    for path in paths:
+        future = prefetched_inputs.pop(path, None)
+        if future is not None:
+            future.cancel()
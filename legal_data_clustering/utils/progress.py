@@ -0,0 +1,239 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from legal_data_clustering.utils.instrumentation import describe_item
+
+# Settings of the current run
+progress_settings = dict(status_path=None, interval=0)
+
+# Reporters active in this process. Only the outermost process_items
+# call reports, nested calls would overwrite its status.
+active_reporters = []
+
+# Queue to announce the start of an item to the main process. Set in the workers
+# by the pool initializer.
+worker_queue = None
+
+
+def configure_progress(status_path=None, interval=0):
+    """
+    Enable the progress reporting of process_items.
+    :param status_path: json file that is replaced with the current status of the
+        step every interval seconds and when an item is finished
+    :param interval: seconds between progress lines on stdout. 0 prints nothing.
+    """
+    progress_settings["status_path"] = status_path
+    progress_settings["interval"] = interval
+    if status_path and os.path.dirname(status_path):
+        os.makedirs(os.path.dirname(status_path), exist_ok=True)
+
+
+def progress_enabled():
+    return bool(
+        (progress_settings["status_path"] or progress_settings["interval"])
+        and not active_reporters
+        and not multiprocessing.current_process().daemon
+    )
+
+
+def get_progress_reporter(step, items):
+    """
+    :return: a ProgressReporter or a context yielding None if the progress is not
+        reported
+    """
+    if not progress_enabled():
+        return contextlib.nullcontext()
+    return ProgressReporter(step, items, **progress_settings)
+
+
+def init_progress_worker(queue):
+    global worker_queue
+    worker_queue = queue
+
+
+def report_worker_start(idx):
+    """
+    Announce the start of an item in a worker of a pool
+    """
+    if worker_queue is not None:
+        worker_queue.put((os.getpid(), idx, time.time()))
+
+
+class ProgressAction:
+    """
+    Wraps an action method for Pool.imap_unordered. Tasks are tuples of the index
+    of the item, the item and the args. Returns the index with the result to
+    restore the order of the items.
+    """
+
+    def __init__(self, action_method):
+        self.action_method = action_method
+
+    def __call__(self, task):
+        idx, item, args = task
+        report_worker_start(idx)
+        return idx, self.action_method(item, *args)
+
+
+class ProgressReporter:
+    """
+    Tracks the items of a process_items call. A thread prints a progress line and
+    writes the status file every interval seconds, so that the status is up to date
+    even if no item finishes for a long time.
+    """
+
+    def __init__(self, step, items, status_path=None, interval=0):
+        self.step = step
+        self.items = items
+        self.status_path = status_path
+        self.interval = interval
+        self.queue = None
+        self.start_time = time.time()
+        self.running = {}
+        self.completed = 0
+        self.finished = set()
+        self.state = "running"
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        active_reporters.append(self)
+        update_interval = min(
+            x for x in [self.interval, 30 if self.status_path else None] if x
+        )
+        self.thread = threading.Thread(
+            target=self.run, args=(update_interval,), daemon=True
+        )
+        self.thread.start()
+        self.write_status()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+        active_reporters.remove(self)
+        with self.lock:
+            self.state = "failed" if exc_type else "done"
+        self.write_status()
+        if self.interval:
+            print(self.progress_line(), flush=True)
+
+    def run(self, update_interval):
+        last_print = time.time()
+        while not self.stopped.wait(update_interval):
+            self.write_status()
+            if self.interval and time.time() - last_print >= self.interval:
+                print(self.progress_line(), flush=True)
+                last_print = time.time()
+
+    def attach_queue(self, queue):
+        """
+        :param queue: queue workers put tuples of their pid, the index of the item
+            they start and the start time to
+        """
+        self.queue = queue
+
+    def start(self, pid, idx, start_time=None):
+        with self.lock:
+            if idx not in self.finished:
+                self.running[pid] = (idx, start_time or time.time())
+
+    def finish(self, idx):
+        self.receive_starts()
+        with self.lock:
+            self.completed += 1
+            self.finished.add(idx)
+            for pid, (running_idx, _) in list(self.running.items()):
+                if running_idx == idx:
+                    del self.running[pid]
+        if self.status_path:
+            self.write_status()
+
+    def receive_starts(self):
+        if self.queue is None:
+            return
+        while True:
+            try:
+                pid, idx, start_time = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.start(pid, idx, start_time)
+
+    def get_status(self):
+        self.receive_starts()
+        now = time.time()
+        with self.lock:
+            elapsed = now - self.start_time
+            total = len(self.items)
+            remaining = total - self.completed
+            throughput = self.completed / elapsed * 60 if elapsed else 0
+            return dict(
+                step=self.step,
+                state=self.state,
+                pid=os.getpid(),
+                started=time.strftime(
+                    "%Y-%m-%dT%H:%M:%S", time.localtime(self.start_time)
+                ),
+                updated=time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)),
+                elapsed_s=round(elapsed, 1),
+                total=total,
+                completed=self.completed,
+                remaining=remaining,
+                throughput_per_min=round(throughput, 3),
+                eta_s=(
+                    round(remaining / throughput * 60, 1)
+                    if self.completed and remaining
+                    else (0 if not remaining else None)
+                ),
+                running=[
+                    dict(
+                        pid=pid,
+                        item=describe_item(self.items[idx]),
+                        elapsed_s=round(now - start_time, 1),
+                    )
+                    for pid, (idx, start_time) in sorted(
+                        self.running.items(), key=lambda x: x[1][1]
+                    )
+                ],
+            )
+
+    def progress_line(self):
+        status = self.get_status()
+        line = (
+            f'{status["step"]}: {status["completed"]}/{status["total"]} done, '
+            f'{len(status["running"])} running, '
+            f'{status["throughput_per_min"]:.2f} items/min, '
+            f'ETA {format_duration(status["eta_s"])}'
+        )
+        if status["running"]:
+            longest = status["running"][0]
+            line += (
+                f', longest running: {longest["item"]} '
+                f'({format_duration(longest["elapsed_s"])})'
+            )
+        return line
+
+    def write_status(self):
+        if not self.status_path:
+            return
+        status = self.get_status()
+        # Replace the file atomically so that a monitor never reads a partial file
+        temp_path = f"{self.status_path}.{os.getpid()}.tmp"
+        with self.write_lock:
+            with open(temp_path, "w") as f:
+                json.dump(status, f, indent=1, default=str)
+            os.replace(temp_path, self.status_path)
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "unknown"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
@@ -0,0 +1,139 @@
+import os
+from collections import OrderedDict
+
+import networkx as nx
+import pandas as pd
+from quantlaw.utils.files import ensure_exists
+from quantlaw.utils.networkx import hierarchy_graph
+
+from legal_data_clustering.utils.atomic_files import atomic_path
+
+index_columns = ["key", "tokens_n", "document_type", "heading_path"]
+
+
+def filename_for_snapshot_index(snapshot):
+    return f"{snapshot}.index.csv.gz"
+
+
+def get_heading_paths(G_hierarchy: nx.DiGraph):
+    """
+    Heading paths of all nodes as returned by graph_api.get_heading_path,
+    computed top-down in a single pass.
+    """
+    heading_paths = {}
+    for n in nx.topological_sort(G_hierarchy):
+        if n == "root":
+            heading_paths[n] = ""
+            continue
+        heading = G_hierarchy.nodes[n].get("heading", "-")
+        predecessors = list(G_hierarchy.predecessors(n))
+        assert len(predecessors) <= 1
+        if predecessors and predecessors != ["root"]:
+            heading = heading_paths[predecessors[0]] + " / " + heading
+        heading_paths[n] = heading
+    return heading_paths
+
+
+def build_snapshot_index(G):
+    """
+    Compact table of the node attributes required to inspect clusters.
+    """
+    G_hierarchy = hierarchy_graph(G)
+    heading_paths = get_heading_paths(G_hierarchy)
+    keys = list(G_hierarchy.nodes)
+    return pd.DataFrame(
+        dict(
+            key=keys,
+            tokens_n=[G_hierarchy.nodes[n].get("tokens_n", 0) for n in keys],
+            document_type=[G_hierarchy.nodes[n].get("document_type", "") for n in keys],
+            heading_path=[heading_paths[n] for n in keys],
+        )
+    )
+
+
+def read_snapshot_index(path, columns=None):
+    columns = columns or index_columns
+    if "key" not in columns:
+        columns = ["key"] + list(columns)
+    return pd.read_csv(
+        path,
+        usecols=columns,
+        dtype=dict(key=str, document_type=str, heading_path=str),
+        keep_default_na=False,
+    ).set_index("key")
+
+
+class SnapshotIndexLoader:
+    """
+    Loads the snapshot indexes on demand and keeps the most recently used ones
+    in memory.
+    If an index does not exist yet, it is created from the seqitems graph of the
+    snapshot.
+    """
+
+    def __init__(
+        self,
+        crossreference_graph_folder,
+        index_folder,
+        memory_limit=None,
+        columns=None,
+    ):
+        """
+        :param crossreference_graph_folder: folder of the seqitems graphs
+        :param index_folder: folder to store the indexes in
+        :param memory_limit: maximal size of the cached indexes in bytes.
+            The last loaded index is kept in any case.
+        :param columns: columns to load
+        """
+        self.crossreference_graph_folder = crossreference_graph_folder
+        self.index_folder = index_folder
+        self.memory_limit = memory_limit
+        self.columns = columns
+        self.cache = OrderedDict()
+        self.cache_sizes = dict()
+
+    def __getitem__(self, snapshot):
+        if snapshot in self.cache:
+            self.cache.move_to_end(snapshot)
+            return self.cache[snapshot]
+
+        index = read_snapshot_index(self.get_index_path(snapshot), self.columns)
+        self.cache[snapshot] = index
+        self.cache_sizes[snapshot] = int(index.memory_usage(deep=True).sum())
+        self.evict()
+        return index
+
+    def get_index_path(self, snapshot):
+        path = os.path.join(self.index_folder, filename_for_snapshot_index(snapshot))
+        if not os.path.exists(path):
+            ensure_exists(self.index_folder)
+            G = nx.read_gpickle(
+                os.path.join(self.crossreference_graph_folder, f"{snapshot}.gpickle.gz")
+            )
+            with atomic_path(path) as temp_path:
+                build_snapshot_index(G).to_csv(temp_path, index=False)
+        return path
+
+    def evict(self):
+        while len(self.cache) > 1 and (
+            self.memory_limit is not None
+            and sum(self.cache_sizes.values()) > self.memory_limit
+        ):
+            snapshot, _ = self.cache.popitem(last=False)
+            del self.cache_sizes[snapshot]
+
+
+def get_snapshot_index_loader(
+    crossreference_graph_folder, index_folder, memory_limit=None
+):
+    """
+    Get a loader shared by all items processed in the current process.
+    """
+    if not getattr(get_snapshot_index_loader, "_cache", None):
+        get_snapshot_index_loader._cache = {}
+    cache_key = (crossreference_graph_folder, index_folder, memory_limit)
+    if cache_key not in get_snapshot_index_loader._cache:
+        get_snapshot_index_loader._cache[cache_key] = SnapshotIndexLoader(
+            crossreference_graph_folder, index_folder, memory_limit
+        )
+    return get_snapshot_index_loader._cache[cache_key]
@@ -0,0 +1,152 @@
+import numpy as np
+
+STRING_SEPARATOR = "\n"
+
+string_columns = {"keys", "cluster_keys", "document_type_values"}
+
+
+def encode_strings(strings):
+    """
+    Encode a list of strings as one utf-8 buffer. Strings must not contain
+    STRING_SEPARATOR.
+    """
+    return np.frombuffer(STRING_SEPARATOR.join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def decode_strings(buffer):
+    if not len(buffer):
+        return []
+    return buffer.tobytes().decode("utf-8").split(STRING_SEPARATOR)
+
+
+def encode_ragged(values):
+    """
+    Encode lists of ints (or None for missing lists) as offsets and values.
+    The values of row i are values[offsets[i] : offsets[i + 1]].
+    A missing list and an empty list are both encoded as an empty slice.
+    """
+    lengths = np.array([len(v) if v else 0 for v in values], dtype=np.int64)
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    flat = [x for v in values if v for x in v]
+    return offsets, np.array(flat, dtype=np.int64)
+
+
+def encode_categories(values):
+    """
+    Encode values with None for missing as int32 codes and their dictionary.
+    Missing values have the code -1.
+    """
+    categories = sorted({v for v in values if v is not None})
+    category_codes = {v: idx for idx, v in enumerate(categories)}
+    codes = np.array(
+        [category_codes[v] if v is not None else -1 for v in values], dtype=np.int32
+    )
+    return codes, categories
+
+
+def write_snapshot_mapping_table(
+    path,
+    keys,
+    cluster_keys,
+    contracted_to,
+    seqitem_counts,
+    tokens_n,
+    chars_n,
+    texts_tokens_n,
+    texts_chars_n,
+    document_type,
+):
+    """
+    Write the node data of a snapshot that is needed to map clusterings over time as
+    a columnar table.
+
+    :param keys: keys of all nodes of the snapshot
+    :param cluster_keys: keys of the nodes of the preprocessed graph
+    :param contracted_to: for each key the index in cluster_keys of the node the key
+        is contracted to or -1
+    :param seqitem_counts: for each cluster key the number of contracted seqitems
+    :param tokens_n: for each key the number of tokens or NaN
+    :param chars_n: for each key the number of chars or NaN
+    :param texts_tokens_n: for each key a list of tokens_n of its texts or None
+    :param texts_chars_n: for each key a list of chars_n of its texts or None
+    :param document_type: for each key the document type or None
+    """
+    texts_tokens_n_offsets, texts_tokens_n_values = encode_ragged(texts_tokens_n)
+    texts_chars_n_offsets, texts_chars_n_values = encode_ragged(texts_chars_n)
+    document_type_codes, document_type_values = encode_categories(document_type)
+    # Uncompressed to allow fast loading of single columns
+    np.savez(
+        path,
+        keys=encode_strings(keys),
+        cluster_keys=encode_strings(cluster_keys),
+        contracted_to=np.asarray(contracted_to, dtype=np.int32),
+        seqitem_counts=np.asarray(seqitem_counts, dtype=np.int32),
+        tokens_n=np.asarray(tokens_n, dtype=np.float64),
+        chars_n=np.asarray(chars_n, dtype=np.float64),
+        texts_tokens_n_offsets=texts_tokens_n_offsets,
+        texts_tokens_n_values=texts_tokens_n_values,
+        texts_chars_n_offsets=texts_chars_n_offsets,
+        texts_chars_n_values=texts_chars_n_values,
+        document_type_codes=document_type_codes,
+        document_type_values=encode_strings(document_type_values),
+    )
+
+
+def load_snapshot_mapping_table(path, columns=None):
+    """
+    Load the columns of a table written by write_snapshot_mapping_table.
+    String columns are decoded to lists, all other columns are numpy arrays.
+    :param columns: names of the columns to load. If None all columns are loaded.
+    :return: dict with column names as keys
+    """
+    with np.load(path) as table:
+        columns = columns or table.files
+        return {
+            column: (
+                decode_strings(table[column])
+                if column in string_columns
+                else table[column]
+            )
+            for column in columns
+        }
+
+
+mapping_columns = ["prev_leaf", "prev_text_idx", "leaf", "text_idx"]
+
+
+def encode_snapshot_mapping(mapping, prev_keys, keys):
+    """
+    Encode a mapping between the texts of two snapshots as integer arrays.
+    The texts are given as "{leaf}_{text_idx}" strings.
+    Leaves are encoded as their index in prev_keys or keys respectively.
+    Leaves that are not found are encoded as -1.
+    :return: dict of arrays and the list of leaves that were not found
+    """
+    prev_key_idx = {k: idx for idx, k in enumerate(prev_keys)}
+    key_idx = {k: idx for idx, k in enumerate(keys)}
+    encoded = np.empty((len(mapping), len(mapping_columns)), dtype=np.int32)
+    missing_leaves = []
+    for row, (prev_leaf_and_text_idx, leaf_and_text_idx) in enumerate(mapping.items()):
+        prev_leaf, prev_text_idx = prev_leaf_and_text_idx.rsplit("_", 1)
+        leaf, text_idx = leaf_and_text_idx.rsplit("_", 1)
+        prev_leaf_idx = prev_key_idx.get(prev_leaf, -1)
+        leaf_idx = key_idx.get(leaf, -1)
+        if prev_leaf_idx == -1:
+            missing_leaves.append(prev_leaf)
+        if leaf_idx == -1:
+            missing_leaves.append(leaf)
+        encoded[row] = prev_leaf_idx, int(prev_text_idx), leaf_idx, int(text_idx)
+    return (
+        {column: encoded[:, idx].copy() for idx, column in enumerate(mapping_columns)},
+        missing_leaves,
+    )
+
+
+def write_snapshot_mapping(path, encoded_mapping):
+    np.savez(path, **encoded_mapping)
+
+
+def load_snapshot_mapping(path):
+    with np.load(path) as table:
+        return {column: table[column] for column in mapping_columns}
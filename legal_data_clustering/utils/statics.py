@@ -19,6 +19,7 @@ US_CD_CLUSTER_INSPECTION_PATH = f"{US_DATA_PATH}/14_cluster_inspection"
 US_CD_CLUSTER_EVOLUTION_INSPECTION_PATH = (
     f"{US_DATA_PATH}/15_cluster_evolution_inspection"
 )
+US_CD_SNAPSHOT_INDEX_PATH = f"{US_TEMP_DATA_PATH}/41_snapshot_index"
 
 DE_DATA_PATH = "../legal-networks-data/de"
 DE_TEMP_DATA_PATH = "temp/de"
@@ -38,6 +39,7 @@ DE_CD_CLUSTER_INSPECTION_PATH = f"{DE_DATA_PATH}/14_cluster_inspection"
 DE_CD_CLUSTER_EVOLUTION_INSPECTION_PATH = (
     f"{DE_DATA_PATH}/15_cluster_evolution_inspection"
 )
+DE_CD_SNAPSHOT_INDEX_PATH = f"{DE_TEMP_DATA_PATH}/41_snapshot_index"
 
 DE_DECISIONS_DATA_PATH = "../legal-networks-data/de_decisions"
 DE_DECISIONS_NETWORK = f"{DE_DECISIONS_DATA_PATH}/2_network.gpickle.gz"
@@ -66,6 +68,7 @@ US_REG_CD_CLUSTER_INSPECTION_PATH = f"{US_REG_DATA_PATH}/14_cluster_inspection"
 US_REG_CD_CLUSTER_EVOLUTION_INSPECTION_PATH = (
     f"{US_REG_DATA_PATH}/15_cluster_evolution_inspection"
 )
+US_REG_CD_SNAPSHOT_INDEX_PATH = f"{US_REG_TEMP_DATA_PATH}/41_snapshot_index"
 
 DE_REG_DATA_PATH = "../legal-networks-data/de_reg"
 DE_REG_TEMP_DATA_PATH = "temp/de_reg"
@@ -87,6 +90,7 @@ DE_REG_CD_CLUSTER_INSPECTION_PATH = f"{DE_REG_DATA_PATH}/14_cluster_inspection"
 DE_REG_CD_CLUSTER_EVOLUTION_INSPECTION_PATH = (
     f"{DE_REG_DATA_PATH}/15_cluster_evolution_inspection"
 )
+DE_REG_CD_SNAPSHOT_INDEX_PATH = f"{DE_REG_TEMP_DATA_PATH}/41_snapshot_index"
 
 DE_DECISIONS_DATA_PATH = "../legal-networks-data/de_decisions"
 DE_DECISIONS_NETWORK = f"{DE_DECISIONS_DATA_PATH}/2_network.gpickle.gz"
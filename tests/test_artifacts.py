@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import networkx as nx
+
+from legal_data_clustering.utils.artifacts import (
+    graph_content_hash,
+    link_aliases,
+    link_identical_artifacts,
+    read_artifacts,
+    record_artifacts,
+    resolve_artifact,
+)
+
+
+class TestArtifacts(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, filename, text):
+        with open(os.path.join(self.folder.name, filename), "w") as f:
+            f.write(text)
+
+    def read(self, filename):
+        with open(os.path.join(self.folder.name, filename)) as f:
+            return f.read()
+
+    def test_graph_content_hash(self):
+        G = nx.MultiDiGraph(name="a")
+        G.add_edge(1, 2, weight=1.0)
+        H = nx.MultiDiGraph(name="b")
+        H.add_edge(1, 2, weight=1.0)
+        self.assertEqual(graph_content_hash(G), graph_content_hash(H))
+        H.add_edge(2, 1, weight=1.0)
+        self.assertNotEqual(graph_content_hash(G), graph_content_hash(H))
+
+    def test_link_identical_artifacts(self):
+        self.write("a.txt", "x")
+        self.write("b.txt", "x")
+        self.write("c.txt", "y")
+        record_artifacts(
+            self.folder.name,
+            [
+                dict(file="a.txt", content_hash="1"),
+                dict(file="b.txt", content_hash="1"),
+                dict(file="c.txt", content_hash="2"),
+            ],
+        )
+        link_identical_artifacts(self.folder.name)
+        link_aliases(self.folder.name, [("d.txt", "c.txt"), ("e.txt", "missing.txt")])
+
+        folder = self.folder.name
+        self.assertTrue(
+            os.path.samefile(
+                os.path.join(folder, "a.txt"), os.path.join(folder, "b.txt")
+            )
+        )
+        self.assertEqual(self.read("d.txt"), "y")
+        self.assertFalse(os.path.exists(os.path.join(folder, "e.txt")))
+
+        artifacts = read_artifacts(folder)
+        self.assertEqual(artifacts["b.txt"]["alias_of"], "a.txt")
+        self.assertNotIn("alias_of", artifacts["a.txt"])
+        self.assertEqual(resolve_artifact(artifacts, "d.txt"), "c.txt")
+        self.assertEqual(resolve_artifact(artifacts, "x.txt"), "x.txt")
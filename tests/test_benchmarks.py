@@ -0,0 +1,80 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+from benchmarks.runner import compare_results, run_command
+from benchmarks.synthetic_data import generate_dataset
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_generate_dataset(self):
+        with tempfile.TemporaryDirectory() as folder:
+            snapshots = generate_dataset(
+                folder, snapshots_n=2, laws_n=3, depth=1, fan_out=2, change_rate=0.5
+            )
+            self.assertEqual(snapshots, ["2000", "2001"])
+            nodes = pd.read_csv(
+                os.path.join(folder, "4_crossreference_graph", "2001.nodes.csv.gz")
+            )
+            self.assertEqual(nodes.key.is_unique, True)
+            documents = nodes[nodes.type == "document"]
+            seqitems = nodes[nodes.type == "seqitem"]
+            self.assertEqual(documents.tokens_n.sum(), seqitems.tokens_n.sum())
+
+            with open(
+                os.path.join(
+                    folder,
+                    "5_snapshot_mapping_edgelist",
+                    "subseqitems",
+                    "2000_2001.json",
+                )
+            ) as f:
+                mapping = json.load(f)
+            self.assertTrue(mapping)
+            for text in mapping.values():
+                self.assertIn(text.rsplit("_", 1)[0], set(seqitems.key))
+
+            self.assertEqual(len(os.listdir(os.path.join(folder, "2_xml"))), 3)
+
+    def test_compare_results(self):
+        baseline = dict(
+            results=dict(
+                small=dict(
+                    a=dict(wall_time_s=10, peak_rss_mb=100, returncode=0),
+                    b=dict(wall_time_s=0.1, peak_rss_mb=100, returncode=0),
+                )
+            )
+        )
+        results = dict(
+            results=dict(
+                small=dict(
+                    a=dict(wall_time_s=13, peak_rss_mb=110, returncode=0),
+                    b=dict(wall_time_s=0.3, peak_rss_mb=100, returncode=0),
+                )
+            )
+        )
+        regressions, rows = compare_results(results, baseline, tolerance=0.2)
+        self.assertEqual(regressions, ["small a: wall time 10 s -> 13 s"])
+        self.assertEqual(len(rows), 2)
+
+    def test_run_command(self):
+        with tempfile.TemporaryDirectory() as folder:
+            result = run_command([sys.executable, "-c", "pass"], folder)
+            self.assertEqual(result["returncode"], 0)
+            self.assertIsNone(result["error"])
+            self.assertGreater(result["peak_rss_mb"], 0)
+
+            result = run_command(
+                [sys.executable, "-c", "import sys; sys.exit('failed')"], folder
+            )
+            self.assertEqual(result["returncode"], 1)
+            self.assertIn("failed", result["error"])
+
+            result = run_command(
+                [sys.executable, "-c", "import os; os.kill(os.getpid(), 9)"], folder
+            )
+            self.assertEqual(result["returncode"], -9)
@@ -0,0 +1,183 @@
+import os
+import random
+import tempfile
+import unittest
+from collections import defaultdict
+
+import infomap as imp
+import networkx as nx
+
+from legal_data_clustering.pipeline import cdlib_custom_algorithms
+from legal_data_clustering.pipeline.cd_cluster import (
+    build_network,
+    cd_cluster,
+    cd_cluster_prepare,
+    cd_cluster_sweep,
+    compile_source_graph,
+    consensus_clustering,
+    get_sweep_items,
+)
+from legal_data_clustering.utils.clustering_tables import (
+    list_clusterings,
+    read_clustering,
+)
+
+
+class TestCluster(unittest.TestCase):
+    def setUp(self):
+        G = nx.MultiDiGraph()
+        for offset in [0, 10]:
+            nodes = [f"n{offset + idx}" for idx in range(5)]
+            G.add_edges_from(
+                [(u, v) for u in nodes for v in nodes if u != v], weight=1.0
+            )
+        G.add_edge("n0", "n10", weight=0.1)
+        for attr in ["chars_n", "chars_nowhites", "tokens_n", "tokens_unique"]:
+            nx.set_node_attributes(G, 10, attr)
+        self.G = G
+        self.g = compile_source_graph(G, "louvain")
+        self.config = dict(method="louvain", seed=0, markov_time=1.0, consensus=10)
+
+        self.G_weighted = nx.karate_club_graph()
+        rnd = random.Random(0)
+        for u, v in self.G_weighted.edges:
+            self.G_weighted[u][v]["weight"] = rnd.random()
+        self.infomap_runs = [
+            (markov_time, seed) for markov_time in [1.0, 0.5, 2.0] for seed in [1, 2, 3]
+        ]
+
+    def test_consensus_clustering(self):
+        clustering = consensus_clustering(self.g, self.config)
+        self.assertEqual(sorted(len(c) for c in clustering.communities), [5, 5])
+        self.assertNotIn("consensus_runs", clustering.method_parameters)
+
+    def test_consensus_clustering_early_stop(self):
+        clustering = consensus_clustering(
+            self.g, self.config, tolerance=0, batch_size=2
+        )
+        self.assertEqual(sorted(len(c) for c in clustering.communities), [5, 5])
+        self.assertEqual(clustering.method_parameters["consensus_runs"], 4)
+
+    def test_cd_cluster_sweep(self):
+        pp_config = dict(snapshot="2000", pp_ratio=1.0, pp_decay=1.0, pp_merge=-1)
+        items = [
+            dict(
+                **pp_config,
+                method=method,
+                seed=seed,
+                markov_time=markov_time,
+                consensus=0,
+            )
+            for method in ["louvain", "infomap"]
+            for markov_time in [1.0, 0.5]
+            for seed in [0, 1]
+        ]
+        sweep_items = get_sweep_items(items)
+        self.assertEqual([len(configs) for configs in sweep_items], [4, 4])
+        self.assertEqual(sweep_items[0], items[:4])
+
+        with tempfile.TemporaryDirectory() as folder:
+            nx.write_gpickle(self.G, f"{folder}/2000_1-0_1-0_-1.gpickle.gz")
+            os.mkdir(f"{folder}/sweep")
+            cd_cluster_sweep(sweep_items[0], folder, f"{folder}/sweep")
+            for config in sweep_items[0]:
+                cd_cluster(config, folder, folder, formats=("json",))
+
+            filenames = list_clusterings(f"{folder}/sweep", formats=("npz",))
+            self.assertEqual(len(filenames), 4)
+            self.assertEqual(list_clusterings(folder, formats=("json",)), filenames)
+            for filename in filenames:
+                sweep_communities = read_clustering(
+                    f"{folder}/sweep/{filename}"
+                ).communities
+                communities = read_clustering(f"{folder}/{filename}").communities
+                self.assertEqual(
+                    sorted(map(sorted, sweep_communities)),
+                    sorted(map(sorted, communities)),
+                )
+
+    def test_cd_cluster_prepare_existing_json(self):
+        pp_configs = dict(
+            pp_ratios=[1.0],
+            pp_decays=[1.0],
+            pp_merges=[-1],
+            pp_co_occurrences=[0],
+            pp_co_occurrence_types=[None],
+            seeds=[0, 1],
+            markov_times=[1.0],
+            numbers_of_modules=[None],
+            consensus=[0],
+            methods=["louvain"],
+        )
+        with tempfile.TemporaryDirectory() as folder:
+            nx.write_gpickle(self.G, f"{folder}/2000_1-0_1-0_-1.gpickle.gz")
+            os.mkdir(f"{folder}/clusters")
+            items, _ = cd_cluster_prepare(
+                False, ["2000"], pp_configs, folder, f"{folder}/clusters"
+            )
+            self.assertEqual(len(items), 2)
+
+            # A result of an earlier run that is only available as json is kept
+            cd_cluster(items[0], folder, f"{folder}/clusters", formats=("json",))
+            remaining_items, _ = cd_cluster_prepare(
+                False, ["2000"], pp_configs, folder, f"{folder}/clusters"
+            )
+            self.assertEqual(remaining_items, items[1:])
+
+    def test_build_network(self):
+        self.assertIsNone(build_network(self.g, "louvain"))
+
+        for method in ["infomap", "infomap-directed"]:
+            im, g1 = build_network(self.G_weighted, method)
+            self.assertEqual(g1.nodes[0]["name"], 0)
+            for markov_time, seed in self.infomap_runs:
+                im.run(f"--markov-time {markov_time} --seed {seed}")
+                expected = baseline_infomap(
+                    self.G_weighted, method, markov_time, seed
+                ).get_modules()
+                self.assertEqual(im.get_modules(), expected)
+
+    @unittest.skipUnless(
+        hasattr(imp.Infomap, "maxTreeDepth"),
+        "requires the Infomap version of requirements.txt",
+    )
+    def test_infomap_network(self):
+        for method in ["infomap", "infomap-directed"]:
+            network = build_network(self.G_weighted, method)
+            # The last run is repeated
+            for markov_time, seed in self.infomap_runs + self.infomap_runs[-1:]:
+                clustering = cdlib_custom_algorithms.infomap(
+                    self.G_weighted,
+                    seed=seed,
+                    markov_time=markov_time,
+                    directed=method == "infomap-directed",
+                    network=network,
+                )
+                modules = baseline_infomap(
+                    self.G_weighted, method, markov_time, seed
+                ).get_modules()
+                expected = defaultdict(set)
+                for node, module in modules.items():
+                    expected[module].add(node)
+                self.assertEqual(
+                    sorted(map(sorted, clustering.communities)),
+                    sorted(map(sorted, expected.values())),
+                )
+
+
+def baseline_infomap(G, method, markov_time, seed):
+    """
+    Run Infomap with an instance that is created for a single run with all
+    options, like cdlib_custom_algorithms.infomap did before networks were reused
+    """
+    g1 = nx.convert_node_labels_to_integers(nx.Graph(G), label_attribute="name")
+    options = (
+        f"--inner-parallelization --silent --markov-time {markov_time} --seed {seed}"
+    )
+    if method == "infomap-directed":
+        options += " -d"
+    im = imp.Infomap(options)
+    for u, v, data in g1.edges(data=True):
+        im.add_link(u, v, weight=data["weight"])
+    im.run()
+    return im
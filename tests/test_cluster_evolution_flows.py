@@ -0,0 +1,140 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from legal_data_clustering.pipeline.cd_cluster_evolution_flows import (
+    TransitionMatrixLoader,
+    cd_cluster_evolution_flows_prepare,
+    get_flow_pairs,
+    get_leaves_and_text_idx,
+    get_text_positions,
+)
+from legal_data_clustering.pipeline.cd_cluster_evolution_mappings import (
+    filename_for_snapshot_mapping,
+)
+from legal_data_clustering.utils.config_handling import get_configs
+from legal_data_clustering.utils.config_parsing import filename_for_pp_config
+from legal_data_clustering.utils.snapshot_tables import (
+    encode_snapshot_mapping,
+    write_snapshot_mapping,
+    write_snapshot_mapping_table,
+)
+
+
+class TestClusterEvolutionFlows(unittest.TestCase):
+    def test_get_flow_pairs(self):
+        snapshots = ["2000", "2001", "2002", "2003"]
+        self.assertEqual(
+            get_flow_pairs(snapshots),
+            [("2000", "2001"), ("2001", "2002"), ("2002", "2003")],
+        )
+        self.assertEqual(
+            get_flow_pairs(snapshots, stride=2), [("2000", "2002"), ("2001", "2003")]
+        )
+        pairs = [("2000", "2003"), ("2000", "1999"), ("2002", "2001")]
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertEqual(get_flow_pairs(snapshots, pairs=pairs), [("2000", "2003")])
+        self.assertEqual(stdout.getvalue(), "")
+
+    def test_prepare_reports_skipped_flow_pairs(self):
+        meta_config = dict(
+            pp_ratios=[1.0],
+            pp_decays=[1.0],
+            pp_merges=[-1],
+            pp_co_occurrences=[0],
+            pp_co_occurrence_types=[None],
+            seeds=[0, 1],
+            markov_times=[1.0],
+            numbers_of_modules=[None],
+            consensus=[0],
+            methods=["louvain"],
+        )
+        pairs = [("2000", "2002"), ("2000", "1999"), ("2002", "2001")]
+        with tempfile.TemporaryDirectory() as folder:
+            for config in get_configs(meta_config):
+                for snapshot in ["2000", "2001", "2002"]:
+                    filename = filename_for_pp_config(
+                        snapshot=snapshot, **config, file_ext=".json"
+                    )
+                    open(os.path.join(folder, filename), "w").close()
+            for overwrite in [True, False]:
+                stdout = io.StringIO()
+                with contextlib.redirect_stdout(stdout):
+                    configs = cd_cluster_evolution_flows_prepare(
+                        overwrite, meta_config, folder, f"{folder}/flows", pairs=pairs
+                    )
+                self.assertEqual(len(configs), 2)
+                # Skipped pairs are reported once for all configs
+                self.assertEqual(
+                    stdout.getvalue().splitlines(),
+                    [
+                        "flow_pair_skipped pair=2000-1999 missing_snapshots=1999",
+                        "flow_pair_skipped pair=2002-2001 reason=not ascending",
+                    ],
+                )
+
+    def test_text_positions(self):
+        # Keys 0 and 2 have no texts, key 1 has two and key 3 one text
+        texts_offsets = np.array([0, 0, 2, 2, 3])
+        leaf = np.array([0, 1, 1, 2, 3])
+        text_idx = np.array([0, 0, 1, 0, 0])
+        positions = get_text_positions(leaf, text_idx, texts_offsets)
+        self.assertEqual(list(positions), [3, 0, 1, 5, 2])
+
+        decoded_leaf, decoded_text_idx = get_leaves_and_text_idx(
+            positions, texts_offsets
+        )
+        self.assertEqual(list(decoded_leaf), list(leaf))
+        self.assertEqual(list(decoded_text_idx), list(text_idx))
+
+    def test_transition_matrix_loader(self):
+        keys = {"2000": ["a", "b"], "2001": ["a", "b", "c"], "2002": ["d"]}
+        mappings = {
+            ("2000", "2001"): {"a_0": "b_1", "b_0": "c_0", "b_1": "a_0"},
+            ("2001", "2002"): {"a_0": "d_0", "b_1": "d_0", "c_0": "d_1"},
+        }
+        with tempfile.TemporaryDirectory() as folder:
+            for snapshot, snapshot_keys in keys.items():
+                write_snapshot_mapping_table(
+                    os.path.join(folder, f"{snapshot}_-1.npz"),
+                    keys=snapshot_keys,
+                    cluster_keys=snapshot_keys,
+                    contracted_to=range(len(snapshot_keys)),
+                    seqitem_counts=[1] * len(snapshot_keys),
+                    tokens_n=[1] * len(snapshot_keys),
+                    chars_n=[1] * len(snapshot_keys),
+                    texts_tokens_n=[[1, 1]] * len(snapshot_keys),
+                    texts_chars_n=[[1, 1]] * len(snapshot_keys),
+                    document_type=[None] * len(snapshot_keys),
+                )
+            for (prev_snapshot, snapshot), mapping in mappings.items():
+                encoded_mapping, _ = encode_snapshot_mapping(
+                    mapping, keys[prev_snapshot], keys[snapshot]
+                )
+                write_snapshot_mapping(
+                    os.path.join(
+                        folder, filename_for_snapshot_mapping(prev_snapshot, snapshot)
+                    ),
+                    encoded_mapping,
+                )
+
+            loader = TransitionMatrixLoader(
+                list(keys), dict(pp_merge=-1), folder, folder, memory_limit=0
+            )
+            matrix = loader["2000", "2002"]
+            self.assertEqual(matrix.shape, (6, 3))
+            # a_0 -> b_1 -> d_0, b_0 -> c_0 -> d_1, b_1 -> a_0 -> d_0
+            self.assertEqual(
+                matrix.toarray().tolist(),
+                [[1, 0, 0], [0, 0, 0], [0, 1, 0], [1, 0, 0], [0, 0, 0], [0, 0, 0]],
+            )
+            # Only the last matrix is kept with a memory limit of 0
+            self.assertEqual(list(loader.cache), [("2000", "2002")])
+
+            with self.assertRaises(ValueError):
+                loader["2002", "2000"]
@@ -0,0 +1,52 @@
+import unittest
+
+import numpy as np
+
+from legal_data_clustering.pipeline.cd_cluster_evolution_graph import (
+    aggregate_community_flows,
+)
+
+
+class TestClusterEvolutionGraph(unittest.TestCase):
+    def setUp(self):
+        # Key b has two texts, keys a and c none
+        self.preprocessed_mappings = dict(
+            keys=["a", "b", "c"],
+            tokens_n=np.array([5.0, 7.0, 3.0]),
+            chars_n=np.array([50.0, 70.0, 30.0]),
+            texts_tokens_n_offsets=np.array([0, 0, 2, 2]),
+            texts_tokens_n_values=np.array([3.0, 4.0]),
+            texts_chars_n_values=np.array([30.0, 40.0]),
+        )
+        self.snapshot_mapping = dict(
+            prev_leaf=np.array([0, 1, 1]),
+            prev_text_idx=np.array([0, 0, 1]),
+            leaf=np.array([1, 1, 2]),
+            text_idx=np.array([0, 1, 0]),
+        )
+
+    def test_aggregate_community_flows(self):
+        prev_community_ids, community_ids, tokens_n, chars_n = (
+            aggregate_community_flows(
+                self.snapshot_mapping,
+                np.array([0, 1]),
+                np.array([0, 0, 1]),
+                None,
+                self.preprocessed_mappings,
+            )
+        )
+        self.assertEqual(list(prev_community_ids), [0, 1, 1])
+        self.assertEqual(list(community_ids), [0, 0, 1])
+        self.assertEqual(list(tokens_n), [3, 4, 3])
+        self.assertEqual(list(chars_n), [30, 40, 30])
+
+    def test_aggregate_community_flows_missing_sizes(self):
+        self.preprocessed_mappings["tokens_n"][2] = np.nan
+        with self.assertRaisesRegex(ValueError, "without tokens_n or chars_n: c"):
+            aggregate_community_flows(
+                self.snapshot_mapping,
+                np.array([0, 1]),
+                np.array([0, 0, 0]),
+                None,
+                self.preprocessed_mappings,
+            )
@@ -0,0 +1,37 @@
+import unittest
+
+import networkx as nx
+import pandas as pd
+
+from legal_data_clustering.pipeline.cd_cluster_evolution_inspection import (
+    get_inspection_table,
+)
+
+
+class TestClusterEvolutionInspection(unittest.TestCase):
+    def test_get_inspection_table(self):
+        G = nx.DiGraph()
+        G.add_node("2000_0", tokens_n=10, nodes_contained="a,b")
+        G.add_node("2001_0", tokens_n=20, nodes_contained="a")
+        G.add_node("2001_1", tokens_n=5, nodes_contained="c")
+        snapshot_indexes = {
+            year: pd.DataFrame(
+                dict(
+                    key=["a", "b", "c"],
+                    tokens_n=tokens_n,
+                    document_type=["statute", "", "regulation"],
+                    heading_path=["A", "B", "C"],
+                )
+            ).set_index("key")
+            for year, tokens_n in [("2000", [4, 6, 0]), ("2001", [20, 0, 5])]
+        }
+        table = get_inspection_table(
+            G, [["2001_0", "2000_0"], ["2001_1"]], snapshot_indexes
+        )
+        self.assertEqual(list(table.family), [0, 0, 0, 1])
+        self.assertEqual(list(table.cluster), ["2000_0", "2000_0", "2001_0", "2001_1"])
+        self.assertEqual(list(table.node), ["a", "b", "a", "c"])
+        self.assertEqual(list(table.leading), [False, False, True, True])
+        self.assertEqual(list(table.tokens_n_quote), [40, 60, 100, 100])
+        self.assertEqual(list(table.leading_cluster.unique()), ["2001_0", "2001_1"])
+        self.assertEqual(table.document_type.iat[3], "regulation")
@@ -0,0 +1,25 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from legal_data_clustering.pipeline.cd_cluster_inspection import get_inspection_table
+
+
+class TestClusterInspection(unittest.TestCase):
+    def test_get_inspection_table(self):
+        snapshot_index = pd.DataFrame(
+            dict(
+                key=["a", "b", "c", "d"],
+                tokens_n=[1, 3, 6, 0],
+                document_type=["statute", "statute", "", ""],
+                heading_path=["A", "B", "C", "D"],
+            )
+        ).set_index("key")
+        table = get_inspection_table([["a", "b"], ["c"], ["d"]], snapshot_index)
+        self.assertEqual(list(table.node), ["c", "b", "a", "d"])
+        self.assertEqual(list(table.community_rank), [1, 2, 2, 3])
+        self.assertEqual(list(table.community), [1, 0, 0, 2])
+        self.assertEqual(list(table.community_tokens_n_quote), [60, 40, 40, 0])
+        self.assertEqual(list(table.tokens_n_quote[:3]), [100, 75, 25])
+        self.assertTrue(np.isnan(table.tokens_n_quote[3]))
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+import networkx as nx
+from cdlib import NodeClustering
+
+from legal_data_clustering.utils.clustering_tables import (
+    decode_labels,
+    encode_labels,
+    list_clusterings,
+    read_clustering,
+    write_clustering,
+    write_node_dictionary,
+)
+
+
+class TestClusteringTables(unittest.TestCase):
+    def test_encode_labels(self):
+        labels = encode_labels([["c", "a"], [], ["b"]], ["a", "b", "c", "d"])
+        self.assertEqual(str(labels.dtype), "int32")
+        self.assertEqual(list(labels), [0, 2, 0, -1])
+        self.assertEqual(
+            decode_labels(labels, ["a", "b", "c", "d"], 3), [["a", "c"], [], ["b"]]
+        )
+
+        with self.assertRaises(ValueError):
+            encode_labels([["a", "b"], ["b"]], ["a", "b"])
+
+    def test_write_and_read_clustering(self):
+        G = nx.Graph([("a", "b"), ("c", "d")])
+        clustering = NodeClustering(
+            [["b", "a"], ["c", "d"]], G, "Louvain", method_parameters={"seed": 1}
+        )
+        with tempfile.TemporaryDirectory() as folder:
+            write_node_dictionary(f"{folder}/g.nodes.npz", list(G.nodes))
+            write_clustering(clustering, f"{folder}/x.json", "g.nodes.npz")
+            self.assertEqual(
+                sorted(os.listdir(folder)), ["g.nodes.npz", "x.labels.npz"]
+            )
+            self.assertEqual(list_clusterings(folder), ["x.json"])
+            self.assertEqual(list_clusterings(folder, formats=("json",)), [])
+
+            result = read_clustering(f"{folder}/x.json")
+            self.assertEqual(result.communities, [["a", "b"], ["c", "d"]])
+            self.assertEqual(result.method_name, "Louvain")
+            self.assertEqual(result.method_parameters, {"seed": 1})
+            self.assertEqual(result.node_coverage, 1.0)
+
+            # Outdated outputs in other formats are removed
+            write_clustering(clustering, f"{folder}/x.json", None, formats=("json",))
+            self.assertEqual(sorted(os.listdir(folder)), ["g.nodes.npz", "x.json"])
+            result = read_clustering(f"{folder}/x.json")
+            self.assertEqual(result.communities, [["b", "a"], ["c", "d"]])
@@ -1,6 +1,8 @@
 from legal_data_clustering.utils.config_handling import (
+    canonical_pp_config,
     get_configs,
     get_configs_for_snapshots,
+    get_equivalent_items,
     simplify_config_for_preprocessed_graph,
 )
 from tests.test_classes import ConfigTest
@@ -39,3 +41,18 @@ class TestConfigHandling(ConfigTest):
             self.assertTrue(config in self.all_cluster_mapping_configs)
         for config in self.all_cluster_mapping_configs:
             self.assertTrue(config in configs)
+
+    def test_get_equivalent_items(self):
+        configs = [
+            {**self.config, "pp_ratio": 0, "pp_decay": 1},
+            {**self.config, "pp_ratio": 0, "pp_decay": 2},
+            {**self.config, "pp_ratio": 1, "pp_decay": 2},
+            {**self.config, "pp_co_occurrence": 0, "pp_co_occurrence_type": "a"},
+            {**self.config, "pp_co_occurrence": 0, "pp_co_occurrence_type": "b"},
+        ]
+        self.assertEqual(canonical_pp_config(configs[0])["pp_decay"], None)
+        self.assertEqual(canonical_pp_config(configs[2])["pp_decay"], 2)
+
+        items, aliases = get_equivalent_items(configs, canonical_pp_config)
+        self.assertEqual(items, [configs[0], configs[2], configs[3]])
+        self.assertEqual(aliases, [(configs[1], configs[0]), (configs[4], configs[3])])
@@ -0,0 +1,42 @@
+import os
+import unittest
+
+import numpy  # noqa: F401 Loads a BLAS library
+from threadpoolctl import threadpool_info
+
+from legal_data_clustering.utils.cpu_budget import (
+    configure_cpu_budget,
+    get_cpu_budget,
+    get_thread_limit,
+    limit_threads,
+    split_cpu_budget,
+)
+
+
+class TestCpuBudget(unittest.TestCase):
+    def tearDown(self):
+        configure_cpu_budget()
+
+    def test_split_cpu_budget(self):
+        configure_cpu_budget(8)
+        self.assertEqual(split_cpu_budget(1), (1, 8))
+        self.assertEqual(split_cpu_budget(20), (8, 1))
+        self.assertEqual(split_cpu_budget(3), (3, 2))
+        self.assertEqual(split_cpu_budget(20, processes=2), (2, 4))
+        self.assertEqual(split_cpu_budget(0), (1, 8))
+
+    def test_limit_threads(self):
+        configure_cpu_budget(8)
+        previous_env = os.environ.get("OMP_NUM_THREADS")
+        with limit_threads(2):
+            self.assertEqual(get_thread_limit(), 2)
+            self.assertEqual(os.environ["OMP_NUM_THREADS"], "2")
+            # Libraries loaded before the block are limited as well
+            for library in threadpool_info():
+                self.assertLessEqual(library["num_threads"], 2)
+            # Nested steps share the threads of the item
+            self.assertEqual(get_cpu_budget(), 2)
+            self.assertEqual(split_cpu_budget(4), (2, 1))
+        self.assertEqual(get_thread_limit(), None)
+        self.assertEqual(os.environ.get("OMP_NUM_THREADS"), previous_env)
+        self.assertEqual(get_cpu_budget(), 8)
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import unittest
+
+from legal_data_clustering.utils.atomic_files import atomic_path
+from legal_data_clustering.utils.config_handling import process_items
+from legal_data_clustering.utils.execution import (
+    ItemsFailedError,
+    configure_execution,
+)
+
+attempts = []
+
+
+def failing_step(item):
+    attempts.append(item)
+    if item == "fail":
+        raise KeyError(item)
+    if item == "transient" and attempts.count(item) < 2:
+        raise ConnectionError(item)
+    return item
+
+
+class TestExecution(unittest.TestCase):
+    def setUp(self):
+        attempts.clear()
+        self.folder = tempfile.TemporaryDirectory()
+        self.failures_path = os.path.join(self.folder.name, "failures.jsonl")
+        self.checkpoint_path = os.path.join(self.folder.name, "checkpoints.jsonl")
+
+    def tearDown(self):
+        configure_execution()
+        self.folder.cleanup()
+
+    def read_lines(self, path):
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_failures_are_isolated(self):
+        configure_execution(
+            self.failures_path, self.checkpoint_path, retries=1, retry_delay=0
+        )
+        with self.assertRaises(ItemsFailedError):
+            process_items(["a", "fail", "transient"], [], failing_step, False)
+        self.assertEqual(attempts, ["a", "fail", "transient", "transient"])
+
+        (failure,) = self.read_lines(self.failures_path)
+        self.assertEqual(failure["step"], "failing_step")
+        self.assertEqual(failure["item"], "fail")
+        self.assertEqual(failure["error"], "KeyError: 'fail'")
+        self.assertEqual(failure["attempts"], 1)
+        self.assertEqual(
+            [r["item"] for r in self.read_lines(self.checkpoint_path)],
+            ["a", "transient"],
+        )
+
+    def test_resume(self):
+        configure_execution(self.failures_path, self.checkpoint_path)
+        self.assertEqual(process_items(["a", "b"], [], failing_step, False), ["a", "b"])
+
+        configure_execution(self.failures_path, self.checkpoint_path, resume=True)
+        self.assertEqual(process_items(["a", "b", "c"], [], failing_step, False), ["c"])
+        self.assertEqual(attempts, ["a", "b", "c"])
+
+        configure_execution(self.failures_path, self.checkpoint_path)
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_not_configured(self):
+        with self.assertRaises(KeyError):
+            process_items(["fail"], [], failing_step, False)
+
+    def test_atomic_path(self):
+        path = os.path.join(self.folder.name, "out.json")
+        with atomic_path(path) as temp_path:
+            self.assertNotEqual(temp_path, path)
+            self.assertTrue(temp_path.endswith("out.json"))
+            with open(temp_path, "w") as f:
+                f.write("{}")
+            self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(path))
+
+        with self.assertRaises(ValueError):
+            with atomic_path(os.path.join(self.folder.name, "x.json")) as temp_path:
+                with open(temp_path, "w") as f:
+                    f.write("{")
+                raise ValueError()
+        self.assertEqual(sorted(os.listdir(self.folder.name)), ["out.json"])
@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from legal_data_clustering.utils.config_handling import process_items
+from legal_data_clustering.utils.executors import (
+    RemoteTaskError,
+    claim_file_task,
+    configure_executor,
+    run_file_queue_worker,
+)
+
+
+def square(item, offset):
+    if item < 0:
+        raise ValueError(item)
+    return item * item + offset
+
+
+class TestExecutors(unittest.TestCase):
+    def tearDown(self):
+        configure_executor()
+
+    def test_file_queue(self):
+        with tempfile.TemporaryDirectory() as folder:
+            configure_executor("file-queue", folder, poll_interval=0.01)
+            results = process_items(
+                list(range(5)), [], square, True, args=(1,), processes=2
+            )
+            self.assertEqual(results, [1, 2, 5, 10, 17])
+            # The job folder is removed
+            self.assertEqual(os.listdir(folder), [])
+
+    def test_file_queue_worker(self):
+        with tempfile.TemporaryDirectory() as folder:
+            # A worker started independently of the step, e.g. on another machine
+            worker = multiprocessing.Process(
+                target=run_file_queue_worker,
+                args=(folder,),
+                kwargs=dict(idle_timeout=2, poll_interval=0.01),
+            )
+            worker.start()
+            configure_executor(
+                "file-queue", folder, local_workers=0, poll_interval=0.01
+            )
+            results = process_items([2, 3], [], square, True, args=(0,))
+            self.assertEqual(results, [4, 9])
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+    def test_file_queue_error(self):
+        with tempfile.TemporaryDirectory() as folder:
+            configure_executor("file-queue", folder, poll_interval=0.01)
+            with self.assertRaises(RemoteTaskError) as context:
+                process_items([1, -1], [], square, True, args=(0,), processes=2)
+            self.assertIn("ValueError: -1", str(context.exception))
+
+    def test_claim_file_task(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for subfolder in ["tasks", "claimed"]:
+                os.makedirs(os.path.join(folder, "job", subfolder))
+            with open(os.path.join(folder, "job", "tasks", "00000000.pkl"), "w"):
+                pass
+            job_folder, claimed_path, task_filename = claim_file_task(
+                folder, None, "worker"
+            )
+            self.assertEqual(task_filename, "00000000.pkl")
+            self.assertTrue(claimed_path.endswith("claimed/00000000.pkl.worker"))
+            self.assertIsNone(claim_file_task(folder, None, "other-worker"))
+
+    def test_task_queue(self):
+        configure_executor("task-queue", broker_url="local", poll_interval=0.01)
+        results = process_items(
+            list(range(5)), [], square, True, args=(0,), processes=2
+        )
+        self.assertEqual(results, [0, 1, 4, 9, 16])
@@ -5,8 +5,11 @@ import networkx as nx
 from cdlib import NodeClustering
 
 from legal_data_clustering.utils.graph_api import (
+    FamilyTree,
     add_communities_to_graph,
     add_community_to_graph,
+    cluster_families,
+    cluster_families_from_edges,
     filter_edges_for_cluster_families,
     get_heading_path,
     get_leaves_with_communities,
@@ -53,6 +56,81 @@ class TestGraphAPI(unittest.TestCase):
         self.assertTrue((1, 2) in edges)
         self.assertTrue(("root", 1) in edges)
 
+    def test_cluster_families(self):
+        G = nx.relabel_nodes(self.G_hierarchy, str)
+        families = cluster_families(G, 0.1, "attr")
+        self.assertEqual(families, [["3"], ["2", "1", "root"]])
+
+    def test_cluster_families_from_edges(self):
+        families = cluster_families_from_edges(
+            {"a": 10, "b": 10, "c": 1, "d": 5},
+            [("a", "b", 5), ("b", "c", 1), ("c", "d", 0)],
+            threshold=0.5,
+        )
+        self.assertEqual(families, [["b", "a"], ["d"], ["c"]])
+
+        # Appending c and d to the families of a and b
+        families = cluster_families_from_edges(
+            {"a": 10, "b": 10, "c": 1, "d": 5},
+            [("b", "c", 1), ("c", "d", 0)],
+            threshold=0.5,
+            previous_families=[["b", "a"]],
+        )
+        self.assertEqual(families, [["b", "a"], ["d"], ["c"]])
+
+    def test_family_tree(self):
+        G = nx.relabel_nodes(self.G_hierarchy, str)
+        family_tree = FamilyTree.from_edges(
+            dict(G.nodes(data="attr")), G.edges(data="attr")
+        )
+        for threshold in [0, 0.01, 0.1, 0.5, 1, 2]:
+            self.assertEqual(
+                family_tree.get_families(threshold),
+                cluster_families(G, threshold, "attr"),
+            )
+        self.assertEqual(
+            FamilyTree.from_dict(family_tree.to_dict()).edges, family_tree.edges
+        )
+
+        family_table = family_tree.get_family_table([0.01, 0.1])
+        self.assertEqual(
+            family_table[family_table.threshold == 0.1].family.tolist(), [0, 1, 1, 1]
+        )
+
+        # Appending c and d to the tree of a and b
+        node_attrs = {"a": 10, "b": 10, "c": 1, "d": 5}
+        family_tree = FamilyTree.from_edges(
+            node_attrs,
+            [("b", "c", 1), ("c", "d", 0)],
+            FamilyTree.from_edges(node_attrs, [("a", "b", 5)]),
+        )
+        self.assertEqual(family_tree.get_families(0.5), [["b", "a"], ["d"], ["c"]])
+        self.assertEqual(family_tree.get_families(0.1), [["b", "a", "c"], ["d"]])
+
+    def test_family_tree_boundaries(self):
+        # 55 / 100 is 0.55, but 55 < 100 * 0.55 with floats
+        G = nx.DiGraph()
+        G.add_nodes_from([("x", dict(a=100)), ("v", dict(a=100))])
+        G.add_nodes_from([("w", dict(a=20)), ("u", dict(a=20)), ("z", dict(a=0))])
+        G.add_weighted_edges_from(
+            [("x", "w", 100), ("v", "u", 100), ("x", "v", 55), ("w", "u", 11)],
+            weight="a",
+        )
+        G.add_edge("z", "u", a=0)
+        family_tree = FamilyTree.from_edges(dict(G.nodes(data="a")), G.edges(data="a"))
+        # x-v joins the families first and is not a family edge at 0.55. The tied
+        # edge w-u is one.
+        for threshold in [0.5, 0.55, 0.6, 1, 5]:
+            self.assertEqual(
+                family_tree.get_families(threshold),
+                cluster_families(G, threshold, "a"),
+            )
+            H = filter_edges_for_cluster_families(G, threshold, "a")
+            self.assertEqual(
+                sorted(map(sorted, family_tree.get_families(threshold))),
+                sorted(map(sorted, nx.weakly_connected_components(H))),
+            )
+
     def test_get_heading_path(self):
         self.assertEqual(get_heading_path(self.G_hierarchy, "root"), "")
         self.assertEqual(get_heading_path(self.G_hierarchy, 2), "Hello / World")
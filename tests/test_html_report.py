@@ -0,0 +1,59 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from legal_data_clustering.utils.html_report import (
+    filename_for_report_page,
+    write_report,
+)
+
+
+class TestHtmlReport(unittest.TestCase):
+    def setUp(self):
+        self.sections = [[f"<p>{idx}", "</p>"] for idx in range(5)]
+
+    def test_write_report(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filenames = write_report(
+                folder,
+                "report",
+                iter(self.sections),
+                len(self.sections),
+                toc=lambda href: [f'<a href="{href(4)}#x">toc</a>'],
+            )
+            self.assertEqual(filenames, ["report.htm"])
+            with open(os.path.join(folder, "report.htm")) as f:
+                content = f.read()
+            self.assertIn('<a href="#x">toc</a>', content)
+            self.assertIn("<p>0</p><p>1</p>", content)
+            self.assertTrue(content.endswith("</body></html>"))
+
+    def test_write_report_paginated(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filenames = write_report(
+                folder,
+                "report",
+                (s for s in self.sections),
+                len(self.sections),
+                page_size=2,
+                compress=True,
+                toc=lambda href: [f'<a href="{href(4)}#x">toc</a>'],
+            )
+            self.assertEqual(
+                filenames,
+                [
+                    filename_for_report_page("report", page, compress=True)
+                    for page in range(3)
+                ],
+            )
+            self.assertEqual(filenames[1], "report.2.htm.gz")
+            pages = []
+            for filename in filenames:
+                with gzip.open(os.path.join(folder, filename), "rt") as f:
+                    pages.append(f.read())
+            self.assertIn('<a href="report.3.htm.gz#x">toc</a>', pages[0])
+            self.assertNotIn("toc", pages[1])
+            self.assertIn("<p>2</p><p>3</p>", pages[1])
+            self.assertNotIn("<p>4</p>", pages[1])
+            self.assertIn("<p>4</p>", pages[2])
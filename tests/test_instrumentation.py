@@ -0,0 +1,77 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from legal_data_clustering.utils.config_handling import process_items
+from legal_data_clustering.utils.instrumentation import (
+    configure_instrumentation,
+    log_event,
+    phase,
+)
+
+
+def instrumented_step(item, factor):
+    with phase("compute"):
+        result = item * factor
+    log_event("computed", result=result)
+    return result
+
+
+def failing_step(item):
+    raise ValueError(f"item {item}")
+
+
+class TestInstrumentation(unittest.TestCase):
+    def tearDown(self):
+        configure_instrumentation()
+
+    def read_run_log(self, path):
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_run_log(self):
+        with tempfile.TemporaryDirectory() as folder:
+            run_log_path = os.path.join(folder, "logs", "run_log.jsonl")
+            configure_instrumentation(run_log_path)
+            results = process_items(
+                [1, 2], [], instrumented_step, use_multiprocessing=False, args=(3,)
+            )
+            self.assertEqual(results, [3, 6])
+
+            records = self.read_run_log(run_log_path)
+            self.assertEqual([r["item"] for r in records], ["1", "2"])
+            record = records[1]
+            self.assertEqual(record["step"], "instrumented_step")
+            self.assertEqual(record["status"], "ok")
+            self.assertEqual(list(record["phases"]), ["compute"])
+            self.assertEqual(record["events"], [dict(event="computed", result=6)])
+            for key in ["wall_time_s", "cpu_time_s", "peak_rss_mb"]:
+                self.assertGreaterEqual(record[key], 0)
+
+    def test_run_log_error(self):
+        with tempfile.TemporaryDirectory() as folder:
+            run_log_path = os.path.join(folder, "run_log.jsonl")
+            configure_instrumentation(run_log_path)
+            with self.assertRaises(ValueError):
+                process_items([1], [], failing_step, use_multiprocessing=False)
+            (record,) = self.read_run_log(run_log_path)
+            self.assertEqual(record["status"], "error")
+            self.assertEqual(record["error"], "ValueError: item 1")
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as folder:
+            configure_instrumentation(profile_folder=folder)
+            process_items([1], [], instrumented_step, False, args=(2,))
+            (filename,) = os.listdir(folder)
+            self.assertTrue(filename.startswith("instrumented_step_1_"))
+            self.assertTrue(filename.endswith(".prof"))
+
+    def test_disabled(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            results = process_items([1], [], instrumented_step, False, args=(2,))
+        self.assertEqual(results, [2])
+        self.assertEqual(stdout.getvalue(), "computed result=2\n")
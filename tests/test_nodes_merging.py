@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+from quantlaw.utils.networkx import load_graph_from_csv_files
+
+from legal_data_clustering.pipeline.cd_preprocessing import load_crossreference_tables
+from legal_data_clustering.utils.nodes_merging import (
+    quotient_graph_from_tables,
+    quotient_graph_with_merge,
+)
+
+
+class TestNodesMerging(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        nodes = [
+            dict(key="root", type="root", level=-1),
+            dict(key="a", type="document", level=0, heading="Gesetz A", chars_n=300),
+            dict(key="a_1", type="item", level=1, heading="Buch 1", chars_n=200),
+            dict(key="a_2", type="seqitem", level=2, heading="§ 1", chars_n=150),
+            dict(key="a_3", type="subseqitem", level=3, chars_n=50),
+            dict(key="a_4", type="seqitem", level=2, heading="§ 2", chars_n=50),
+            dict(key="a_5", type="item", level=1, heading="Teil 2", chars_n=100),
+            dict(key="a_6", type="seqitem", level=2, heading="§ 3", chars_n=100),
+            dict(key="b", type="document", level=0, heading="Gesetz B", chars_n=40),
+            dict(key="b_1", type="seqitem", level=1, heading="§ 1", chars_n=40),
+        ]
+        edges = [
+            ("root", "a", "containment"),
+            ("a_6", "a_2", "authority"),
+            ("a", "a_1", "containment"),
+            ("a_1", "a_2", "containment"),
+            ("a_2", "a_3", "containment"),
+            ("a_1", "a_4", "containment"),
+            ("a", "a_5", "containment"),
+            ("a_5", "a_6", "containment"),
+            ("root", "b", "containment"),
+            ("b", "b_1", "containment"),
+            ("a_3", "b_1", "reference"),
+            ("a_6", "a_4", "reference"),
+            ("a_6", "a_2", "reference"),
+            ("a_2", "a_4", "reference"),
+            ("b_1", "a_6", "reference"),
+            ("a_6", "a_4", "reference"),
+        ]
+        pd.DataFrame(nodes).to_csv(
+            os.path.join(self.folder.name, "s.nodes.csv.gz"), index=False
+        )
+        pd.DataFrame(edges, columns=["u", "v", "edge_type"]).to_csv(
+            os.path.join(self.folder.name, "s.edges.csv.gz"), index=False
+        )
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_quotient_graph_from_tables(self):
+        for merge_threshold in [-1, 0, 100, 1000]:
+            G = load_graph_from_csv_files(self.folder.name, "s")
+            G.remove_edges_from(
+                [
+                    (u, v, k)
+                    for u, v, k, d in G.edges(keys=True, data="edge_type")
+                    if d == "authority"
+                ]
+            )
+            expected, expected_mapping = quotient_graph_with_merge(
+                G, merge_threshold=merge_threshold
+            )
+
+            nodes, edges = load_crossreference_tables(
+                os.path.join(self.folder.name, "s.nodes.csv.gz"),
+                os.path.join(self.folder.name, "s.edges.csv.gz"),
+            )
+            nG, nodes_mapping = quotient_graph_from_tables(
+                "s", nodes, edges, merge_threshold=merge_threshold
+            )
+
+            self.assertEqual(list(nG.nodes(data=True)), list(expected.nodes(data=True)))
+            self.assertEqual(
+                list(nG.edges(keys=True, data=True)),
+                list(expected.edges(keys=True, data=True)),
+            )
+            self.assertEqual(nG.graph, expected.graph)
+            self.assertEqual(nodes_mapping, expected_mapping)
+
+        self.assertEqual(nodes_mapping["a_4"], "a")
+        self.assertNotIn("a_3", nodes_mapping)
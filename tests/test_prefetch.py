@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import networkx as nx
+
+from legal_data_clustering.utils.config_handling import process_items
+from legal_data_clustering.utils.execution import configure_execution
+from legal_data_clustering.utils.prefetch import (
+    configure_prefetch,
+    prefetch,
+    prefetched_inputs,
+    read_gpickle,
+)
+
+
+def graph_size(path, folder):
+    return read_gpickle(os.path.join(folder, path)).number_of_nodes()
+
+
+def graph_size_prefetched(path, folder):
+    path = os.path.join(folder, path)
+    return path in prefetched_inputs, read_gpickle(path).number_of_nodes()
+
+
+def graph_input_paths(path, folder):
+    return [os.path.join(folder, path)]
+
+
+def wait_for_checkpoint(item, checkpoint_path):
+    # Whether the checkpoint of quick is written while wait is processed
+    if item != "wait":
+        return False
+    for _ in range(100):
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                if any(json.loads(line)["item"] == "quick" for line in f):
+                    return True
+        time.sleep(0.05)
+    return False
+
+
+def no_input_paths(item, checkpoint_path):
+    return []
+
+
+class TestPrefetch(unittest.TestCase):
+    def tearDown(self):
+        configure_prefetch()
+        configure_execution()
+
+    def test_prefetch(self):
+        loading = []
+        lock = threading.Lock()
+
+        def load(idx):
+            with lock:
+                loading.append(idx)
+            time.sleep(0.01)
+            return idx
+
+        results = []
+        for result in prefetch((lambda idx=idx: load(idx) for idx in range(5)), 2):
+            # Not more than depth results are loaded ahead
+            self.assertLessEqual(len(loading), result + 3)
+            results.append(result)
+        self.assertEqual(results, list(range(5)))
+
+    def test_prefetch_synchronous(self):
+        self.assertEqual(list(prefetch((lambda: 1, lambda: 2), depth=0)), [1, 2])
+
+    def test_process_items_prefetch(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for n in range(1, 4):
+                nx.write_gpickle(nx.path_graph(n), os.path.join(folder, f"{n}.gpickle"))
+            items = [f"{n}.gpickle" for n in range(1, 4)]
+            results = process_items(
+                items,
+                [],
+                graph_size,
+                use_multiprocessing=False,
+                args=(folder,),
+                input_paths=graph_input_paths,
+            )
+            self.assertEqual(results, [1, 2, 3])
+            self.assertEqual(prefetched_inputs, {})
+
+    def test_process_items_prefetch_pool(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for n in range(1, 5):
+                nx.write_gpickle(nx.path_graph(n), os.path.join(folder, f"{n}.gpickle"))
+            items = [f"{n}.gpickle" for n in range(1, 5)]
+            results = process_items(
+                items,
+                [],
+                graph_size_prefetched,
+                use_multiprocessing=True,
+                args=(folder,),
+                processes=2,
+                input_paths=graph_input_paths,
+            )
+            # Each worker prefetches the items sent to it
+            self.assertEqual(results, [(True, 1), (True, 2), (True, 3), (True, 4)])
+
+    def test_process_items_prefetch_pool_checkpoints(self):
+        with tempfile.TemporaryDirectory() as folder:
+            checkpoint_path = os.path.join(folder, "checkpoints.jsonl")
+            configure_execution(checkpoint_path=checkpoint_path)
+            results = process_items(
+                ["quick", "wait", "a", "b"],
+                [],
+                wait_for_checkpoint,
+                use_multiprocessing=True,
+                args=(checkpoint_path,),
+                processes=1,
+                input_paths=no_input_paths,
+            )
+            self.assertEqual(results, [False, True, False, False])
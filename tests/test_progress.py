@@ -0,0 +1,68 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from legal_data_clustering.utils.config_handling import process_items
+from legal_data_clustering.utils.progress import (
+    ProgressReporter,
+    configure_progress,
+    format_duration,
+)
+
+
+def slow_step(item):
+    # Later items finish first
+    time.sleep(0.05 * (3 - item))
+    return item * 2
+
+
+class TestProgress(unittest.TestCase):
+    def tearDown(self):
+        configure_progress()
+
+    def test_process_items_order(self):
+        results = process_items(
+            [0, 1, 2], [], slow_step, use_multiprocessing=True, processes=3
+        )
+        self.assertEqual(results, [0, 2, 4])
+
+    def test_status_file(self):
+        with tempfile.TemporaryDirectory() as folder:
+            status_path = os.path.join(folder, "status.json")
+            configure_progress(status_path, interval=1)
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                results = process_items(
+                    [0, 1, 2], [], slow_step, use_multiprocessing=True, processes=3
+                )
+            self.assertEqual(results, [0, 2, 4])
+            with open(status_path) as f:
+                status = json.load(f)
+            self.assertEqual(status["step"], "slow_step")
+            self.assertEqual(status["state"], "done")
+            self.assertEqual(status["completed"], 3)
+            self.assertEqual(status["remaining"], 0)
+            self.assertEqual(status["running"], [])
+            self.assertIn("slow_step: 3/3 done", stdout.getvalue())
+            self.assertEqual(os.listdir(folder), ["status.json"])
+
+    def test_reporter(self):
+        reporter = ProgressReporter("step", ["a", "b", "c"])
+        reporter.start_time -= 60
+        reporter.start(1, 0, start_time=time.time() - 10)
+        reporter.start(2, 1)
+        reporter.finish(1)
+        status = reporter.get_status()
+        self.assertEqual(status["completed"], 1)
+        self.assertEqual(status["remaining"], 2)
+        self.assertEqual([r["item"] for r in status["running"]], ["'a'"])
+        self.assertAlmostEqual(status["eta_s"], 120, delta=1)
+        self.assertIn("longest running: 'a' (0:00:10)", reporter.progress_line())
+
+    def test_format_duration(self):
+        self.assertEqual(format_duration(3723.5), "1:02:03")
+        self.assertEqual(format_duration(None), "unknown")
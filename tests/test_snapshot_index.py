@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+import networkx as nx
+
+from legal_data_clustering.utils.graph_api import get_heading_path
+from legal_data_clustering.utils.snapshot_index import (
+    SnapshotIndexLoader,
+    build_snapshot_index,
+    filename_for_snapshot_index,
+    get_heading_paths,
+)
+
+
+class TestSnapshotIndex(unittest.TestCase):
+    def setUp(self):
+        self.G = nx.DiGraph(name="G")
+        self.G.add_node("root", level=-1)
+        self.G.add_node("a", heading="Act", document_type="statute", tokens_n=5)
+        self.G.add_node("a_1", heading="Part", tokens_n=3)
+        self.G.add_node("a_1_1", tokens_n=2)
+        self.G.add_node("b", heading="Other Act", document_type="regulation")
+        self.G.add_edges_from(
+            [("root", "a"), ("a", "a_1"), ("a_1", "a_1_1"), ("root", "b")],
+            edge_type="containment",
+        )
+
+    def test_get_heading_paths(self):
+        heading_paths = get_heading_paths(self.G)
+        for n in self.G.nodes:
+            self.assertEqual(heading_paths[n], get_heading_path(self.G, n))
+
+    def test_build_snapshot_index(self):
+        index = build_snapshot_index(self.G).set_index("key")
+        self.assertEqual(index.loc["a_1_1", "heading_path"], "Act / Part / -")
+        self.assertEqual(index.loc["a", "document_type"], "statute")
+        self.assertEqual(index.loc["b", "tokens_n"], 0)
+
+    def test_snapshot_index_loader(self):
+        with tempfile.TemporaryDirectory() as folder:
+            graph_folder = os.path.join(folder, "seqitems")
+            index_folder = os.path.join(folder, "index")
+            os.makedirs(graph_folder)
+            for snapshot in ["2000", "2001", "2002"]:
+                nx.write_gpickle(
+                    self.G, os.path.join(graph_folder, f"{snapshot}.gpickle.gz")
+                )
+
+            loader = SnapshotIndexLoader(graph_folder, index_folder, memory_limit=1)
+            index = loader["2000"]
+            self.assertEqual(index.loc["a_1", "heading_path"], "Act / Part")
+            self.assertTrue(
+                os.path.exists(
+                    os.path.join(index_folder, filename_for_snapshot_index("2000"))
+                )
+            )
+            loader["2001"]
+            self.assertEqual(list(loader.cache), ["2001"])
+
+            loader = SnapshotIndexLoader(graph_folder, index_folder)
+            for snapshot in ["2000", "2001", "2002", "2000"]:
+                loader[snapshot]
+            self.assertEqual(list(loader.cache), ["2001", "2002", "2000"])
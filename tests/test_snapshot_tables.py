@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from legal_data_clustering.utils.snapshot_tables import (
+    decode_strings,
+    encode_categories,
+    encode_ragged,
+    encode_snapshot_mapping,
+    encode_strings,
+    load_snapshot_mapping_table,
+    write_snapshot_mapping_table,
+)
+
+
+class TestSnapshotTables(unittest.TestCase):
+    def test_encode_strings(self):
+        strings = ["a_1", "b_2", "Ü_3"]
+        self.assertEqual(decode_strings(encode_strings(strings)), strings)
+        self.assertEqual(decode_strings(encode_strings([])), [])
+
+    def test_encode_ragged(self):
+        offsets, values = encode_ragged([[1, 2], None, [3]])
+        self.assertEqual(list(offsets), [0, 2, 2, 3])
+        self.assertEqual(list(values), [1, 2, 3])
+
+    def test_encode_categories(self):
+        codes, categories = encode_categories(["b", None, "a", "b"])
+        self.assertEqual(categories, ["a", "b"])
+        self.assertEqual(list(codes), [1, -1, 0, 1])
+
+    def test_write_and_load_snapshot_mapping_table(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "x_-1.npz")
+            write_snapshot_mapping_table(
+                path,
+                keys=["a", "a_1", "a_2"],
+                cluster_keys=["a_1"],
+                contracted_to=[-1, 0, 0],
+                seqitem_counts=[2],
+                tokens_n=[np.nan, 3, 4],
+                chars_n=[np.nan, 30, 40],
+                texts_tokens_n=[None, None, [1, 3]],
+                texts_chars_n=[None, None, [10, 30]],
+                document_type=["statute", None, None],
+            )
+            table = load_snapshot_mapping_table(path, columns=["keys", "tokens_n"])
+            self.assertEqual(set(table.keys()), {"keys", "tokens_n"})
+            self.assertEqual(table["keys"], ["a", "a_1", "a_2"])
+            self.assertTrue(np.isnan(table["tokens_n"][0]))
+
+            table = load_snapshot_mapping_table(path)
+            self.assertEqual(table["cluster_keys"], ["a_1"])
+            self.assertEqual(list(table["texts_chars_n_offsets"]), [0, 0, 0, 2])
+            self.assertEqual(list(table["texts_chars_n_values"]), [10, 30])
+            self.assertEqual(table["document_type_values"], ["statute"])
+
+    def test_encode_snapshot_mapping(self):
+        encoded, missing_leaves = encode_snapshot_mapping(
+            {"a_1_0": "b_1_2", "a_2_0": "c_0"},
+            prev_keys=["a_1", "a_2"],
+            keys=["b_1"],
+        )
+        self.assertEqual(list(encoded["prev_leaf"]), [0, 1])
+        self.assertEqual(list(encoded["prev_text_idx"]), [0, 0])
+        self.assertEqual(list(encoded["leaf"]), [0, -1])
+        self.assertEqual(list(encoded["text_idx"]), [2, 0])
+        self.assertEqual(missing_leaves, ["c"])